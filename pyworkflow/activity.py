@@ -1,24 +1,32 @@
-class ActivityExecution(object):
+from util import fingerprint, Value
+
+class ActivityExecution(Value):
+    __slots__ = ('activity', 'id', 'input')
+
     def __init__(self, activity, id, input=None):
         self.activity = activity
         self.id = id
         self.input = input
 
-    def __eq__(self, other):
-        return self.__dict__ == other.__dict__
-
-    def __ne__(self, other):
-        return not self.__eq__(other)
-
     def __repr__(self):
         return 'ActivityExecution(%s, %s, %s)' % (self.activity, self.id, self.input)
 
 class ActivityResult(object):
+    # keeps a __dict__, as interrupted results are exceptions as well
     def __init__(self, result_type):
         self.type = result_type
-        
+
+    def __fingerprint__(self):
+        return self.__dict__
+
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return type(self) is type(other) and self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(fingerprint(self))
 
     def __str__(self):
         return repr(self)
@@ -0,0 +1,13 @@
+# trollius and futures are optional (pip install pyworkflow[aio]); without them
+# the package is empty, and importing its modules raises ImportError
+try:
+    import trollius
+    import concurrent.futures
+except ImportError:
+    trollius = None
+
+if trollius:
+    from backend import AsyncBackend, ExecutorBackend
+    from memory import AsyncMemoryBackend
+    from manager import AsyncManager
+    from worker import AsyncActivityWorker, AsyncDecisionWorker
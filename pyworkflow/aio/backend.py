@@ -0,0 +1,184 @@
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+import trollius as asyncio
+from trollius import From, Return
+
+from ..defaults import Defaults
+
+class AsyncBackend(object):
+    '''
+    A backend for use on an event loop: its calls are coroutines. Registering
+    workflows and activities stays synchronous, as it's done once at start up.
+    '''
+
+    def register_workflow(self, name, version="1.0", timeout=Defaults.WORKFLOW_TIMEOUT, decision_timeout=Defaults.DECISION_TIMEOUT):
+        raise NotImplementedError()
+
+    def register_activity(self, name, version="1.0", category="default", scheduled_timeout=Defaults.ACTIVITY_SCHEDULED_TIMEOUT, execution_timeout=Defaults.ACTIVITY_EXECUTION_TIMEOUT, heartbeat_timeout=Defaults.ACTIVITY_HEARTBEAT_TIMEOUT):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def process_by_id(self, pid):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def processes(self, workflow=None, tag=None):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def count_processes(self, workflow=None, tag=None):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def start_process(self, process):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def signal_process(self, process_id, signal, data=None):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def cancel_process(self, process_id, details=None):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        ''' up to max_tasks activity tasks, as Backend.poll_activity_tasks, polled for one at a time '''
+        task = yield From(self.poll_activity_task(category=category, identity=identity, timeout=timeout))
+        tasks = []
+        while task:
+            tasks.append(task)
+            task = (yield From(self.poll_activity_task(category=category, identity=identity))) if len(tasks) < max_tasks else None
+        raise Return(tasks)
+
+    @asyncio.coroutine
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        ''' up to max_tasks decision tasks, as poll_activity_tasks '''
+        task = yield From(self.poll_decision_task(category=category, identity=identity, timeout=timeout))
+        tasks = []
+        while task:
+            tasks.append(task)
+            task = (yield From(self.poll_decision_task(category=category, identity=identity))) if len(tasks) < max_tasks else None
+        raise Return(tasks)
+
+    @asyncio.coroutine
+    def heartbeat_activity_task(self, task):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def complete_decision_task(self, task, decisions):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def complete_activity_task(self, task, result=None):
+        raise NotImplementedError()
+
+    @asyncio.coroutine
+    def complete_decision_tasks(self, completions):
+        ''' completes a number of (task, decisions) pairs, as Backend.complete_decision_tasks, one at a time '''
+        results = []
+        for (task, decisions) in completions:
+            results.append((yield From(self._complete(self.complete_decision_task, task, decisions))))
+        raise Return(results)
+
+    @asyncio.coroutine
+    def complete_activity_tasks(self, completions):
+        ''' completes a number of (task, result) pairs, as complete_decision_tasks '''
+        results = []
+        for (task, result) in completions:
+            results.append((yield From(self._complete(self.complete_activity_task, task, result))))
+        raise Return(results)
+
+    @asyncio.coroutine
+    def _complete(self, complete, task, result):
+        try:
+            yield From(complete(task, result))
+        except Exception, e:
+            raise Return(e)
+
+class ExecutorBackend(AsyncBackend):
+    '''
+    Makes any backend usable on an event loop, by calling it in a pool of threads.
+    Blocking polls hold a thread each while they wait, so size max_workers for
+    the number of polls made at once.
+
+    backend = ExecutorBackend(SQLiteBackend('workflow.db'), max_workers=32)
+    '''
+
+    def __init__(self, backend, max_workers=16, loop=None):
+        self.backend = backend
+        self.loop = loop or asyncio.get_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers)
+
+    def _call(self, fn, *args, **kwargs):
+        return self.loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def register_workflow(self, name, **kwargs):
+        self.backend.register_workflow(name, **kwargs)
+
+    def register_activity(self, name, **kwargs):
+        self.backend.register_activity(name, **kwargs)
+
+    def process_by_id(self, pid):
+        return self._call(self.backend.process_by_id, pid)
+
+    def processes(self, workflow=None, tag=None):
+        return self._call(lambda: list(self.backend.processes(workflow=workflow, tag=tag)))
+
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        return self._call(self.backend.query_processes, workflow=workflow, tag=tag, offset=offset, limit=limit, summary=summary)
+
+    def count_processes(self, workflow=None, tag=None):
+        return self._call(self.backend.count_processes, workflow=workflow, tag=tag)
+
+    def start_process(self, process):
+        return self._call(self.backend.start_process, process)
+
+    def signal_process(self, process_id, signal, data=None):
+        return self._call(self.backend.signal_process, process_id, signal, data=data)
+
+    def cancel_process(self, process_id, details=None):
+        return self._call(self.backend.cancel_process, process_id, details=details)
+
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        return self._call(self.backend.poll_activity_task, category=category, identity=identity, timeout=timeout)
+
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        return self._call(self.backend.poll_decision_task, category=category, identity=identity, timeout=timeout)
+
+    def heartbeat_activity_task(self, task):
+        return self._call(self.backend.heartbeat_activity_task, task)
+
+    def complete_decision_task(self, task, decisions):
+        return self._call(self.backend.complete_decision_task, task, decisions)
+
+    def complete_activity_task(self, task, result=None):
+        return self._call(self.backend.complete_activity_task, task, result=result)
+
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return self._call(self.backend.poll_activity_tasks, category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return self._call(self.backend.poll_decision_tasks, category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    def complete_decision_tasks(self, completions):
+        return self._call(self.backend.complete_decision_tasks, completions)
+
+    def complete_activity_tasks(self, completions):
+        return self._call(self.backend.complete_activity_tasks, completions)
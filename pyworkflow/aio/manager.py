@@ -0,0 +1,52 @@
+import trollius as asyncio
+from trollius import From, Return
+
+from ..task import DecisionTask, ActivityTask
+from ..managed import Manager
+
+class AsyncManager(Manager):
+    '''
+    A Manager for an AsyncBackend. Calls that go to the backend are coroutines,
+    batches of tasks included, everything else is as in Manager.
+
+    manager = AsyncManager(AsyncMemoryBackend(), workflows=[FooWorkflow])
+    pid = yield From(manager.start_process(Process(workflow=FooWorkflow)))
+    task = yield From(manager.next_activity(timeout=20))
+    '''
+
+    @asyncio.coroutine
+    def signal_process(self, process_or_id, signal):
+        process_id = getattr(process_or_id, 'id', process_or_id)
+        yield From(self._backend.signal_process(process_id, signal.name, signal.data))
+
+    @asyncio.coroutine
+    def cancel_process(self, process_or_id, details=None):
+        process_id = getattr(process_or_id, 'id', process_or_id)
+        yield From(self._backend.cancel_process(process_id, details=details))
+
+    @asyncio.coroutine
+    def heartbeat(self, task):
+        yield From(self._backend.heartbeat_activity_task(task))
+
+    @asyncio.coroutine
+    def complete_task(self, task, result):
+        if isinstance(task, DecisionTask):
+            yield From(self._backend.complete_decision_task(task, result))
+        elif isinstance(task, ActivityTask):
+            yield From(self._backend.complete_activity_task(task, result))
+        else:
+            raise ValueError('unsupported task type')
+
+    @asyncio.coroutine
+    def complete_tasks(self, completions):
+        results = [None] * len(completions)
+        for (indices, complete, batch) in self._batches(completions):
+            for (i, result) in zip(indices, (yield From(complete(batch)))):
+                results[i] = result
+        raise Return(results)
+
+    def copy_with_backend(self, backend):
+        return AsyncManager(backend, self._workflows.values())
+
+    def __repr__(self):
+        return 'AsyncManager(%s)' % self._backend.__class__.__name__
@@ -0,0 +1,161 @@
+from collections import deque
+from datetime import datetime, timedelta
+
+import trollius as asyncio
+from trollius import From, Return
+
+from ..defaults import Defaults
+from ..memory import MemoryBackend
+from backend import AsyncBackend
+
+class LoopMemoryBackend(MemoryBackend):
+    ''' a MemoryBackend that tells an AsyncMemoryBackend when work is queued, from whichever thread '''
+
+    def __init__(self, owner, **kwargs):
+        super(LoopMemoryBackend, self).__init__(**kwargs)
+        self.owner = owner
+
+    def _work_queued(self, kind, category):
+        super(LoopMemoryBackend, self)._work_queued(kind, category)
+        self.owner.loop.call_soon_threadsafe(self.owner._wake, kind, category)
+
+class AsyncMemoryBackend(AsyncBackend):
+    '''
+    In-memory backend for an event loop. Its state is a MemoryBackend's, whose
+    calls don't block unless they wait for a task, so they're made on the loop.
+    Polls with a timeout wait on the loop instead: each task queued wakes one
+    of the polls waiting for its kind and category, so any number of them can
+    be waiting without a thread each.
+
+    The MemoryBackend is available as the backend attribute, for use by threads.
+    '''
+
+    def __init__(self, loop=None, **kwargs):
+        self.loop = loop or asyncio.get_event_loop()
+        self.backend = LoopMemoryBackend(self, **kwargs)
+        # futures of the polls waiting for work, by kind and category
+        self._waiters = {}
+
+    def _wake(self, kind, category):
+        waiters = self._waiters.get((kind, category))
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    @asyncio.coroutine
+    def _wait_for_task(self, kind, category, poll, timeout=None, next_start=None):
+        ''' like MemoryBackend._wait_for_task, but waits on the loop rather than the work condition '''
+        task = poll()
+        if task or not timeout:
+            raise Return(task)
+
+        backend = self.backend
+        deadline = datetime.now() + timedelta(seconds=timeout)
+        while not task:
+            wakeup = deadline
+            with backend._lock:
+                for start in (next_start() if next_start else None, None if backend._sweeper else backend._next_deadline()):
+                    if start and start < wakeup:
+                        wakeup = start
+
+            remaining = (wakeup - datetime.now()).total_seconds()
+            if remaining > 0:
+                waiters = self._waiters.setdefault((kind, category), deque())
+                waiter = asyncio.Future(loop=self.loop)
+                waiters.append(waiter)
+                try:
+                    yield From(asyncio.wait_for(waiter, remaining, loop=self.loop))
+                except asyncio.TimeoutError:
+                    if waiter in waiters:
+                        waiters.remove(waiter)
+
+            task = poll()
+            if datetime.now() >= deadline:
+                break
+
+        raise Return(task)
+
+    def close(self):
+        self.backend.close()
+
+    def register_workflow(self, name, **kwargs):
+        self.backend.register_workflow(name, **kwargs)
+
+    def register_activity(self, name, **kwargs):
+        self.backend.register_activity(name, **kwargs)
+
+    @asyncio.coroutine
+    def process_by_id(self, pid):
+        raise Return(self.backend.process_by_id(pid))
+
+    @asyncio.coroutine
+    def processes(self, workflow=None, tag=None):
+        raise Return(list(self.backend.processes(workflow=workflow, tag=tag)))
+
+    @asyncio.coroutine
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        raise Return(self.backend.query_processes(workflow=workflow, tag=tag, offset=offset, limit=limit, summary=summary))
+
+    @asyncio.coroutine
+    def count_processes(self, workflow=None, tag=None):
+        raise Return(self.backend.count_processes(workflow=workflow, tag=tag))
+
+    @asyncio.coroutine
+    def start_process(self, process):
+        raise Return(self.backend.start_process(process))
+
+    @asyncio.coroutine
+    def signal_process(self, process_id, signal, data=None):
+        self.backend.signal_process(process_id, signal, data=data)
+
+    @asyncio.coroutine
+    def cancel_process(self, process_id, details=None):
+        self.backend.cancel_process(process_id, details=details)
+
+    @asyncio.coroutine
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        poll = lambda: self.backend.poll_activity_task(category=category, identity=identity)
+        task = yield From(self._wait_for_task('activity', category, poll, timeout))
+        raise Return(task)
+
+    @asyncio.coroutine
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        poll = lambda: self.backend.poll_decision_task(category=category, identity=identity)
+        next_start = lambda: self.backend._next_decision_start(category)
+        task = yield From(self._wait_for_task('decision', category, poll, timeout, next_start))
+        raise Return(task)
+
+    @asyncio.coroutine
+    def heartbeat_activity_task(self, task):
+        self.backend.heartbeat_activity_task(task)
+
+    @asyncio.coroutine
+    def complete_decision_task(self, task, decisions):
+        self.backend.complete_decision_task(task, decisions)
+
+    @asyncio.coroutine
+    def complete_activity_task(self, task, result=None):
+        self.backend.complete_activity_task(task, result=result)
+
+    @asyncio.coroutine
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        poll = lambda: self.backend.poll_activity_tasks(category=category, max_tasks=max_tasks, identity=identity)
+        tasks = yield From(self._wait_for_task('activity', category, poll, timeout))
+        raise Return(tasks)
+
+    @asyncio.coroutine
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        poll = lambda: self.backend.poll_decision_tasks(category=category, max_tasks=max_tasks, identity=identity)
+        next_start = lambda: self.backend._next_decision_start(category)
+        tasks = yield From(self._wait_for_task('decision', category, poll, timeout, next_start))
+        raise Return(tasks)
+
+    @asyncio.coroutine
+    def complete_decision_tasks(self, completions):
+        raise Return(self.backend.complete_decision_tasks(completions))
+
+    @asyncio.coroutine
+    def complete_activity_tasks(self, completions):
+        raise Return(self.backend.complete_activity_tasks(completions))
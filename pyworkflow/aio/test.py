@@ -0,0 +1,201 @@
+import unittest
+from time import time
+
+from ..test import MultiplicationActivity
+from ..process import Process
+from ..decision import ScheduleActivity, CompleteProcess
+from ..activity import ActivityCompleted, ActivityFailed
+from ..memory import MemoryBackend
+from ..managed import Activity, Workflow, DefaultWorkflow, Manager
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+    from worker import AsyncActivityWorker, AsyncDecisionWorker
+    from backend import ExecutorBackend
+    from memory import AsyncMemoryBackend
+    from manager import AsyncManager
+except ImportError:
+    asyncio = None
+
+if asyncio:
+    class WaitActivity(Activity):
+        @asyncio.coroutine
+        def execute(self):
+            self.heartbeat()
+            yield From(asyncio.sleep(self.input))
+            if self.input > 1:
+                raise ValueError('waited too long')
+            raise Return(self.input)
+
+class WaitWorkflow(Workflow):
+    activities = [WaitActivity, MultiplicationActivity] if asyncio else []
+
+class RoundTripWorkflow(DefaultWorkflow):
+    activities = [WaitActivity] if asyncio else []
+
+    def initiate(self, process):
+        return ScheduleActivity(WaitActivity, input=process.input)
+
+    def respond_to_completed_activity(self, process, activity_execution, result):
+        return CompleteProcess(result)
+
+@unittest.skipIf(asyncio is None, 'requires trollius and futures')
+class AsyncActivityWorkerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.backend = MemoryBackend()
+        self.manager = Manager(self.backend, workflows=[WaitWorkflow])
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def schedule(self, activity, input):
+        self.backend.start_process(Process(workflow='Wait', input=input))
+        task = self.backend.poll_decision_task()
+        self.backend.complete_decision_task(task, ScheduleActivity(activity, input=input, category=activity.category))
+        return task.process.id
+
+    def results(self):
+        return [p.history.of_type('activity')[0].result for p in self.backend.processes()]
+
+    def test_concurrency(self):
+        for i in range(50):
+            self.schedule(WaitActivity, .2)
+
+        heartbeats = []
+        self.manager.heartbeat = heartbeats.append
+        worker = AsyncActivityWorker(self.manager, concurrency=25, loop=self.loop)
+
+        @asyncio.coroutine
+        def run():
+            in_flight = []
+            for i in range(50):
+                assert (yield From(worker.step()))
+                in_flight.append(worker.in_flight)
+            assert not (yield From(worker.step()))
+            yield From(worker.join())
+            raise Return(in_flight)
+
+        started = time()
+        in_flight = self.loop.run_until_complete(run())
+
+        # 50 activities of .2 seconds, 25 at a time
+        assert time() - started < 2
+        assert max(in_flight) == 25 and worker.in_flight == 0
+        assert self.results() == [ActivityCompleted(.2)] * 50
+        assert len(heartbeats) == 50
+
+    def test_results(self):
+        self.schedule(WaitActivity, 1.5)
+        self.schedule(MultiplicationActivity, [2, 3])
+        self.schedule(MultiplicationActivity, 'invalid')
+
+        @asyncio.coroutine
+        def run(worker):
+            while (yield From(worker.step())):
+                pass
+            yield From(worker.join())
+
+        for category in ('default', 'computation'):
+            self.loop.run_until_complete(run(AsyncActivityWorker(self.manager, category=category, loop=self.loop)))
+
+        # activities that aren't coroutines run in the executor, with the same results
+        results = self.results()
+        assert isinstance(results[0], ActivityFailed) and results[0].reason == 'waited too long'
+        assert results[1] == ActivityCompleted(6)
+        assert isinstance(results[2], ActivityFailed) and 'invalid input' in results[2].reason
+
+@unittest.skipIf(asyncio is None, 'requires trollius and futures')
+class AsyncBackendTestCase(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def round_trips(self, backend, count, concurrency):
+        ''' runs count processes through a decision, an activity and another decision, on one loop '''
+        manager = AsyncManager(backend, workflows=[RoundTripWorkflow])
+        activity_worker = AsyncActivityWorker(manager, concurrency=concurrency, loop=self.loop)
+        decision_workers = [AsyncDecisionWorker(manager, loop=self.loop) for i in range(10)]
+        workers = [activity_worker] + decision_workers
+
+        @asyncio.coroutine
+        def run():
+            for i in range(count):
+                yield From(manager.start_process(Process(workflow='RoundTrip', input=.1)))
+            running = [asyncio.ensure_future(worker.run(poll_timeout=.5), loop=self.loop) for worker in workers]
+
+            while (yield From(manager.count_processes())):
+                yield From(asyncio.sleep(.05, loop=self.loop))
+            map(lambda worker: worker.stop(), workers)
+            yield From(asyncio.wait(running, loop=self.loop))
+
+        self.loop.run_until_complete(asyncio.wait_for(run(), 10, loop=self.loop))
+
+    def test_memory(self):
+        # activities wait .1 seconds each, all at once
+        started = time()
+        self.round_trips(AsyncMemoryBackend(loop=self.loop), 1000, 1000)
+        assert time() - started < 5
+
+    def test_executor(self):
+        backend = ExecutorBackend(MemoryBackend(), max_workers=16, loop=self.loop)
+        try:
+            self.round_trips(backend, 50, 50)
+        finally:
+            backend.close()
+
+    def test_batch(self):
+        for backend in (AsyncMemoryBackend(loop=self.loop), ExecutorBackend(MemoryBackend(), loop=self.loop)):
+            manager = AsyncManager(backend, workflows=[WaitWorkflow])
+
+            @asyncio.coroutine
+            def run():
+                for i in range(3):
+                    yield From(manager.start_process(Process(workflow='Wait', input=i)))
+
+                # tasks are polled for and completed a batch at a time
+                tasks = yield From(manager.next_decisions(5, timeout=.1))
+                assert len(tasks) == 3
+                results = yield From(manager.complete_tasks([(task, ScheduleActivity(WaitActivity, input=task.process.input)) for task in tasks]))
+                assert results == [None] * 3
+
+                tasks = yield From(manager.next_activities(2, timeout=.1))
+                assert len(tasks) == 2
+                results = yield From(manager.complete_tasks([(task, ActivityCompleted(0)) for task in tasks] + [(tasks[0], ActivityCompleted(0))]))
+                assert results[:2] == [None] * 2 and isinstance(results[2], Exception)
+                assert len((yield From(manager.next_decisions(5, timeout=.1)))) == 2
+
+            try:
+                self.loop.run_until_complete(run())
+            finally:
+                backend.close()
+
+    def test_long_poll(self):
+        backend = AsyncMemoryBackend(loop=self.loop)
+        backend.register_workflow('test')
+
+        @asyncio.coroutine
+        def run():
+            polls = [asyncio.ensure_future(backend.poll_decision_task(timeout=2), loop=self.loop) for i in range(3)]
+            yield From(asyncio.sleep(.1, loop=self.loop))
+            assert not any(poll.done() for poll in polls)
+
+            # queued work wakes one poll each, whether queued on the loop or from another thread
+            yield From(backend.start_process(Process(workflow='test')))
+            yield From(self.loop.run_in_executor(None, backend.backend.start_process, Process(workflow='test')))
+            yield From(asyncio.sleep(.1, loop=self.loop))
+            done = [poll for poll in polls if poll.done()]
+            assert len(done) == 2 and all(poll.result() for poll in done)
+
+            # the others time out empty-handed
+            assert (yield From(asyncio.wait_for(polls[2], 3, loop=self.loop))) is None
+            assert (yield From(backend.poll_activity_task(timeout=.1))) is None
+
+        self.loop.run_until_complete(run())
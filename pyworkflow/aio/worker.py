@@ -0,0 +1,179 @@
+from functools import partial
+
+import trollius as asyncio
+from trollius import From, Return
+
+from ..defaults import Defaults
+from ..managed.activity import ActivityMonitor
+from ..managed.worker.activity import ActivityWorker, execute, result_of, failure
+from ..managed.worker.decision import DecisionWorker
+from manager import AsyncManager
+
+@asyncio.coroutine
+def execute_async(activity, loop):
+    '''
+    The result of executing an activity. Coroutine execute() methods run on the loop,
+    others in its executor, so that they don't hold it up.
+    '''
+    if not asyncio.iscoroutinefunction(activity.execute):
+        result = yield From(loop.run_in_executor(None, execute, activity))
+        raise Return(result)
+
+    try:
+        value = yield From(activity.execute())
+    except Exception, e:
+        raise Return(failure(e))
+    raise Return(result_of(activity, value))
+
+def _call(manager, loop, method, *args, **kwargs):
+    ''' a future for calling a method of the manager, in the executor unless it's an AsyncManager '''
+    if isinstance(manager, AsyncManager):
+        return asyncio.ensure_future(method(*args, **kwargs), loop=loop)
+    return loop.run_in_executor(None, partial(method, *args, **kwargs))
+
+class AsyncActivityWorker(ActivityWorker):
+    '''
+    Executes activities on an event loop, up to concurrency of them at a time, so
+    that I/O-bound activities don't tie up a thread each. An activity's execute()
+    can be a coroutine (decorated with trollius.coroutine); ones that aren't are run
+    in the loop's executor. Calls to a Manager are made in the executor too, those
+    to an AsyncManager on the loop, and heartbeats are sent without waiting for them.
+
+    worker = AsyncActivityWorker(manager, concurrency=200)
+    loop.run_until_complete(worker.run(poll_timeout=20))
+    '''
+
+    def __init__(self, manager, name=None, category=Defaults.ACTIVITY_CATEGORY, concurrency=100, loop=None):
+        super(AsyncActivityWorker, self).__init__(manager, name=name, category=category)
+        self.concurrency = concurrency
+        self.loop = loop or asyncio.get_event_loop()
+
+        self._slots = asyncio.Semaphore(concurrency, loop=self.loop)
+        self._executing = set()
+        self._stopped = False
+
+    @property
+    def in_flight(self):
+        ''' the number of activities executing '''
+        return len(self._executing)
+
+    def _call(self, method, *args, **kwargs):
+        return _call(self.manager, self.loop, method, *args, **kwargs)
+
+    def monitor_for_task(self, task):
+        def heartbeat():
+            # may be called from the executor, by activities that aren't coroutines
+            self.loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._call(self.manager.heartbeat, task), loop=self.loop))
+        return ActivityMonitor(heartbeat)
+
+    @asyncio.coroutine
+    def step(self, logger=None, timeout=None):
+        '''
+        Waits for a free slot, polls for a task and starts executing it. Returns
+        whether there was a task, without waiting for it to be executed.
+        '''
+        yield From(self._slots.acquire())
+        try:
+            task = yield From(self._call(self.manager.next_activity, identity=self.name, category=self.category, timeout=timeout))
+        except:
+            self._slots.release()
+            raise
+
+        if not task:
+            self._slots.release()
+            raise Return(False)
+
+        if logger:
+            logger.info(self._log_msg('Starting', task, None, include_task=True))
+        execution = asyncio.ensure_future(self._execute(task, logger), loop=self.loop)
+        self._executing.add(execution)
+        execution.add_done_callback(self._executing.discard)
+        raise Return(True)
+
+    @asyncio.coroutine
+    def _execute(self, task, logger):
+        try:
+            activity = self.manager.activity_for_task(task, monitor=self.monitor_for_task(task))
+            result = yield From(execute_async(activity, self.loop))
+            if result:
+                yield From(self._call(self.manager.complete_task, task, result))
+            if logger:
+                self.log_result(task, result, logger)
+        except Exception, e:
+            if logger:
+                logger.exception(self._log_msg('Error in', task, str(e), include_task=True))
+        finally:
+            self._slots.release()
+
+    @asyncio.coroutine
+    def run(self, logger=None, poll_timeout=None, delay_on_idle=1):
+        ''' keeps executing tasks until stopped, then waits for the ones executing to finish '''
+        while not self._stopped:
+            if not (yield From(self.step(logger=logger, timeout=poll_timeout))) and not poll_timeout:
+                yield From(asyncio.sleep(delay_on_idle, loop=self.loop))
+        yield From(self.join())
+
+    def stop(self):
+        self._stopped = True
+
+    @asyncio.coroutine
+    def join(self):
+        ''' waits for the activities executing to finish '''
+        if self._executing:
+            yield From(asyncio.wait(list(self._executing), loop=self.loop))
+
+    def __repr__(self):
+        return 'AsyncActivityWorker(%s, %s, %s)' % (self.manager, self.name, self.category)
+
+class AsyncDecisionWorker(DecisionWorker):
+    '''
+    Makes decisions on an event loop. Deciding doesn't wait on anything, so it's done
+    on the loop; polls and completions go through the manager as for AsyncActivityWorker.
+    Any number of these can share a loop, each making one decision at a time.
+
+    worker = AsyncDecisionWorker(manager)
+    loop.run_until_complete(worker.run(poll_timeout=20))
+    '''
+
+    def __init__(self, manager, name=None, category=Defaults.DECISION_CATEGORY, loop=None):
+        super(AsyncDecisionWorker, self).__init__(manager, name=name, category=category)
+        self.loop = loop or asyncio.get_event_loop()
+        self._stopped = False
+
+    def _call(self, method, *args, **kwargs):
+        return _call(self.manager, self.loop, method, *args, **kwargs)
+
+    @asyncio.coroutine
+    def step(self, logger=None, timeout=None):
+        task = yield From(self._call(self.manager.next_decision, category=self.category, identity=self.name, timeout=timeout))
+        if not task:
+            raise Return(False)
+
+        if logger:
+            logger.info(self._log_msg("Starting", task, None, include_task=True))
+
+        decisions = None
+        try:
+            decisions = self.decide(task, self.manager.workflow_for_task(task))
+            yield From(self._call(self.manager.complete_task, task, decisions))
+        except Exception, e:
+            if logger:
+                logger.exception(self._log_msg("Error in", task, 'Exception: %s\nDecisions: %s' % (str(e), str(decisions)), include_task=True))
+            raise Return(True) # we consumed a task
+
+        if logger:
+            logger.info(self._log_msg("Completed", task, decisions))
+        raise Return(True)
+
+    @asyncio.coroutine
+    def run(self, logger=None, poll_timeout=None, delay_on_idle=1):
+        ''' keeps making decisions until stopped '''
+        while not self._stopped:
+            if not (yield From(self.step(logger=logger, timeout=poll_timeout))) and not poll_timeout:
+                yield From(asyncio.sleep(delay_on_idle, loop=self.loop))
+
+    def stop(self):
+        self._stopped = True
+
+    def __repr__(self):
+        return 'AsyncDecisionWorker(%s, %s, %s)' % (self.manager, self.name, self.category)
@@ -1,4 +1,6 @@
+from itertools import islice
 from defaults import Defaults
+from process import ProcessSummary
 
 class Backend(object):
     def register_workflow(self, name, version="1.0", timeout=Defaults.WORKFLOW_TIMEOUT, decision_timeout=Defaults.DECISION_TIMEOUT):
@@ -12,6 +14,31 @@ class Backend(object):
 
     def processes(self, workflow=None, tag=None):
         raise NotImplementedError()     
+
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        ''' a page of processes, or of ProcessSummary projections if summary is set '''
+        stop = offset + limit if limit is not None else None
+        processes = islice(self.processes(workflow=workflow, tag=tag), offset, stop)
+        return [ProcessSummary.for_process(p) for p in processes] if summary else list(processes)
+
+    def count_processes(self, workflow=None, tag=None):
+        return sum(1 for _ in self.processes(workflow=workflow, tag=tag))
+
+    def history_page(self, process_id, page_token=None, page_size=100, reverse=False):
+        '''
+        A page of the history of a process, oldest event first or newest first if
+        reverse is set, along with the token for the next page (None after the last).
+        Tokens are positions in the history.
+        '''
+        history = self.process_by_id(process_id).history
+        if reverse:
+            end = len(history) if page_token is None else page_token
+            start = max(0, end - page_size)
+            return (list(reversed(history[start:end])), start or None)
+
+        start = page_token or 0
+        end = start + page_size
+        return (list(history[start:end]), end if end < len(history) else None)
     
     def start_process(self, process):
         raise NotImplementedError()
@@ -22,12 +49,33 @@ class Backend(object):
     def cancel_process(self, process_id, details=None):
         raise NotImplementedError()
 
-    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None):
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
         raise NotImplementedError()
 
-    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None):
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
         raise NotImplementedError()
 
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        '''
+        Up to max_tasks activity tasks, waiting up to timeout for the first. Backends
+        that can hand out several at once should, this polls for them one at a time.
+        '''
+        task = self.poll_activity_task(category=category, identity=identity, timeout=timeout)
+        tasks = []
+        while task:
+            tasks.append(task)
+            task = self.poll_activity_task(category=category, identity=identity) if len(tasks) < max_tasks else None
+        return tasks
+
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        ''' up to max_tasks decision tasks, as poll_activity_tasks '''
+        task = self.poll_decision_task(category=category, identity=identity, timeout=timeout)
+        tasks = []
+        while task:
+            tasks.append(task)
+            task = self.poll_decision_task(category=category, identity=identity) if len(tasks) < max_tasks else None
+        return tasks
+
     def heartbeat_activity_task(self, task):
         raise NotImplementedError()
 
@@ -35,4 +83,21 @@ class Backend(object):
         raise NotImplementedError()
 
     def complete_activity_task(self, task, result=None):
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def complete_decision_tasks(self, completions):
+        '''
+        Completes a number of (task, decisions) pairs. Returns None for each that was
+        completed and the exception for each that couldn't be, in order.
+        '''
+        return [self._complete(self.complete_decision_task, task, decisions) for (task, decisions) in completions]
+
+    def complete_activity_tasks(self, completions):
+        ''' completes a number of (task, result) pairs, as complete_decision_tasks '''
+        return [self._complete(self.complete_activity_task, task, result) for (task, result) in completions]
+
+    def _complete(self, complete, task, result):
+        try:
+            complete(task, result)
+        except Exception, e:
+            return e
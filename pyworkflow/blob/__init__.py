@@ -0,0 +1,2 @@
+from store import BlobStore, PayloadRef, resolve
+from backend import BlobBackend
\ No newline at end of file
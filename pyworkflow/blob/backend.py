@@ -0,0 +1,100 @@
+from ..backend import Backend
+from ..defaults import Defaults
+from ..process import Process
+from ..decision import ScheduleActivity, StartChildProcess
+from ..activity import ActivityCompleted
+
+class BlobBackend(Backend):
+    '''
+    Wraps another backend, and keeps large process inputs, activity inputs and
+    activity results in a BlobStore rather than in the histories. They are passed
+    around as PayloadRefs, and Activity.input loads them when it's read. Deciders
+    get the PayloadRefs themselves, as Process.input and as activity results: they
+    load them with resolve() if they need what they stand for. A PayloadRef is
+    loaded from any BlobStore opened in the process that has it.
+
+    backend = BlobBackend(SQLiteBackend('workflow.db'), BlobStore('/var/lib/pyworkflow/blobs'))
+    '''
+
+    def __init__(self, backend, store):
+        self.backend = backend
+        self.store = store
+
+    def _process(self, process):
+        return Process(workflow=process.workflow, id=process.id, input=self.store.externalize(process.input),
+            tags=process.tags, parent=process.parent)
+
+    def _decision(self, decision):
+        if isinstance(decision, ScheduleActivity):
+            return ScheduleActivity(decision.activity, id=decision.id, category=decision.category,
+                input=self.store.externalize(decision.input))
+        elif isinstance(decision, StartChildProcess):
+            return StartChildProcess(self._process(decision.process), child_policy=decision.child_policy)
+        return decision
+
+    def register_workflow(self, name, **kwargs):
+        self.backend.register_workflow(name, **kwargs)
+
+    def register_activity(self, name, **kwargs):
+        self.backend.register_activity(name, **kwargs)
+
+    def process_by_id(self, pid):
+        return self.backend.process_by_id(pid)
+
+    def processes(self, workflow=None, tag=None):
+        return self.backend.processes(workflow=workflow, tag=tag)
+
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        return self.backend.query_processes(workflow=workflow, tag=tag, offset=offset, limit=limit, summary=summary)
+
+    def count_processes(self, workflow=None, tag=None):
+        return self.backend.count_processes(workflow=workflow, tag=tag)
+
+    def history_page(self, process_id, page_token=None, page_size=100, reverse=False):
+        return self.backend.history_page(process_id, page_token=page_token, page_size=page_size, reverse=reverse)
+
+    def start_process(self, process):
+        return self.backend.start_process(self._process(process))
+
+    def signal_process(self, process_id, signal, data=None):
+        self.backend.signal_process(process_id, signal, data=data)
+
+    def cancel_process(self, process_id, details=None):
+        self.backend.cancel_process(process_id, details=details)
+
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        return self.backend.poll_activity_task(category=category, identity=identity, timeout=timeout)
+
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        return self.backend.poll_decision_task(category=category, identity=identity, timeout=timeout)
+
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return self.backend.poll_activity_tasks(category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return self.backend.poll_decision_tasks(category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    def heartbeat_activity_task(self, task):
+        self.backend.heartbeat_activity_task(task)
+
+    def _decisions(self, decisions):
+        if not type(decisions) is list:
+            decisions = [decisions]
+        return [self._decision(d) for d in decisions]
+
+    def _result(self, result):
+        if isinstance(result, ActivityCompleted):
+            return ActivityCompleted(self.store.externalize(result.result))
+        return result
+
+    def complete_decision_task(self, task, decisions):
+        self.backend.complete_decision_task(task, self._decisions(decisions))
+
+    def complete_activity_task(self, task, result=None):
+        self.backend.complete_activity_task(task, result=self._result(result))
+
+    def complete_decision_tasks(self, completions):
+        return self.backend.complete_decision_tasks([(task, self._decisions(decisions)) for (task, decisions) in completions])
+
+    def complete_activity_tasks(self, completions):
+        return self.backend.complete_activity_tasks([(task, self._result(result)) for (task, result) in completions])
@@ -0,0 +1,123 @@
+import os
+import mmap
+import tempfile
+import cPickle as pickle
+from hashlib import sha1
+
+from collections import OrderedDict
+
+from ..util import Value
+from ..exceptions import UnknownPayloadException
+
+class PayloadRef(Value):
+    '''
+    Stands in for a payload kept in a BlobStore: the digest of its contents, their
+    size, and whether they're a pickled object rather than a string. It doesn't
+    say where the store is, so that histories holding it stay valid when the store
+    moves, or is read on another host. It is loaded from the stores opened in this
+    process.
+    '''
+    __slots__ = ('digest', 'size', 'pickled')
+
+    def __init__(self, digest, size, pickled=False):
+        self.digest = digest
+        self.size = size
+        self.pickled = pickled
+
+    def load(self, store=None):
+        '''
+        The payload, from the given store or else the first of the stores opened in
+        this process to have it. Strings come as a read-only buffer over the mapped
+        file, so they're paged in as they're read rather than copied.
+        '''
+        return (store or store_for(self)).get(self)
+
+    def __repr__(self):
+        return 'PayloadRef(%s, %d)' % (self.digest, self.size)
+
+def map_file(path, size):
+    if not size:
+        return buffer('')
+    with open(path, 'rb') as f:
+        return buffer(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+
+def resolve(value):
+    ''' the payload a value stands in for, if it is a PayloadRef '''
+    return value.load() if isinstance(value, PayloadRef) else value
+
+# the stores opened in this process by directory, which references are loaded from
+_stores = OrderedDict()
+
+def store_for(ref):
+    ''' the store opened in this process that has a payload '''
+    for store in _stores.itervalues():
+        if os.path.exists(store.path(ref)):
+            return store
+    raise UnknownPayloadException('payload %s is in none of the stores opened: %s' % (ref.digest, ', '.join(_stores)))
+
+class BlobStore(object):
+    '''
+    Content-addressed store of payloads, one file each, named after the digest of
+    their contents. Storing the same payload twice keeps a single copy. Payloads
+    are never changed once stored, so they can be mapped by any number of readers
+    on the host.
+
+    externalize() swaps values of threshold bytes or more for a PayloadRef.
+    '''
+
+    def __init__(self, directory, threshold=64 * 1024):
+        self.directory = os.path.abspath(directory)
+        self.threshold = threshold
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        _stores[self.directory] = self
+
+    def __setstate__(self, state):
+        # opened again when handed to another process, such as a pool's
+        self.__dict__.update(state)
+        _stores.setdefault(self.directory, self)
+
+    def path(self, ref):
+        return os.path.join(self.directory, ref.digest[:2], ref.digest[2:])
+
+    def put(self, data, pickled=False):
+        ''' stores a string, returns a reference to it '''
+        ref = PayloadRef(sha1(data).hexdigest(), len(data), pickled)
+        path = self.path(ref)
+        if os.path.exists(path):
+            return ref
+
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                pass # made by another writer
+
+        # written under a temporary name, so that readers never see part of it
+        (fd, temporary) = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(temporary, path)
+        except:
+            os.unlink(temporary)
+            raise
+        return ref
+
+    def get(self, ref):
+        ''' the payload a reference stands for '''
+        data = map_file(self.path(ref), ref.size)
+        return pickle.loads(str(data)) if ref.pickled else data
+
+    def externalize(self, value):
+        ''' value, or a reference to it once stored if it is large enough '''
+        if value is None or isinstance(value, PayloadRef):
+            return value
+        if isinstance(value, (str, bytearray, buffer)):
+            return self.put(value) if len(value) >= self.threshold else value
+
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return self.put(data, pickled=True) if len(data) >= self.threshold else value
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..test import WorkflowBackendTestCase, MultiplicationActivity
+from ..process import Process
+from ..decision import ScheduleActivity
+from ..activity import ActivityCompleted
+from ..memory import MemoryBackend
+from .. import codec
+from ..exceptions import UnknownPayloadException
+from store import BlobStore, PayloadRef, resolve
+from backend import BlobBackend
+
+class BlobBackendTestCase(WorkflowBackendTestCase):
+    def setUp(self):
+        super(BlobBackendTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.store = BlobStore(self.directory, threshold=1024)
+        self.backend = BlobBackend(MemoryBackend(), self.store)
+
+    def tearDown(self):
+        super(BlobBackendTestCase, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def construct_backend(self):
+        return self.backend
+
+    def test_basic(self):
+        self.subtest_basic()
+
+    def test_managed(self):
+        self.subtest_managed()
+
+    def test_activity_ids(self):
+        self.subtest_activity_ids()
+
+    def test_cancel_while_deciding(self):
+        self.subtest_cancel_while_deciding()
+
+    def test_batch(self):
+        self.subtest_batch()
+
+    def test_timeouts(self):
+        self.subtest_timeouts()
+
+    def test_order(self):
+        self.subtest_order()
+
+    def test_timer(self):
+        self.subtest_timer()
+
+    def test_query(self):
+        self.subtest_query()
+
+    def test_payloads(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+        backend.register_activity('double')
+
+        document = 'x' * (2 ** 20)
+        pid = backend.start_process(Process(workflow='test', input=document))
+        process = backend.process_by_id(pid)
+        assert isinstance(process.input, PayloadRef) and process.input.size == len(document)
+
+        # large inputs are kept out of the history, and loaded when the activity reads them
+        task = backend.poll_decision_task()
+        backend.complete_decision_task(task, [ScheduleActivity('double', id='1', input=process.input),
+            ScheduleActivity('double', id='2', input={'pages': [document]}), ScheduleActivity('double', id='3', input=2)])
+
+        inputs = [e.decision.input for e in process.history if e.type == 'decision']
+        assert isinstance(inputs[0], PayloadRef) and isinstance(inputs[1], PayloadRef) and inputs[2] == 2
+
+        task = backend.poll_activity_task()
+        activity = MultiplicationActivity(task)
+        assert isinstance(activity.input, buffer) and activity.input[:3] == 'xxx' and len(activity.input) == len(document)
+        backend.complete_activity_task(task, ActivityCompleted(activity.input[:] * 2))
+
+        task = backend.poll_activity_task()
+        assert MultiplicationActivity(task).input == {'pages': [document]}
+
+        result = process.history.of_type('activity')[0].result.result
+        assert isinstance(result, PayloadRef) and str(result.load()) == document * 2
+
+        # each payload is stored once, and references survive encoding
+        assert sum(len(files) for (path, dirs, files) in os.walk(self.directory)) == 3
+        assert codec.decode(codec.encode(process)).input == process.input
+
+    def test_moved_store(self):
+        ref = self.store.put('x' * 2048)
+        assert codec.decode(codec.encode(ref)) == ref
+
+        # references don't say where the store is, so it can move
+        moved = tempfile.mkdtemp()
+        try:
+            os.rmdir(moved)
+            shutil.move(self.directory, moved)
+            store = BlobStore(moved)
+            assert str(resolve(ref)) == 'x' * 2048 and str(store.get(ref)) == 'x' * 2048
+            shutil.move(moved, self.directory)
+        finally:
+            shutil.rmtree(moved, ignore_errors=True)
+
+        try:
+            PayloadRef('0' * 40, 1).load()
+            assert False
+        except UnknownPayloadException:
+            pass
@@ -0,0 +1,359 @@
+'''
+A compact binary encoding of processes, histories, decisions and results.
+
+Values are written as a one-byte tag followed by their data. Objects of the
+registered classes are written as records: the code of their schema, then the
+values of its fields in order, so class and attribute names never go on the
+wire. Anything else falls back to pickle.
+
+Schemas only ever get fields appended. A record with fewer fields than its
+schema (written by an older version) leaves the others None, and the fields
+a reader doesn't know of (written by a newer version) are skipped.
+
+data = encode(process, compress=True)
+process = decode(data)
+'''
+import struct
+import zlib
+import cPickle as pickle
+from datetime import datetime, timedelta
+from itertools import izip
+from time import time
+
+from activity import ActivityExecution, ActivityCompleted, ActivityCanceled, ActivityFailed, ActivityTimedOut
+from blob import PayloadRef
+from decision import CompleteProcess, CancelProcess, StartChildProcess, ScheduleActivity, CancelActivity, Timer
+from events import ProcessStartedEvent, DecisionStartedEvent, DecisionEvent, ActivityStartedEvent, ActivityEvent, SignalEvent, TimerEvent, ChildProcessEvent
+from exceptions import CodecException
+from history import IndexedHistory
+from process import Process, ProcessSummary, ProcessCompleted, ProcessCanceled, ProcessFailed, ProcessTimedOut
+from signal import Signal
+from task import ActivityTask, DecisionTask
+from util import slot_names
+
+VERSION = 1
+MAGIC = 'PWF'
+
+# magic, version and flags, in front of every encoded value or history
+HEADER = struct.Struct('>3sBB')
+COMPRESSED = 1
+
+BYTE = struct.Struct('>b')
+UBYTE = struct.Struct('>B')
+LENGTH = struct.Struct('>I')
+INT = struct.Struct('>q')
+FLOAT = struct.Struct('>d')
+RECORD = struct.Struct('>HB')
+
+EPOCH = datetime(1970, 1, 1)
+
+class Schema(object):
+    ''' how the objects of a class are written: the code that stands for the class, and their fields '''
+
+    def __init__(self, code, cls, fields, construct=None):
+        self.code = code
+        self.cls = cls
+        self.fields = tuple(fields)
+        self.construct = construct
+
+    def values(self, value):
+        return [getattr(value, name) for name in self.fields]
+
+    def create(self, values):
+        values = (list(values) + [None] * len(self.fields))[:len(self.fields)]
+        if self.construct:
+            return self.construct(**dict(izip(self.fields, values)))
+
+        obj = self.cls.__new__(self.cls)
+        for (name, value) in izip(self.fields, values):
+            setattr(obj, name, value)
+        return obj
+
+_schemas_by_class = {}
+_schemas_by_code = {}
+
+def register(cls, code, fields=None, construct=None):
+    '''
+    Registers the schema of a class. Fields default to the class's __slots__,
+    but for _type.
+    Objects are recreated without calling __init__, unless construct is given,
+    in which case it is called with the fields as keyword arguments.
+    '''
+    if code in _schemas_by_code or cls in _schemas_by_class:
+        raise ValueError('%s or code %d is registered already' % (cls.__name__, code))
+
+    if fields is None:
+        # registered classes have their type on the class, not in the _type slot
+        fields = [name for name in slot_names(cls) if name != '_type']
+    schema = Schema(code, cls, fields, construct)
+    _schemas_by_class[cls] = schema
+    _schemas_by_code[code] = schema
+    return schema
+
+def _encode_string(value, out, short, long):
+    if len(value) < 256:
+        out.append(short + UBYTE.pack(len(value)))
+    else:
+        out.append(long + LENGTH.pack(len(value)))
+    out.append(value)
+
+def _encode_int(value, out):
+    if -128 <= value < 128:
+        out.append('b' + BYTE.pack(value))
+    elif -2 ** 63 <= value < 2 ** 63:
+        out.append('i' + INT.pack(value))
+    else:
+        _encode_string(str(value), out, 'j', 'J')
+
+def _encode_items(tag, items, out):
+    out.append(tag + LENGTH.pack(len(items)))
+    for item in items:
+        _encode(item, out)
+
+def _encode_dict(value, out):
+    out.append('d' + LENGTH.pack(len(value)))
+    for (k, v) in value.iteritems():
+        _encode(k, out)
+        _encode(v, out)
+
+def _encode_datetime(value, out):
+    if value.tzinfo is not None:
+        return _encode_pickle(value, out)
+    delta = value - EPOCH
+    out.append('D' + INT.pack((delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds))
+
+def _encode_pickle(value, out):
+    data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    out.append('p' + LENGTH.pack(len(data)))
+    out.append(data)
+
+ENCODERS = {
+    type(None): lambda value, out: out.append('N'),
+    bool: lambda value, out: out.append('T' if value else 'F'),
+    int: _encode_int,
+    long: _encode_int,
+    float: lambda value, out: out.append('f' + FLOAT.pack(value)),
+    str: lambda value, out: _encode_string(value, out, 's', 'S'),
+    unicode: lambda value, out: _encode_string(value.encode('utf-8'), out, 'u', 'U'),
+    list: lambda value, out: _encode_items('l', value, out),
+    tuple: lambda value, out: _encode_items('t', value, out),
+    set: lambda value, out: _encode_items('e', value, out),
+    frozenset: lambda value, out: _encode_items('z', value, out),
+    dict: _encode_dict,
+    datetime: _encode_datetime,
+}
+
+def _encode(value, out):
+    encoder = ENCODERS.get(type(value))
+    if encoder:
+        return encoder(value, out)
+
+    schema = _schemas_by_class.get(type(value))
+    if schema:
+        values = schema.values(value)
+        out.append('r' + RECORD.pack(schema.code, len(values)))
+        for v in values:
+            _encode(v, out)
+    elif isinstance(value, IndexedHistory):
+        _encode_items('l', list(value), out)
+    else:
+        _encode_pickle(value, out)
+
+class Reader(object):
+    ''' reads values from a buffer, from a position on '''
+
+    def __init__(self, data, position=0):
+        self.data = data
+        self.position = position
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.position)
+        self.position += fmt.size
+        return values
+
+    def read(self, n):
+        if self.position + n > len(self.data):
+            raise CodecException('truncated data')
+        value = self.data[self.position:self.position + n]
+        self.position += n
+        return value
+
+    def string(self, short):
+        (length,) = self.unpack(UBYTE if short else LENGTH)
+        return self.read(length)
+
+    def items(self):
+        (length,) = self.unpack(LENGTH)
+        return [self.value() for i in xrange(length)]
+
+    def record(self):
+        (code, length) = self.unpack(RECORD)
+        schema = _schemas_by_code.get(code)
+        if not schema:
+            raise CodecException('unknown schema %d' % code)
+        return schema.create([self.value() for i in xrange(length)])
+
+    def value(self):
+        tag = self.read(1)
+        decoder = DECODERS.get(tag)
+        if not decoder:
+            raise CodecException('unknown tag %r' % tag)
+        try:
+            return decoder(self)
+        except struct.error:
+            raise CodecException('truncated data')
+
+def _decode_dict(reader):
+    (length,) = reader.unpack(LENGTH)
+    return dict((reader.value(), reader.value()) for i in xrange(length))
+
+DECODERS = {
+    'N': lambda reader: None,
+    'T': lambda reader: True,
+    'F': lambda reader: False,
+    'b': lambda reader: reader.unpack(BYTE)[0],
+    'i': lambda reader: reader.unpack(INT)[0],
+    'j': lambda reader: int(reader.string(True)),
+    'J': lambda reader: int(reader.string(False)),
+    'f': lambda reader: reader.unpack(FLOAT)[0],
+    's': lambda reader: reader.string(True),
+    'S': lambda reader: reader.string(False),
+    'u': lambda reader: reader.string(True).decode('utf-8'),
+    'U': lambda reader: reader.string(False).decode('utf-8'),
+    'l': lambda reader: reader.items(),
+    't': lambda reader: tuple(reader.items()),
+    'e': lambda reader: set(reader.items()),
+    'z': lambda reader: frozenset(reader.items()),
+    'd': _decode_dict,
+    'D': lambda reader: EPOCH + timedelta(microseconds=reader.unpack(INT)[0]),
+    'r': lambda reader: reader.record(),
+    'p': lambda reader: pickle.loads(reader.string(False)),
+}
+
+def _header(compress):
+    return HEADER.pack(MAGIC, VERSION, COMPRESSED if compress else 0)
+
+def _read_header(data):
+    if len(data) < HEADER.size:
+        raise CodecException('truncated header')
+    (magic, version, flags) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise CodecException('not encoded by this codec')
+    if version > VERSION:
+        raise CodecException('encoded by a newer version (%d)' % version)
+    return flags
+
+def encode(value, compress=False):
+    ''' the encoding of a value, optionally compressed with zlib '''
+    out = []
+    _encode(value, out)
+    body = ''.join(out)
+    return _header(compress) + (zlib.compress(body) if compress else body)
+
+def decode(data):
+    flags = _read_header(data)
+    body = buffer(data, HEADER.size)
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+
+    reader = Reader(body)
+    value = reader.value()
+    if reader.position != len(body):
+        raise CodecException('trailing data')
+    return value
+
+def dump_history(events, f, compress=False):
+    ''' writes events to a file one at a time, each in a frame preceded by its length '''
+    f.write(_header(compress))
+    compressor = zlib.compressobj() if compress else None
+
+    for event in events:
+        out = []
+        _encode(event, out)
+        body = ''.join(out)
+        frame = LENGTH.pack(len(body)) + body
+        f.write(compressor.compress(frame) if compressor else frame)
+
+    if compressor:
+        f.write(compressor.flush())
+
+def load_history(f, chunk_size=65536):
+    ''' the events written by dump_history, read from a file as they are needed '''
+    flags = _read_header(f.read(HEADER.size))
+    decompressor = zlib.decompressobj() if flags & COMPRESSED else None
+
+    data = ''
+    while True:
+        chunk = f.read(chunk_size)
+        if decompressor:
+            data += decompressor.decompress(chunk) if chunk else decompressor.flush()
+        else:
+            data += chunk
+
+        position = 0
+        while len(data) - position >= LENGTH.size:
+            (length,) = LENGTH.unpack_from(data, position)
+            if len(data) - position - LENGTH.size < length:
+                break
+            reader = Reader(data, position + LENGTH.size)
+            yield reader.value()
+            position += LENGTH.size + length
+        data = data[position:]
+
+        if not chunk:
+            if data:
+                raise CodecException('truncated history')
+            return
+
+def benchmark(value, number=100):
+    ''' sizes of a value and seconds per round trip, encoded with this codec (plain and compressed) and pickled '''
+    formats = {
+        'codec': (encode, decode),
+        'codec+zlib': (lambda v: encode(v, compress=True), decode),
+        'pickle': (lambda v: pickle.dumps(v, pickle.HIGHEST_PROTOCOL), pickle.loads),
+    }
+
+    results = {}
+    for (name, (dumps, loads)) in formats.iteritems():
+        start = time()
+        for i in xrange(number):
+            data = dumps(value)
+            loads(data)
+        results[name] = (len(data), (time() - start) / number)
+    return results
+
+# codes are part of the format: never reuse or renumber them
+
+register(ProcessStartedEvent, 1)
+register(DecisionStartedEvent, 2)
+register(DecisionEvent, 3)
+register(ActivityStartedEvent, 4)
+register(ActivityEvent, 5)
+register(SignalEvent, 6)
+register(TimerEvent, 7)
+register(ChildProcessEvent, 8)
+
+register(CompleteProcess, 20)
+register(CancelProcess, 21)
+register(StartChildProcess, 22)
+register(ScheduleActivity, 23)
+register(CancelActivity, 24)
+register(Timer, 25)
+
+register(ActivityCompleted, 40, ('type', 'result'))
+register(ActivityCanceled, 41, ('type', 'details'))
+register(ActivityFailed, 42, ('type', 'reason', 'details'))
+register(ActivityTimedOut, 43, ('type', 'details'))
+
+register(ProcessCompleted, 50, ('type', 'result'))
+register(ProcessCanceled, 51, ('type', 'details'))
+register(ProcessFailed, 52, ('type', 'reason', 'details'))
+register(ProcessTimedOut, 53, ('type', 'details'))
+
+register(ActivityExecution, 60)
+register(Signal, 61)
+register(Process, 62, ('workflow', 'id', 'input', 'tags', 'parent', 'history'), construct=Process)
+register(ProcessSummary, 63, ('id', 'workflow', 'tags'), construct=ProcessSummary)
+register(ActivityTask, 64)
+register(DecisionTask, 65)
+register(PayloadRef, 66)
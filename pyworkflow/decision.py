@@ -1,15 +1,21 @@
 from uuid import uuid4
+from util import Value, TypeAttribute
 
-class Decision(object):
-    def __init__(self, decision_type):
-        self.type = decision_type
+class Decision(Value):
+    __slots__ = ('_type',)
+    type = TypeAttribute()
 
-    def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+    def __init__(self, decision_type=None):
+        # subclasses used to pass their type, which is now a class attribute
+        if decision_type is not None and decision_type != self.type:
+            self._type = decision_type
 
 class CompleteProcess(Decision):
+    __slots__ = ('result',)
+    type = 'complete_process'
+
     def __init__(self, result=None):
-        super(CompleteProcess, self).__init__('complete_process')
+        super(CompleteProcess, self).__init__()
 
         self.result = result
 
@@ -17,8 +23,11 @@ class CompleteProcess(Decision):
         return 'CompleteProcess(%s)' % (str(self.result))
 
 class CancelProcess(Decision):
+    __slots__ = ('details',)
+    type = 'cancel_process'
+
     def __init__(self, details=None):
-        super(CancelProcess, self).__init__('cancel_process')
+        super(CancelProcess, self).__init__()
 
         self.details = details
 
@@ -26,8 +35,11 @@ class CancelProcess(Decision):
         return 'CancelProcess(%s)' % (self.details)
 
 class StartChildProcess(Decision):
+    __slots__ = ('process', 'child_policy')
+    type = 'start_child_process'
+
     def __init__(self, process, child_policy='ABANDON'):
-        super(StartChildProcess, self).__init__('start_child_process')
+        super(StartChildProcess, self).__init__()
 
         self.process = process
         self.child_policy = child_policy
@@ -36,8 +48,11 @@ class StartChildProcess(Decision):
         return 'StartChildProcess(%s, %s)' % (self.process, self.child_policy)
 
 class ScheduleActivity(Decision):
+    __slots__ = ('activity', 'id', 'category', 'input')
+    type = 'schedule_activity'
+
     def __init__(self, activity, id=None, category=None, input=None):
-        super(ScheduleActivity, self).__init__('schedule_activity')
+        super(ScheduleActivity, self).__init__()
         
         try:
             self.activity = activity.name
@@ -52,8 +67,11 @@ class ScheduleActivity(Decision):
         return 'ScheduleActivity(%s, %s)' % (self.activity, self.input)
 
 class CancelActivity(Decision):
+    __slots__ = ('id',)
+    type = 'cancel_activity'
+
     def __init__(self, activity_or_id):
-        super(CancelActivity, self).__init__('cancel_activity')
+        super(CancelActivity, self).__init__()
         
         self.id = activity_or_id.id if hasattr(activity_or_id, 'id') else activity_or_id
 
@@ -61,10 +79,15 @@ class CancelActivity(Decision):
         return 'CancelActivity(%s)' % self.id
 
 class Timer(Decision):
-    def __init__(self, delay, data=None):
-        super(Timer, self).__init__('timer')
+    ''' A delayed decision. Timers without an id are told apart by their delay and data '''
+    __slots__ = ('delay', 'data', 'id')
+    type = 'timer'
+
+    def __init__(self, delay, data=None, id=None):
+        super(Timer, self).__init__()
         self.delay = delay
         self.data = data or {}
+        self.id = id
 
     def __repr__(self):
         return 'Timer(%s, %s)' % (self.delay, self.data)
\ No newline at end of file
@@ -1,42 +1,73 @@
-from datetime import datetime
-from copy import deepcopy
+from calendar import timegm
+from datetime import datetime, timedelta
+from util import Value, TypeAttribute
+
+EPOCH = datetime(1970, 1, 1)
+
+class Event(Value):
+    # events are numerous, so they keep their attributes in slots, their type on the
+    # class, and the moment they happened as a number
+    __slots__ = ('_timestamp', '_type')
+    type = TypeAttribute()
+    # events are the same regardless of when they happened
+    _uncompared = ('_timestamp',)
+
+    def __init__(self, event_type=None, **kwargs):
+        # subclasses used to pass their type, which is now a class attribute
+        if event_type is not None and event_type != self.type:
+            self._type = event_type
+        self.datetime = kwargs.get('datetime', None) or datetime.now()
+
+    @property
+    def datetime(self):
+        return EPOCH + timedelta(seconds=self._timestamp)
+
+    @datetime.setter
+    def datetime(self, value):
+        # naive datetimes are local time, as datetime.now() gives; aware ones are converted to it
+        if value.utcoffset() is not None:
+            value = datetime.fromtimestamp(timegm(value.utctimetuple())).replace(microsecond=value.microsecond)
+        self._timestamp = (value - EPOCH).total_seconds()
 
-class Event(object):
-    def __init__(self, event_type, **kwargs):
-        self.type = event_type
-        self.datetime = kwargs.get('datetime', datetime.now())
-        
-    def __eq__(self, other):
-        other = deepcopy(other)
-        other.datetime = self.datetime
-        return self.__dict__ == other.__dict__
 
 class DecisionStartedEvent(Event):
+    __slots__ = ()
+    type = 'decision_started'
+
     def __init__(self, **kwargs):
-        super(DecisionStartedEvent, self).__init__('decision_started', **kwargs)
+        super(DecisionStartedEvent, self).__init__(**kwargs)
         
     def __repr__(self):
         return 'DecisionStartedEvent()'
 
 class DecisionEvent(Event):
+    __slots__ = ('decision',)
+    type = 'decision'
+
     def __init__(self, decision, **kwargs):
-        super(DecisionEvent, self).__init__('decision', **kwargs)
+        super(DecisionEvent, self).__init__(**kwargs)
         self.decision = decision
 
     def __repr__(self):
         return 'DecisionEvent(%s)' % (repr(self.decision))
 
 class ActivityStartedEvent(Event):
+    __slots__ = ('activity_execution',)
+    type = 'activity_started'
+
     def __init__(self, activity_execution, **kwargs):
-        super(ActivityStartedEvent, self).__init__('activity_started', **kwargs)
+        super(ActivityStartedEvent, self).__init__(**kwargs)
         self.activity_execution = activity_execution
 
     def __repr__(self):
         return 'ActivityStartedEvent(%s)' % (self.activity_execution)
 
 class ActivityEvent(Event):
+    __slots__ = ('activity_execution', 'result')
+    type = 'activity'
+
     def __init__(self, activity_execution, result, **kwargs):
-        super(ActivityEvent, self).__init__('activity', **kwargs)
+        super(ActivityEvent, self).__init__(**kwargs)
         self.activity_execution = activity_execution
         self.result = result
 
@@ -44,31 +75,43 @@ class ActivityEvent(Event):
         return 'ActivityEvent(%s, %s)' % (self.activity_execution, repr(self.result))
 
 class SignalEvent(Event):
+    __slots__ = ('signal',)
+    type = 'signal'
+
     def __init__(self, signal, **kwargs):
-        super(SignalEvent, self).__init__('signal', **kwargs)
+        super(SignalEvent, self).__init__(**kwargs)
         self.signal = signal
 
     def __repr__(self):
         return 'SignalEvent(%s)' % (repr(self.signal))
 
 class TimerEvent(Event):
+    __slots__ = ('timer',)
+    type = 'timer'
+
     def __init__(self, timer, **kwargs):
-        super(TimerEvent, self).__init__('timer', **kwargs)
+        super(TimerEvent, self).__init__(**kwargs)
         self.timer = timer
 
     def __repr__(self):
         return 'TimerEvent(%s)' % (repr(self.timer))
 
 class ProcessStartedEvent(Event):
+    __slots__ = ()
+    type = 'process_started'
+
     def __init__(self, **kwargs):
-        super(ProcessStartedEvent, self).__init__('process_started', **kwargs)
+        super(ProcessStartedEvent, self).__init__(**kwargs)
         
     def __repr__(self):
         return 'ProcessStartedEvent()'
 
 class ChildProcessEvent(Event):
+    __slots__ = ('process_id', 'result', 'tags', 'workflow')
+    type = 'child_process'
+
     def __init__(self, process_id, result, **kwargs):
-        super(ChildProcessEvent, self).__init__('child_process', **kwargs)
+        super(ChildProcessEvent, self).__init__(**kwargs)
         self.process_id = process_id
         self.result = result
 
@@ -76,4 +119,4 @@ class ChildProcessEvent(Event):
         self.workflow = kwargs.get('workflow', None)
 
     def __repr__(self):
-        return 'ChildProcessEvent(%s, %s, tags=%s, workflow=%s)' % (repr(self.process_id), repr(self.result), repr(self.tags), repr(self.workflow))
\ No newline at end of file
+        return 'ChildProcessEvent(%s, %s, tags=%s, workflow=%s)' % (repr(self.process_id), repr(self.result), repr(self.tags), repr(self.workflow))
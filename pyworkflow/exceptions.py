@@ -11,4 +11,10 @@ class UnknownDecisionException(UnknownResourceException):
 	pass
 
 class TimedOutException(Exception):
+	pass
+
+class CodecException(Exception):
+	pass
+
+class UnknownPayloadException(UnknownResourceException):
 	pass
\ No newline at end of file
@@ -0,0 +1,352 @@
+import cPickle as pickle
+from array import array
+from collections import OrderedDict
+from itertools import izip
+from activity import ActivityExecution
+from util import fingerprint, attributes, slot_names
+
+class IndexedHistory(object):
+    '''
+    Keeps track of where the events of interest in a history are as they are
+    appended, so that questions about the history don't need a scan.
+    '''
+
+    def _reindex(self):
+        # positions of the last two decision_started events
+        self._decision_started = [-1, -1]
+        # executions of scheduled activities that haven't finished by id, in order of scheduling,
+        # and ids of finished ones
+        self._open_activities = OrderedDict()
+        self._closed_activities = set()
+        # timers that haven't fired by key, as [timer, number of them]
+        self._pending_timers = OrderedDict()
+        # fingerprints of the events, collected once they're asked for
+        self._fingerprints = None
+
+        for (i, event) in enumerate(self):
+            self._index(i, event)
+
+    def _index(self, i, event):
+        if event.type == 'decision_started':
+            self._decision_started = [self._decision_started[1], i]
+        elif event.type == 'decision' and hasattr(event.decision, 'activity'):
+            # scheduling an activity again reopens it
+            decision = event.decision
+            self._open_activities.pop(decision.id, None)
+            self._open_activities[decision.id] = ActivityExecution(decision.activity, decision.id, decision.input)
+            self._closed_activities.discard(decision.id)
+        elif event.type == 'activity' and hasattr(event.activity_execution, 'id'):
+            self._open_activities.pop(event.activity_execution.id, None)
+            self._closed_activities.add(event.activity_execution.id)
+
+        if event.type == 'decision' and event.decision.type == 'timer':
+            add_timer(self._pending_timers, event.decision)
+        elif event.type == 'timer':
+            remove_timer(self._pending_timers, event.timer)
+
+        if self._fingerprints is not None:
+            self._fingerprints.add(fingerprint(event))
+
+    def extend(self, events):
+        for event in events:
+            self.append(event)
+
+    def __iadd__(self, events):
+        self.extend(events)
+        return self
+
+    def __contains__(self, event):
+        if self._fingerprints is None:
+            self._fingerprints = set(fingerprint(e) for e in self)
+        return fingerprint(event) in self._fingerprints
+
+    def of_type(self, *types):
+        ''' the events of the given types '''
+        return [event for event in self if event.type in types]
+
+    def unseen_start(self):
+        '''
+        Position of the first event not seen by the previous decision. The last event
+        is taken to be the start of the current decision.
+        '''
+        (previous, last) = self._decision_started
+        return (previous if last == len(self) - 1 else last) + 1
+
+    def unseen(self):
+        ''' the events that happened since the previous decision '''
+        return self[self.unseen_start():len(self) - 1]
+
+    def unfinished_activities(self):
+        ''' executions of the activities that were scheduled but haven't finished, most recent first '''
+        return list(reversed(self._open_activities.values()))
+
+    def activity_finished(self, id):
+        return id in self._closed_activities
+
+    def untriggered_timers(self, disregard_unseen=False):
+        ''' the timers that haven't fired, or hadn't as of the previous decision '''
+        pending = OrderedDict((key, list(entry)) for (key, entry) in self._pending_timers.iteritems())
+        if disregard_unseen:
+            for event in self[self.unseen_start():]:
+                if event.type == 'timer':
+                    add_timer(pending, event.timer)
+
+        return [timer for (timer, n) in pending.itervalues() for i in range(n)]
+
+class History(IndexedHistory, list):
+    '''
+    The events of a process, as a list. Changes other than appending rebuild the
+    bookkeeping from scratch.
+    '''
+
+    def __init__(self, events=()):
+        super(History, self).__init__(events)
+        self._reindex()
+
+    def append(self, event):
+        super(History, self).append(event)
+        self._index(len(self) - 1, event)
+
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+
+class EventSequence(IndexedHistory):
+    '''
+    A history that isn't a list, but recreates or fetches each event in _event(i).
+    '''
+
+    def _event(self, i):
+        raise NotImplementedError()
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._event(j) for j in xrange(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('history index out of range')
+        return self._event(i)
+
+    def __getslice__(self, start, stop):
+        return self.__getitem__(slice(start, stop))
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self._event(i)
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and all(a == b for (a, b) in izip(self, other))
+        except TypeError:
+            return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, list(self))
+
+class ColumnarHistory(EventSequence):
+    '''
+    The events of a process, stored in columns rather than as objects: a code for
+    the class of each event, its timestamp, the activity it concerns (if any), and
+    its other attributes, pickled into one buffer. Events are recreated when they
+    are accessed. Meant for long-running processes with many events.
+
+    Events can only be appended. Use it by passing Process(history=ColumnarHistory()).
+    '''
+
+    def __init__(self, events=()):
+        # event classes and activity ids, by code
+        self._classes = []
+        self._activity_ids = []
+        self._activity_codes = {}
+
+        self._codes = array('B')
+        self._timestamps = array('d')
+        self._activities = array('l')
+        self._payloads = bytearray()
+        self._offsets = array('L', [0])
+
+        self._reindex()
+        self.extend(events)
+
+    def _class_code(self, cls):
+        if not cls in self._classes:
+            self._classes.append(cls)
+        return self._classes.index(cls)
+
+    def _activity_code(self, event):
+        if event.type == 'decision':
+            id = event.decision.id if event.decision.type in ('schedule_activity', 'cancel_activity') else None
+        else:
+            id = getattr(getattr(event, 'activity_execution', None), 'id', None)
+
+        if id is None:
+            return -1
+        if not id in self._activity_codes:
+            self._activity_codes[id] = len(self._activity_ids)
+            self._activity_ids.append(id)
+        return self._activity_codes[id]
+
+    def _fields(self, cls):
+        # classes with a type of their own leave the _type slot unset
+        skipped = ('_timestamp', '_type') if cls.type else ('_timestamp',)
+        return [name for name in slot_names(cls) if not name in skipped]
+
+    def append(self, event):
+        cls = type(event)
+        state = attributes(event)
+        timestamp = state.pop('_timestamp')
+        # events that keep their attributes in slots are stored as a tuple of their values
+        payload = state if hasattr(event, '__dict__') else tuple(state.get(name) for name in self._fields(cls))
+
+        self._codes.append(self._class_code(cls))
+        self._timestamps.append(timestamp)
+        self._activities.append(self._activity_code(event))
+        self._payloads.extend(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+        self._offsets.append(len(self._payloads))
+
+        self._index(len(self) - 1, event)
+
+    def _event(self, i):
+        cls = self._classes[self._codes[i]]
+        payload = pickle.loads(str(self._payloads[self._offsets[i]:self._offsets[i + 1]]))
+
+        event = cls.__new__(cls)
+        if isinstance(payload, dict):
+            event.__setstate__(payload)
+        else:
+            for (name, value) in izip(self._fields(cls), payload):
+                setattr(event, name, value)
+        event._timestamp = self._timestamps[i]
+        return event
+
+    def __len__(self):
+        return len(self._codes)
+
+    def positions(self, *types):
+        ''' positions of the events of the given types, found by scanning the column of class codes '''
+        codes = [chr(code) for (code, cls) in enumerate(self._classes) if cls.type in types]
+        column = self._codes.tostring()
+
+        positions = []
+        for code in codes:
+            i = column.find(code)
+            while i >= 0:
+                positions.append(i)
+                i = column.find(code, i + 1)
+        return sorted(positions)
+
+    def of_type(self, *types):
+        return [self._event(i) for i in self.positions(*types)]
+
+    def activity_events(self, id):
+        ''' the events that concern an activity '''
+        code = self._activity_codes.get(id)
+        if code is None:
+            return []
+        return [self._event(i) for (i, c) in enumerate(self._activities) if c == code]
+
+class PagedHistory(EventSequence):
+    '''
+    The history of a process as of a decision task, fetched from the backend (see
+    Backend.history_page) a page at a time as it is accessed, rather than shipped
+    with the task. Finding the unseen events only fetches pages from the end, newest
+    first; questions about the whole history fetch all of it, once.
+    '''
+
+    def __init__(self, backend, process_id, length, page_size=100, events=None):
+        self.backend = backend
+        self.process_id = process_id
+        self.page_size = page_size
+        self._length = length
+        # the events fetched so far, by position
+        self._events = dict(events or {})
+        self._history = None
+
+    @classmethod
+    def tail(cls, history, process_id, page_size=100, backend=None):
+        ''' a paged history with only the last page of the given history loaded '''
+        start = max(0, len(history) - page_size)
+        return cls(backend, process_id, len(history), page_size, izip(xrange(start, len(history)), history[start:]))
+
+    def _fetch(self, token, reverse=False):
+        (events, next_token) = self.backend.history_page(self.process_id, page_token=token, page_size=self.page_size, reverse=reverse)
+        positions = xrange(token - 1, -1, -1) if reverse else xrange(token, self._length)
+        self._events.update(izip(positions, events))
+        return next_token
+
+    def _event(self, i):
+        if not i in self._events:
+            self._fetch(i - i % self.page_size)
+        return self._events[i]
+
+    def _full(self):
+        if self._history is None:
+            self._history = History(self)
+        return self._history
+
+    def __len__(self):
+        return self._length
+
+    def __reduce__(self):
+        return (self.__class__, (None, self.process_id, self._length, self.page_size, self._events))
+
+    def append(self, event):
+        self._events[self._length] = event
+        self._length += 1
+        if self._history is not None:
+            self._history.append(event)
+
+    def unseen_start(self):
+        for i in xrange(len(self) - 2, -1, -1):
+            if not i in self._events:
+                self._fetch(i + 1, reverse=True)
+            if self._events[i].type == 'decision_started':
+                return i + 1
+        return 0
+
+    def __contains__(self, event):
+        return event in self._full()
+
+    def of_type(self, *types):
+        return self._full().of_type(*types)
+
+    def unfinished_activities(self):
+        return self._full().unfinished_activities()
+
+    def activity_finished(self, id):
+        return self._full().activity_finished(id)
+
+    def untriggered_timers(self, disregard_unseen=False):
+        return self._full().untriggered_timers(disregard_unseen)
+
+def timer_key(timer):
+    # timers from before they had ids don't have the attribute
+    id = getattr(timer, 'id', None)
+    return fingerprint(timer) if id is None else id
+
+def add_timer(pending, timer):
+    pending.setdefault(timer_key(timer), [timer, 0])[1] += 1
+
+def remove_timer(pending, timer):
+    key = timer_key(timer)
+    if key in pending:
+        pending[key][1] -= 1
+        if not pending[key][1]:
+            del pending[key]
+
+def reindexing(name):
+    method = getattr(list, name)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._reindex()
+    wrapper.__name__ = name
+    return wrapper
+
+for name in ('insert', 'pop', 'remove', 'reverse', 'sort', '__setitem__', '__delitem__', '__setslice__', '__delslice__', '__imul__'):
+    setattr(History, name, reindexing(name))
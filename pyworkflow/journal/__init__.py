@@ -0,0 +1 @@
+from backend import JournalBackend
\ No newline at end of file
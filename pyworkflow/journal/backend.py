@@ -0,0 +1,400 @@
+import os
+import struct
+import threading
+import cPickle as pickle
+from functools import wraps
+from itertools import count
+from zlib import crc32
+
+from ..memory import MemoryBackend
+from ..defaults import Defaults
+
+# record frame: payload length, payload checksum, log sequence number (lsn)
+HEADER = struct.Struct('>IIQ')
+SEGMENT = '.log'
+SNAPSHOT = '.snapshot'
+
+def checksum(data):
+    return crc32(data) & 0xffffffff
+
+def list_files(directory, suffix):
+    ''' (lsn, path) of the segment or snapshot files in directory, in order of lsn '''
+    files = []
+    for name in os.listdir(directory):
+        if name.endswith(suffix):
+            files.append((int(name[:-len(suffix)]), os.path.join(directory, name)))
+    return sorted(files)
+
+def fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def read_segment(path):
+    ''' yields the (lsn, payload) records in a segment file, truncating a torn last record '''
+    with open(path, 'r+b') as f:
+        while True:
+            offset = f.tell()
+            header = f.read(HEADER.size)
+            if len(header) == HEADER.size:
+                (length, crc, lsn) = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) == length and checksum(payload) == crc:
+                    yield (lsn, payload)
+                    continue
+
+            if header:
+                # partially written when we went down
+                f.truncate(offset)
+            return
+
+def read_log(directory, after=0):
+    ''' yields the consecutive (lsn, payload) records that follow lsn after '''
+    segments = list_files(directory, SEGMENT)
+    expected = after + 1
+    for (i, (first, path)) in enumerate(segments):
+        if i + 1 < len(segments) and segments[i + 1][0] <= expected:
+            continue # all records precede the ones we're after
+
+        if first > expected:
+            # records went missing in front of this segment, so none of the rest can be applied
+            for (first, path) in segments[i:]:
+                os.remove(path)
+            return
+
+        for (lsn, payload) in read_segment(path):
+            if lsn == expected:
+                yield (lsn, payload)
+                expected += 1
+
+class Journal(object):
+    '''
+    Append-only log of records, split over segment files that are named after the
+    lsn of their first record.
+
+    Appended records are buffered, and written to disk by sync(). Threads that sync
+    while a write is in progress wait for it, and find their records covered by the
+    next one, so that concurrent writers share fsyncs.
+    '''
+
+    def __init__(self, directory, lsn=1, segment_size=64 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+
+        # last lsn handed out, and last lsn on disk
+        self.appended = lsn - 1
+        self.synced = lsn - 1
+
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._open_segment(lsn)
+
+    def _open_segment(self, lsn):
+        self._file = open(os.path.join(self.directory, '%020d%s' % (lsn, SEGMENT)), 'ab')
+        fsync_directory(self.directory)
+
+    def append(self, payload):
+        ''' buffers a record, returns its lsn '''
+        with self._buffer_lock:
+            self.appended += 1
+            self._buffer.append(HEADER.pack(len(payload), checksum(payload), self.appended) + payload)
+            return self.appended
+
+    def _write(self):
+        ''' writes out the buffered records and waits for them to reach the disk '''
+        with self._buffer_lock:
+            (records, self._buffer) = (self._buffer, [])
+            lsn = self.appended
+
+        self._file.write(''.join(records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.synced = lsn
+
+    def sync(self, lsn=None):
+        ''' makes sure the records up to lsn (by default, all of them) are on disk '''
+        lsn = self.appended if lsn is None else lsn
+        if self.synced >= lsn:
+            return
+
+        with self._sync_lock:
+            if self.synced >= lsn:
+                return # written while we waited
+
+            self._write()
+            if self._file.tell() >= self.segment_size:
+                self._rotate()
+
+    def rotate(self):
+        ''' continues the log in a new segment '''
+        with self._sync_lock:
+            self._write()
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._open_segment(self.synced + 1)
+
+    def close(self):
+        with self._sync_lock:
+            if not self._file.closed:
+                self._write()
+                self._file.close()
+
+def durable(fn):
+    ''' syncs the journal once the decorated backend method is done '''
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            self._commit()
+    return wrapper
+
+class JournalBackend(MemoryBackend):
+    '''
+    Durable workflow backend that keeps its state in memory, and records every
+    operation on it in an append-only journal in the given directory. Backend
+    methods return once their records are on disk; records of concurrent calls
+    are written together.
+
+    Every snapshot_interval records, the state is written to a snapshot, and the
+    journal segments it covers are deleted (along with the finished processes
+    they describe). On start-up, the latest snapshot is loaded and only the
+    records that follow it are replayed.
+
+    The directory must not be shared with other backends.
+    '''
+
+    # attributes that are not part of the workflow state
+    TRANSIENT = ('_lock', '_work_available', '_sequence', 'sweep_interval', '_sweeper', '_stop_sweeper', 'columnar_history',
+        'directory', 'snapshot_interval', '_journal', '_replaying', '_snapshot_lsn', '_snapshot_lock')
+
+    def __init__(self, directory, snapshot_interval=10000, segment_size=64 * 1024 * 1024, sweep_interval=None,
+        columnar_history=False):
+        super(JournalBackend, self).__init__(columnar_history=columnar_history)
+
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_lock = threading.Lock()
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        lsn = self._recover()
+        self._journal = Journal(directory, lsn + 1, segment_size=segment_size)
+
+        self.sweep_interval = sweep_interval
+        if sweep_interval:
+            self._start_sweeper()
+
+    def _recover(self):
+        ''' loads the latest snapshot and replays the journal that follows it, returns the last lsn '''
+        lsn = 0
+        snapshots = list_files(self.directory, SNAPSHOT)
+        if snapshots:
+            (lsn, path) = snapshots[-1]
+            with open(path, 'rb') as f:
+                self._restore(pickle.load(f))
+        self._snapshot_lsn = lsn
+
+        self._replaying = True
+        for (lsn, payload) in read_log(self.directory, lsn):
+            (operation, args) = pickle.loads(payload)
+            try:
+                getattr(self, operation)(*args)
+            except Exception:
+                pass # it failed the same way when it was first applied
+        self._replaying = False
+
+        return lsn
+
+    def _state(self):
+        state = dict((k, v) for (k, v) in self.__dict__.iteritems() if not k in self.TRANSIENT)
+        state['_sequence'] = next(self._sequence)
+        self._sequence = count(state['_sequence'])
+        return state
+
+    def _restore(self, state):
+        self._sequence = count(state.pop('_sequence'))
+        self.__dict__.update(state)
+
+    def snapshot(self):
+        ''' writes the current state to disk, and drops the journal segments it covers '''
+        with self._snapshot_lock:
+            self._snapshot()
+
+    def _snapshot(self):
+        with self._lock:
+            lsn = self._journal.appended
+            state = pickle.dumps(self._state(), pickle.HIGHEST_PROTOCOL)
+
+        path = os.path.join(self.directory, '%020d%s' % (lsn, SNAPSHOT))
+        with open(path + '.tmp', 'wb') as f:
+            f.write(state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(path + '.tmp', path)
+        fsync_directory(self.directory)
+        self._snapshot_lsn = lsn
+
+        # from now on, recovery starts at this snapshot
+        self._journal.rotate()
+        for (first, old) in list_files(self.directory, SNAPSHOT):
+            if first < lsn:
+                os.remove(old)
+
+        segments = list_files(self.directory, SEGMENT)
+        for (i, (first, old)) in enumerate(segments[:-1]):
+            if segments[i + 1][0] <= lsn + 1:
+                os.remove(old)
+
+    def _record(self, operation, *args):
+        if not self._replaying:
+            self._journal.append(pickle.dumps((operation, args), pickle.HIGHEST_PROTOCOL))
+
+    def _commit(self):
+        self._journal.sync()
+
+        if self.snapshot_interval and self._journal.appended - self._snapshot_lsn >= self.snapshot_interval:
+            # one snapshot at a time is plenty
+            if self._snapshot_lock.acquire(False):
+                try:
+                    self._snapshot()
+                finally:
+                    self._snapshot_lock.release()
+
+    def close(self):
+        super(JournalBackend, self).close()
+        self._journal.close()
+
+    # operations are recorded before they are applied, so that one that fails
+    # halfway fails the same way on replay. time-outs and polls only change
+    # state if they found something, and are recorded only if they did. (time-outs
+    # found by the housekeeping thread are synced along with the next call; if
+    # they get lost, they are simply found again.)
+
+    def _set_workflow(self, name, config):
+        self._record('_set_workflow', name, config)
+        super(JournalBackend, self)._set_workflow(name, config)
+
+    def _set_activity(self, name, config):
+        self._record('_set_activity', name, config)
+        super(JournalBackend, self)._set_activity(name, config)
+
+    def _start_process(self, process, now):
+        self._record('_start_process', process, now)
+        super(JournalBackend, self)._start_process(process, now)
+
+    def _signal_process(self, process_id, signal, now):
+        self._record('_signal_process', process_id, signal, now)
+        super(JournalBackend, self)._signal_process(process_id, signal, now)
+
+    def _cancel_process(self, process_id, details, now):
+        self._record('_cancel_process', process_id, details, now)
+        super(JournalBackend, self)._cancel_process(process_id, details, now)
+
+    def _heartbeat(self, run_id, now):
+        self._record('_heartbeat', run_id, now)
+        super(JournalBackend, self)._heartbeat(run_id, now)
+
+    def _complete_decision(self, run_id, decisions, now, child_ids):
+        self._record('_complete_decision', run_id, decisions, now, child_ids)
+        super(JournalBackend, self)._complete_decision(run_id, decisions, now, child_ids)
+
+    def _complete_activity(self, run_id, result, now):
+        self._record('_complete_activity', run_id, result, now)
+        super(JournalBackend, self)._complete_activity(run_id, result, now)
+
+    def _time_out_activities(self, now):
+        timed_out = super(JournalBackend, self)._time_out_activities(now)
+        if timed_out:
+            self._record('_time_out_activities', now)
+        return timed_out
+
+    def _time_out_decisions(self, now):
+        timed_out = super(JournalBackend, self)._time_out_decisions(now)
+        if timed_out:
+            self._record('_time_out_decisions', now)
+        return timed_out
+
+    def _start_activity(self, category, now, run_id):
+        # queued activities may also time out on the way
+        queued = bool(self.scheduled_activities.get(category))
+        task = super(JournalBackend, self)._start_activity(category, now, run_id)
+        if queued:
+            self._record('_start_activity', category, now, run_id)
+        return task
+
+    def _start_decision(self, category, now, run_id):
+        task = super(JournalBackend, self)._start_decision(category, now, run_id)
+        if task:
+            self._record('_start_decision', category, now, run_id)
+        return task
+
+    # public api
+
+    @durable
+    def register_workflow(self, name, category=Defaults.DECISION_CATEGORY,
+        timeout=Defaults.WORKFLOW_TIMEOUT,
+        decision_timeout=Defaults.DECISION_TIMEOUT):
+        super(JournalBackend, self).register_workflow(name, category=category, timeout=timeout, decision_timeout=decision_timeout)
+
+    @durable
+    def register_activity(self, name, category=Defaults.ACTIVITY_CATEGORY,
+        scheduled_timeout=Defaults.ACTIVITY_SCHEDULED_TIMEOUT,
+        execution_timeout=Defaults.ACTIVITY_EXECUTION_TIMEOUT,
+        heartbeat_timeout=Defaults.ACTIVITY_HEARTBEAT_TIMEOUT):
+        super(JournalBackend, self).register_activity(name, category=category, scheduled_timeout=scheduled_timeout,
+            execution_timeout=execution_timeout, heartbeat_timeout=heartbeat_timeout)
+
+    @durable
+    def start_process(self, process):
+        return super(JournalBackend, self).start_process(process)
+
+    @durable
+    def signal_process(self, process_id, signal, data=None):
+        super(JournalBackend, self).signal_process(process_id, signal, data=data)
+
+    @durable
+    def cancel_process(self, process_id, details=None):
+        super(JournalBackend, self).cancel_process(process_id, details=details)
+
+    @durable
+    def heartbeat_activity_task(self, task):
+        super(JournalBackend, self).heartbeat_activity_task(task)
+
+    @durable
+    def complete_decision_task(self, task, decisions):
+        super(JournalBackend, self).complete_decision_task(task, decisions)
+
+    @durable
+    def complete_activity_task(self, task, result=None):
+        super(JournalBackend, self).complete_activity_task(task, result=result)
+
+    @durable
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        return super(JournalBackend, self).poll_activity_task(category=category, identity=identity, timeout=timeout)
+
+    @durable
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        return super(JournalBackend, self).poll_decision_task(category=category, identity=identity, timeout=timeout)
+
+    @durable
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return super(JournalBackend, self).poll_activity_tasks(category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    @durable
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return super(JournalBackend, self).poll_decision_tasks(category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    @durable
+    def complete_decision_tasks(self, completions):
+        return super(JournalBackend, self).complete_decision_tasks(completions)
+
+    @durable
+    def complete_activity_tasks(self, completions):
+        return super(JournalBackend, self).complete_activity_tasks(completions)
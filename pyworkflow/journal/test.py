@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..test import WorkflowBackendTestCase
+from ..process import Process
+from ..decision import ScheduleActivity
+from ..activity import ActivityCompleted
+from backend import JournalBackend, list_files, SEGMENT, SNAPSHOT
+
+class JournalBackendTestCase(WorkflowBackendTestCase):
+    def setUp(self):
+        super(JournalBackendTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.backend = JournalBackend(self.directory)
+
+    def tearDown(self):
+        super(JournalBackendTestCase, self).tearDown()
+        self.backend.close()
+        shutil.rmtree(self.directory)
+
+    def construct_backend(self):
+        return self.backend
+
+    def reopen(self, **kwargs):
+        self.backend.close()
+        self.backend = JournalBackend(self.directory, **kwargs)
+        return self.backend
+
+    def test_basic(self):
+        self.subtest_basic()
+
+    def test_managed(self):
+        self.subtest_managed()
+
+    def test_activity_ids(self):
+        self.subtest_activity_ids()
+
+    def test_cancel_while_deciding(self):
+        self.subtest_cancel_while_deciding()
+
+    def test_batch(self):
+        self.subtest_batch()
+
+    def test_timeouts(self):
+        self.subtest_timeouts()
+
+    def test_order(self):
+        self.subtest_order()
+
+    def test_threads(self):
+        self.subtest_threads()
+
+    def test_timer(self):
+        self.subtest_timer()
+
+    def test_query(self):
+        self.subtest_query()
+
+    def test_history_page(self):
+        self.subtest_history_page()
+
+    def test_recovery(self):
+        backend = self.reopen(snapshot_interval=5)
+        backend.register_workflow('test')
+        backend.register_activity('double')
+
+        pids = [backend.start_process(Process(workflow='test', input=i, tags=['foo'])) for i in range(3)]
+        task = backend.poll_decision_task()
+        backend.complete_decision_task(task, ScheduleActivity('double', id='1', input=2))
+        activity = backend.poll_activity_task()
+        backend.signal_process(pids[2], 'bar')
+
+        # snapshots replaced the segments they cover
+        assert len(list_files(self.directory, SNAPSHOT)) == 1
+        assert len(list_files(self.directory, SEGMENT)) <= 2
+
+        histories = dict((pid, backend.process_by_id(pid).history) for pid in pids)
+        backend = self.reopen()
+        for pid in pids:
+            assert backend.process_by_id(pid).history == histories[pid]
+        assert backend.processes(tag='foo') == [backend.process_by_id(pid) for pid in pids]
+
+        # tasks handed out before the restart can still be completed
+        backend.complete_activity_task(activity, ActivityCompleted(4))
+        tasks = [backend.poll_decision_task() for pid in pids]
+        task = [t for t in tasks if t.process.id == activity.process_id][0]
+        assert task.process.history[-2].result == ActivityCompleted(4)
+
+        # a record that was only partially written is dropped
+        backend.close()
+        (lsn, path) = list_files(self.directory, SEGMENT)[-1]
+        size = os.path.getsize(path)
+        with open(path, 'ab') as f:
+            f.write('\x00\x00\x01')
+        backend = self.reopen()
+        assert backend.process_by_id(task.process.id).history == task.process.history
+        assert os.path.getsize(path) == size
+
+    def test_batch_recovery(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+        backend.register_activity('double')
+
+        pids = [backend.start_process(Process(workflow='test', input=i)) for i in range(3)]
+        tasks = backend.poll_decision_tasks(max_tasks=3)
+        assert backend.complete_decision_tasks([(t, ScheduleActivity('double', id='1', input=t.process.input)) for t in tasks]) == [None] * 3
+        tasks = backend.poll_activity_tasks(max_tasks=2)
+        assert backend.complete_activity_tasks([(t, ActivityCompleted(t.activity_execution.input * 2)) for t in tasks]) == [None] * 2
+
+        # batches are on disk once their calls return, without the backend being closed
+        histories = dict((pid, backend.process_by_id(pid).history) for pid in pids)
+        copy = tempfile.mkdtemp()
+        try:
+            os.rmdir(copy)
+            shutil.copytree(self.directory, copy)
+            recovered = JournalBackend(copy)
+            for pid in pids:
+                assert recovered.process_by_id(pid).history == histories[pid]
+            assert len(recovered.poll_decision_tasks(max_tasks=3)) == 2 and len(recovered.poll_activity_tasks(max_tasks=3)) == 1
+            recovered.close()
+        finally:
+            shutil.rmtree(copy)
@@ -1,5 +1,6 @@
 from ..util import classproperty
 from ..defaults import Defaults
+from ..blob import resolve
 
 class Activity(object):
     '''
@@ -8,6 +9,8 @@ class Activity(object):
 
     Pretty much independent from any other workflow classes, except an ActivityMonitor
     can be supplied to allow communication with the invoker (e.g. heartbeats).
+
+    For an AsyncActivityWorker (see pyworkflow.aio), execute can be a coroutine.
     '''
 
     scheduled_timeout = Defaults.ACTIVITY_SCHEDULED_TIMEOUT
@@ -35,7 +38,8 @@ class Activity(object):
 
     @property
     def input(self):
-        return self._task.activity_execution.input
+        # payloads kept in a BlobStore are loaded once they're asked for
+        return resolve(self._task.activity_execution.input)
 
     @property
     def task(self):
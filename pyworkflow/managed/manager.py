@@ -15,10 +15,18 @@ class Manager(object):
     # Find the process
     mgr.processes(workflow=FooWorkflow, tag="foo")
 
+    # Count and page through processes, without loading their history
+    mgr.count_processes(tag="foo")
+    mgr.processes(tag="foo", offset=100, limit=50, summary=True)
+
     # Query an activity, execute and commit result
     task = mgr.next()
     result = activity(task)
     mgr.complete_task(task, result)
+
+    # Or a number of them at once
+    tasks = mgr.next_activities(10)
+    mgr.complete_tasks([(task, activity(task)) for task in tasks])
     """
 
     def __init__(self, backend, workflows=[]):
@@ -67,25 +75,41 @@ class Manager(object):
     def process_by_id(self, process_id):
         return self._backend.process_by_id(process_id)
 
-    def processes(self, workflow=None, tag=None):
-        workflow_name = None
+    def _workflow_name(self, workflow):
         if workflow:
-            workflow_name = workflow.name if hasattr(workflow, 'name') else str(workflow)
-        
+            return workflow.name if hasattr(workflow, 'name') else str(workflow)
+
+    def processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        workflow_name = self._workflow_name(workflow)
+
+        if offset or limit is not None or summary:
+            return self._backend.query_processes(workflow=workflow_name, tag=tag, offset=offset, limit=limit, summary=summary)
         return self._backend.processes(workflow=workflow_name, tag=tag)
 
-    def next_decision(self, identity=None, category=Defaults.DECISION_CATEGORY):
-        return self._backend.poll_decision_task(identity=identity, category=category)
+    def count_processes(self, workflow=None, tag=None):
+        return self._backend.count_processes(workflow=self._workflow_name(workflow), tag=tag)
+
+    def next_decision(self, identity=None, category=Defaults.DECISION_CATEGORY, timeout=None):
+        return self._backend.poll_decision_task(identity=identity, category=category, timeout=timeout)
 
-    def next_activity(self, identity=None, category=Defaults.ACTIVITY_CATEGORY):
-        return self._backend.poll_activity_task(identity=identity, category=category)
+    def next_activity(self, identity=None, category=Defaults.ACTIVITY_CATEGORY, timeout=None):
+        return self._backend.poll_activity_task(identity=identity, category=category, timeout=timeout)
+
+    def next_decisions(self, max_tasks, identity=None, category=Defaults.DECISION_CATEGORY, timeout=None):
+        return self._backend.poll_decision_tasks(category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    def next_activities(self, max_tasks, identity=None, category=Defaults.ACTIVITY_CATEGORY, timeout=None):
+        return self._backend.poll_activity_tasks(category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
 
     def workflow_for_task(self, task):
         workflow_cls = self._workflows[task.process.workflow]
         return workflow_cls()
 
+    def activity_class_for_task(self, task):
+        return self._activities[task.activity_execution.activity]
+
     def activity_for_task(self, task, monitor=None):
-        activity_cls = self._activities[task.activity_execution.activity]
+        activity_cls = self.activity_class_for_task(task)
         return activity_cls(task=task, monitor=monitor)
 
     def complete_task(self, task, result):
@@ -96,6 +120,28 @@ class Manager(object):
         else:
             raise ValueError('unsupported task type')
 
+    def complete_tasks(self, completions):
+        '''
+        Completes a number of (task, result) pairs, with a call to the backend for the
+        decision tasks and one for the activity tasks. Returns None for each task that
+        was completed and the exception for each that couldn't be, in order.
+        '''
+        results = [None] * len(completions)
+        for (indices, complete, batch) in self._batches(completions):
+            for (i, result) in zip(indices, complete(batch)):
+                results[i] = result
+        return results
+
+    def _batches(self, completions):
+        ''' the positions of the decision and of the activity completions, with the backend method for each and the completions '''
+        decisions = [i for (i, (task, result)) in enumerate(completions) if isinstance(task, DecisionTask)]
+        activities = [i for (i, (task, result)) in enumerate(completions) if isinstance(task, ActivityTask)]
+        if len(decisions) + len(activities) < len(completions):
+            raise ValueError('unsupported task type')
+
+        return [(indices, complete, [completions[i] for i in indices])
+            for (indices, complete) in ((decisions, self._backend.complete_decision_tasks), (activities, self._backend.complete_activity_tasks)) if indices]
+
     def copy_with_backend(self, backend):
         return Manager(backend, self._workflows.values())
 
@@ -1,3 +1,4 @@
 from activity import ActivityWorker
 from decision import DecisionWorker
-from thread import WorkerThread
\ No newline at end of file
+from thread import WorkerThread
+from pool import WorkerPool
\ No newline at end of file
@@ -1,39 +1,141 @@
+import threading
 import traceback
+import multiprocessing
 from uuid import uuid4
 from ...activity import ActivityResult, ActivityCompleted, ActivityCanceled, ActivityFailed
 from ..activity import ActivityMonitor
 from ...defaults import Defaults
 
+def result_of(activity, value):
+    ''' the result of an activity whose execution returned value, None if it completes by itself '''
+    if isinstance(value, ActivityResult):
+        return value
+    elif activity.auto_complete:
+        return ActivityCompleted(value)
+
+def failure(e):
+    ''' the result of an activity whose execution raised e '''
+    if isinstance(e, (ActivityCanceled, ActivityFailed)):
+        return e
+    return ActivityFailed(str(e), traceback.format_exc())
+
+def execute(activity):
+    try:
+        return result_of(activity, activity.execute())
+    except Exception, e:
+        return failure(e)
+
+# in pool processes, the queue heartbeats are relayed to the worker through
+_heartbeats = None
+
+def _initialize_pool_process(heartbeats):
+    global _heartbeats
+    _heartbeats = heartbeats
+
+def _execute_in_pool(activity_cls, task, key, blob_store=None):
+    monitor = ActivityMonitor(lambda: _heartbeats.put((key, False)))
+    try:
+        result = execute(activity_cls(task=task, monitor=monitor))
+
+        # large results are handed back through the store rather than the pool's pipe
+        if blob_store and isinstance(result, ActivityCompleted):
+            result = ActivityCompleted(blob_store.externalize(result.result))
+        return result
+    finally:
+        # queued behind the task's heartbeats, which are relayed until the relay gets here
+        _heartbeats.put((key, True))
+
 class ActivityWorker(object):
     """
     Executes activities provided by the WorkflowManager
+
+    With processes set, activities are executed in a pool of that many processes,
+    so CPU-bound ones don't contend for the interpreter lock. Their heartbeats are
+    relayed to the manager, and tasks are completed from this process. Activity
+    classes must then be picklable. With a blob_store as well, results of its
+    threshold size or more come back as a PayloadRef to the mapped file rather
+    than pickled through the pool, which suits a BlobBackend with the same store.
+
+    With batch_size set, each step polls for up to that many tasks at once, executes
+    them and completes them together. Without processes they're executed in turn,
+    and wait for each other, which pays off for short activities, where the calls
+    to the backend dominate. With processes the whole batch executes in the pool at
+    once.
     """
 
-    def __init__(self, manager, name=None, category=Defaults.ACTIVITY_CATEGORY):
+    def __init__(self, manager, name=None, category=Defaults.ACTIVITY_CATEGORY, processes=None, blob_store=None, batch_size=1):
         self.manager = manager
         self.name = name or str(uuid4())
         self.category = category
+        self.batch_size = batch_size
+        self.processes = processes
+        self.blob_store = blob_store
+
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # tasks executing in the pool by key, for heartbeats to be relayed for
+        self._pool_tasks = {}
 
     def monitor_for_task(self, task):
         heartbeat_fn = lambda: self.manager.heartbeat(task)
         return ActivityMonitor(heartbeat_fn)
 
     def execute_activity(self, activity):
-        try:
-            result = activity.execute()
+        return execute(activity)
+
+    def _start_pool(self):
+        with self._pool_lock:
+            if not self._pool:
+                self._heartbeats = multiprocessing.Queue()
+                self._pool = multiprocessing.Pool(self.processes, _initialize_pool_process, (self._heartbeats,))
+
+                relay = threading.Thread(target=self._relay_heartbeats, args=(self._heartbeats,))
+                relay.daemon = True
+                relay.start()
+        return self._pool
 
-            if isinstance(result, ActivityResult):
-                return result
-            elif activity.auto_complete:
-                return ActivityCompleted(result)
+    def _relay_heartbeats(self, heartbeats):
+        for (key, done) in iter(heartbeats.get, None):
+            if done:
+                self._pool_tasks.pop(key, None)
+                continue
 
-        except ActivityCanceled, a:
-            return a
-        except ActivityFailed, f:
-            return f
+            task = self._pool_tasks.get(key)
+            if task:
+                try:
+                    self.manager.heartbeat(task)
+                except Exception:
+                    pass # the task will time out
+
+    def _submit_to_pool(self, task):
+        ''' starts executing a task in the pool, returns its key and pending result '''
+        pool = self._start_pool()
+        key = str(uuid4())
+        activity_cls = self.manager.activity_class_for_task(task)
+
+        # forgotten by the relay once the task's last heartbeat is relayed
+        self._pool_tasks[key] = task
+        return (key, pool.apply_async(_execute_in_pool, (activity_cls, task, key, self.blob_store)))
+
+    def _pool_result(self, key, pending):
+        try:
+            return pending.get()
         except Exception, e:
+            self._pool_tasks.pop(key, None)
             return ActivityFailed(str(e), traceback.format_exc())
 
+    def execute_in_pool(self, task):
+        return self._pool_result(*self._submit_to_pool(task))
+
+    def close(self):
+        ''' stops the pool of processes, if any '''
+        with self._pool_lock:
+            if self._pool:
+                self._pool.terminate()
+                self._pool.join()
+                self._heartbeats.put(None)
+                self._pool = None
+
     def _log_msg(self, head, task, result=None, include_task=False):
         activity = task.activity_execution.activity
         task_id = task.activity_execution.id
@@ -57,27 +159,61 @@ class ActivityWorker(object):
         elif result is None:
             logger.info(self._log_msg('Handed off', task, result))
         
-    def step(self, logger=None):
+    def step(self, logger=None, timeout=None):
         # Rely on the backend poll to be blocking
-        task = self.manager.next_activity(identity=self.name, category=self.category)
-        if task:
+        tasks = self.manager.next_activities(self.batch_size, identity=self.name, category=self.category, timeout=timeout)
+        if tasks:
+            self.complete_tasks(zip(tasks, self.results_for_tasks(tasks, logger=logger)), logger=logger)
+            return True
+
+    def result_for_task(self, task, logger=None):
+        ''' executes the activity of a task that was polled for, returns its result '''
+        if logger:
+            logger.info(self._log_msg('Starting', task, None, include_task=True))
+        try:
+            if self.processes:
+                return self.execute_in_pool(task)
+            activity = self.manager.activity_for_task(task, monitor=self.monitor_for_task(task))
+            return self.execute_activity(activity)
+        except Exception, e:
+            if logger:
+                logger.info(self._log_msg('Error in', task, str(e), include_task=True))
+
+    def results_for_tasks(self, tasks, logger=None):
+        ''' executes the activities of tasks that were polled for, all at once in the pool if any, returns their results '''
+        if not self.processes or len(tasks) < 2:
+            return [self.result_for_task(task, logger=logger) for task in tasks]
+
+        submitted = []
+        for task in tasks:
             if logger:
                 logger.info(self._log_msg('Starting', task, None, include_task=True))
             try:
-                activity = self.manager.activity_for_task(task, monitor=self.monitor_for_task(task))
-                result = self.execute_activity(activity)
+                submitted.append(self._submit_to_pool(task))
+            except Exception, e:
+                submitted.append(None)
+                if logger:
+                    logger.info(self._log_msg('Error in', task, str(e), include_task=True))
+        return [self._pool_result(*pending) if pending else None for pending in submitted]
 
-                if result:
-                    self.manager.complete_task(task, result)
+    def complete_tasks(self, completions, logger=None):
+        ''' completes (task, result) pairs in one call to the manager, leaving those without a result '''
+        completed = [(task, result) for (task, result) in completions if result]
+        try:
+            errors = iter(self.manager.complete_tasks(completed) if completed else [])
+        except Exception, e:
+            errors = iter([e] * len(completed))
 
-            except Exception, e:
-                logger.info(self._log_msg('Error in', task, str(e), include_task=True))
-                return True # we consumed a task
-            
-            if logger:
-                self.log_result(task, result, logger)            
+        for (task, result) in completions:
+            error = next(errors) if result else None
+            if error and logger:
+                logger.info(self._log_msg('Error in', task, str(error), include_task=True))
+            elif logger:
+                self.log_result(task, result, logger)
 
-            return True
+    def execute_task(self, task, logger=None):
+        ''' executes the activity of a task that was polled for, and completes the task '''
+        self.complete_tasks([(task, self.result_for_task(task, logger=logger))], logger=logger)
 
     def __repr__(self):
         return 'ActivityWorker(%s, %s, %s)' % (self.manager, self.name, self.category)
\ No newline at end of file
@@ -6,12 +6,16 @@ from ...defaults import Defaults
 class DecisionWorker(object):
     """
     Make decisions provided by the WorkflowManager
+
+    With batch_size set, each step polls for up to that many decision tasks at once,
+    and completes them together once they've all been decided.
     """
 
-    def __init__(self, manager, name=None, category=Defaults.DECISION_CATEGORY):
+    def __init__(self, manager, name=None, category=Defaults.DECISION_CATEGORY, batch_size=1):
         self.manager = manager
         self.name = name or str(uuid4())
         self.category = category
+        self.batch_size = batch_size
 
     def decide(self, task, workflow):
         decisions = workflow.decide(task.process)
@@ -43,25 +47,33 @@ class DecisionWorker(object):
 
         return msg
 
-    def step(self, logger=None):
-        task = self.manager.next_decision(category=self.category, identity=self.name)
-        if task:
+    def step(self, logger=None, timeout=None):
+        tasks = self.manager.next_decisions(self.batch_size, category=self.category, identity=self.name, timeout=timeout)
+        if not tasks:
+            return None
+
+        completions = []
+        for task in tasks:
             if logger:
                 logger.info(self._log_msg("Starting", task, None, include_task=True))
-
-            workflow = self.manager.workflow_for_task(task)
-            decisions = None
             try:
-                decisions = self.decide(task, workflow)
-                self.manager.complete_task(task, decisions)
+                completions.append((task, self.decide(task, self.manager.workflow_for_task(task))))
             except Exception, e:
-                logger.exception(self._log_msg("Error in", task, 'Exception: %s\nDecisions: %s' % (str(e), str(decisions)), include_task=True))
-                return True # we consumed a task
-            
-            if logger:
+                if logger:
+                    logger.exception(self._log_msg("Error in", task, 'Exception: %s' % str(e), include_task=True))
+
+        try:
+            errors = self.manager.complete_tasks(completions) if completions else []
+        except Exception, e:
+            errors = [e] * len(completions)
+
+        for ((task, decisions), error) in zip(completions, errors):
+            if error and logger:
+                logger.error(self._log_msg("Error in", task, 'Exception: %s\nDecisions: %s' % (str(error), str(decisions)), include_task=True))
+            elif logger:
                 logger.info(self._log_msg("Completed", task, decisions))
 
-            return True # we consumed a task
+        return True # we consumed a task
 
     def __repr__(self):
         return 'DecisionWorker(%s, %s, %s)' % (self.manager, self.name, self.category)
\ No newline at end of file
@@ -0,0 +1,147 @@
+import threading
+import logging
+from Queue import Queue
+
+class WorkerPool(threading.Thread):
+    '''
+    Thread that executes an activity worker's tasks in a pool of size threads.
+
+    Tasks are only polled for when threads are free to execute them, as many at
+    once as there are free threads, so tasks never wait here while their execution
+    timeout runs. Executed tasks are completed together by one more thread, as many
+    as have finished since it last completed some. poll_timeout and delay_on_idle
+    are as for WorkerThread.
+
+    pool = WorkerPool(ActivityWorker(manager), size=32, poll_timeout=20)
+    pool.start()
+    '''
+
+    def __init__(self, worker, size, logger=None, delay_on_idle=1, poll_timeout=None):
+        super(WorkerPool, self).__init__()
+
+        self.size = size
+        self.delay_on_idle = delay_on_idle
+        self.poll_timeout = poll_timeout
+
+        # Internal events
+        self.stop = threading.Event()
+
+        # Our functional actors
+        self.worker = worker
+        self.logger = logger or logging.getLogger('workflow')
+
+        self._idle = size
+        self._polling = 0
+        self._slot_freed = threading.Condition()
+        self._tasks = Queue()
+        self._completions = Queue()
+        self._threads = []
+
+    @property
+    def idle(self):
+        ''' the number of threads free to execute a task '''
+        return self._idle
+
+    @property
+    def polling(self):
+        ''' the number of threads held for the poll under way '''
+        return self._polling
+
+    @property
+    def in_flight(self):
+        ''' the number of tasks polled for and not yet completed '''
+        return self.size - self._idle - self._polling
+
+    def _claim_slots(self):
+        ''' waits for free threads and claims them all for a poll, returns how many (none once the pool is stopped) '''
+        with self._slot_freed:
+            while not self.stop.isSet():
+                if self._idle:
+                    (self._polling, self._idle) = (self._idle, 0)
+                    return self._polling
+                self._slot_freed.wait(self.delay_on_idle)
+            return 0
+
+    def _free_slots(self, count, polled=False):
+        with self._slot_freed:
+            if polled:
+                self._polling = 0
+            self._idle += count
+            self._slot_freed.notify()
+
+    def _execute(self):
+        for task in iter(self._tasks.get, None):
+            result = None
+            try:
+                result = self.worker.result_for_task(task, logger=self.logger)
+            except Exception, e:
+                self.logger.exception("Worker %s encountered error while executing a task" % (self.worker))
+            finally:
+                self._completions.put((task, result))
+
+    def _complete(self):
+        for completion in iter(self._completions.get, None):
+            completions = [completion]
+            while not self._completions.empty():
+                completions.append(self._completions.get())
+            if completions[-1] is None:
+                self._completions.put(None)
+                completions.pop()
+
+            try:
+                self.worker.complete_tasks(completions, logger=self.logger)
+            except Exception, e:
+                self.logger.exception("Worker %s encountered error while completing tasks" % (self.worker))
+            finally:
+                self._free_slots(len(completions))
+
+    def run(self):
+        self.logger.info("Worker pool started: %s" % (self.worker))
+
+        self._threads = [threading.Thread(target=self._execute) for _ in range(self.size)]
+        completer = threading.Thread(target=self._complete)
+        for thread in self._threads + [completer]:
+            thread.daemon = True
+            thread.start()
+
+        while True:
+            claimed = self._claim_slots()
+            if not claimed:
+                break
+
+            (tasks, failed) = ([], False)
+            try:
+                tasks = self.worker.manager.next_activities(claimed, identity=self.worker.name, category=self.worker.category, timeout=self.poll_timeout)
+            except Exception, e:
+                self.logger.exception("Worker %s encountered error while polling" % (self.worker))
+                failed = True
+
+            for task in tasks:
+                self._tasks.put(task)
+            self._free_slots(claimed - len(tasks), polled=True)
+
+            # back off before polling again, rather than retrying a failing backend right away
+            if failed or (not tasks and not self.poll_timeout):
+                self.stop.wait(self.delay_on_idle)
+
+            if self.stop.isSet():
+                break
+
+        # let the tasks being executed finish, and be completed
+        for thread in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._completions.put(None)
+        completer.join()
+
+        self.logger.info("Worker pool finished: %s" % (self.worker))
+
+    def join(self, timeout=None):
+        self.stop.set()
+        with self._slot_freed:
+            self._slot_freed.notify_all()
+        super(WorkerPool, self).join(timeout)
+
+    def __repr__(self):
+        return 'WorkerPool(%s, %s)' % (self.worker, self.size)
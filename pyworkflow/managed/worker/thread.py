@@ -1,18 +1,23 @@
 import threading
 import logging
 import traceback
-from time import sleep
+from time import sleep, time
 
 class WorkerThread(threading.Thread):
     '''
     Thread that repeatedly runs a decider/activity worker.
     Inherent isolated state contained in this class.
+
+    If poll_timeout is given, the worker long-polls the backend for that many
+    seconds instead of sleeping delay_on_idle between empty polls. Polls that
+    come back empty sooner, or fail, are still followed by delay_on_idle.
     '''
 
-    def __init__(self, worker, logger=None, delay_on_idle=1):
+    def __init__(self, worker, logger=None, delay_on_idle=1, poll_timeout=None):
         super(WorkerThread, self).__init__()
 
         self.delay_on_idle = delay_on_idle
+        self.poll_timeout = poll_timeout
 
         # Internal events
         self.stop = threading.Event()
@@ -25,11 +30,16 @@ class WorkerThread(threading.Thread):
         self.logger.info("Worker started: %s" % (self.worker))
 
         while not self.stop.isSet():
+            started = time()
             try:
-                if not self.worker.step(logger=self.logger):
-                    sleep(self.delay_on_idle)
+                if self.worker.step(logger=self.logger, timeout=self.poll_timeout):
+                    continue
+                # a backend that doesn't wait out the timeout would have us spin
+                if self.poll_timeout and time() - started >= self.poll_timeout:
+                    continue
             except Exception, e:
                 self.logger.exception("Worker %s encountered error while performing step" % (self.worker))
+            sleep(self.delay_on_idle)
 
         self.logger.info("Worker finished: %s" % (self.worker))
 
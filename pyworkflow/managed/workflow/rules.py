@@ -1,14 +1,32 @@
+from itertools import count
+
 class RuleDoesNotApplyException(Exception):
     pass
 
+# rules are applied in the order they were created, that is as they're defined
+_rule_order = count()
+
 class Rule(object):
-    def __init__(self, match, handler):
+    '''
+    A handler for the events that match. The type of event and name of the activity
+    the rule is for, if it's only for one, let a workflow skip it for other events
+    without matching.
+    '''
+    def __init__(self, match, handler, event_type=None, activity=None):
         self._match = match
         self._handler = handler
+        self.event_type = event_type
+        self.activity = activity
+        self.order = next(_rule_order)
 
     def match(self, ev):
         return self._match(ev)
 
+    def apply(self, instance, event, process):
+        ''' the decisions of the handler if the event matches, otherwise None '''
+        if self.match(event):
+            return self._handler(instance, event, process)
+
     def __call__(self, instance, event, process):
         if not self.match(event):
             raise RuleDoesNotApplyException()
@@ -26,19 +44,21 @@ def match_exact_or_filter(value, match_val):
         return True
 
     if hasattr(match_val, '__call__'):
-        # is function, treat as filter
-        try:
-            return match_val(value)
-        except:
-            return False
+        # is function, treat as filter. errors it raises are the decider's to report
+        return match_val(value)
     else:
         # no function, do direct comparison
         return value == match_val
 
-def rule(match):
+def exact(match_val):
+    """ match_val if it is a value to compare to directly rather than a filter, otherwise None """
+    if match_val and not hasattr(match_val, '__call__'):
+        return match_val
+
+def rule(match, event_type=None, activity=None):
     """Decorator that creates a Rule out of the decorated function"""
     def decorator(handler_fn):
-        return Rule(match, handler_fn)
+        return Rule(match, handler_fn, event_type=event_type, activity=activity)
     return decorator
 
 def process_started(*args):
@@ -47,10 +67,10 @@ def process_started(*args):
     
     if len(args) and hasattr(args[0], '__call__'):
         # called without params, fn supplied as arg
-        return Rule(match, args[0])
+        return Rule(match, args[0], event_type='process_started')
     else:
         # called with params, need to return decorator
-        return rule(match)
+        return rule(match, event_type='process_started')
 
 def completed_activity(activity=None, input=None):
     def match(ev):
@@ -59,7 +79,7 @@ def completed_activity(activity=None, input=None):
         m = m and match_exact_or_filter(ev.activity_execution.activity, activity)
         m = m and match_exact_or_filter(ev.activity_execution.input, input)
         return m
-    return rule(match)
+    return rule(match, event_type='activity', activity=exact(activity))
 
 def interrupted_activity(activity=None, result=None):
     def match(ev):
@@ -68,7 +88,7 @@ def interrupted_activity(activity=None, result=None):
         m = m and match_exact_or_filter(ev.activity_execution.activity, activity)
         m = m and match_exact_or_filter(ev.result, result)
         return m
-    return rule(match)
+    return rule(match, event_type='activity', activity=exact(activity))
 
 def signal(name=None):
     def match(ev):
@@ -76,7 +96,7 @@ def signal(name=None):
         m = ev.type == 'signal'
         m = m and match_exact_or_filter(ev.signal.name, name)
         return m
-    return rule(match)
+    return rule(match, event_type='signal')
 
 def timer(data=None):
     def match(ev):
@@ -84,7 +104,7 @@ def timer(data=None):
         m = ev.type == 'timer'
         m = m and match_exact_or_filter(ev.timer.data, data)
         return m
-    return rule(match)
+    return rule(match, event_type='timer')
 
 def child_process_completed(workflow=None, tags=None, has_tag=None, result=None):
     def match(ev):
@@ -95,4 +115,4 @@ def child_process_completed(workflow=None, tags=None, has_tag=None, result=None)
         m = m and match_exact_or_filter(ev.result, result)
         m = m and (not has_tag or has_tag in ev.tags)
         return m
-    return rule(match)
\ No newline at end of file
+    return rule(match, event_type='child_process')
\ No newline at end of file
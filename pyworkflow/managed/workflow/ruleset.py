@@ -1,8 +1,36 @@
-from rules import RuleDoesNotApplyException
 from utils import unique, flatten, ensure_iter
 from base import Workflow
 
 
+class RuleDispatch(object):
+    '''
+    The rules of a workflow by the type of event and the name of the activity they're
+    for, so that an event is only matched against the rules that could apply to it.
+    '''
+
+    def __init__(self, ruleset):
+        key = lambda rule: (getattr(rule, 'event_type', None), getattr(rule, 'activity', None))
+        keys = set(key(rule) for rule in ruleset)
+
+        def candidates(event_type, activity):
+            return [rule for rule in ruleset if key(rule)[0] in (None, event_type) and key(rule)[1] in (None, activity)]
+
+        self._any = candidates(None, None)
+        self._table = {}
+        for (event_type, activity) in keys:
+            if event_type is not None:
+                self._table[(event_type, None)] = candidates(event_type, None)
+                self._table[(event_type, activity)] = candidates(event_type, activity)
+
+    def rules_for(self, event):
+        ''' the rules that could apply to an event, in order '''
+        activity = event.activity_execution.activity if event.type == 'activity' else None
+        rules = self._table.get((event.type, activity))
+        if rules is None:
+            rules = self._table.get((event.type, None), self._any)
+        return rules
+
+
 class RuleSetMetaclass(type):
     def __init__(cls, name, bases, attrs):
         super(RuleSetMetaclass, cls).__init__(name, bases, attrs)
@@ -10,28 +38,32 @@ class RuleSetMetaclass(type):
 
     def _initialize_rules(cls, name, bases, attrs):
         is_rule = lambda p: hasattr(p, 'match')
-        cls.ruleset = [a for a in attrs.values() if is_rule(a)]
+
+        # rules defined by base classes apply as well, unless they're redefined
+        rules = {}
+        for c in reversed(cls.__mro__):
+            for (attr, value) in c.__dict__.iteritems():
+                if is_rule(value):
+                    rules[attr] = value
+                else:
+                    rules.pop(attr, None)
+
+        cls.ruleset = sorted(rules.values(), key=lambda rule: getattr(rule, 'order', 0))
+        cls.rule_dispatch = RuleDispatch(cls.ruleset)
 
 
 class RuleSetWorkflow(Workflow):
     __metaclass__ = RuleSetMetaclass
 
     def handle_event(self, event, process):
-        def decisions_from_rule(rule):
-            try:
-                decisions = rule(self, event, process)
-                if decisions:
-                    return ensure_iter(decisions)
-                else:
-                    return None
-            except RuleDoesNotApplyException:
-                return None
-
-        decisions = [decisions_from_rule(rule) for rule in self.ruleset]
-        decisions = filter(lambda d: d is not None, decisions) # ignore null-decisions
+        decisions = []
+        for rule in self.rule_dispatch.rules_for(event):
+            rule_decisions = rule.apply(self, event, process)
+            if rule_decisions:
+                decisions.append(ensure_iter(rule_decisions))
         return flatten(decisions)
 
     def decide(self, process):
         handler = lambda ev: filter(bool, self.handle_event(ev, process))
         decisions = map(handler, process.unseen_events()) # list of lists of decisions
-        return unique(flatten(decisions))
\ No newline at end of file
+        return unique(flatten(decisions))
@@ -1,4 +1,5 @@
 import itertools
+from ...util import fingerprint
 
 def ensure_iter(obj):
     return obj if hasattr(obj, '__iter__') else [obj]
@@ -7,4 +8,13 @@ def flatten(list_of_lists):
     return itertools.chain(*list_of_lists)
 
 def unique(col):
-    return reduce(lambda acc, x: acc+[x] if not x in acc else acc, col, [])
+    ''' the items of col without repeats, in order of their first occurrence '''
+    seen = set()
+    items = []
+    for x in col:
+        # fingerprints are hashable even when x, or what it carries, isn't
+        key = fingerprint(x)
+        if not key in seen:
+            seen.add(key)
+            items.append(x)
+    return items
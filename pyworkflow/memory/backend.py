@@ -1,6 +1,9 @@
-from itertools import ifilter
-from collections import deque
+import threading
+from heapq import heappush, heappop, heapify
+from itertools import count, islice
+from collections import deque, OrderedDict
 from datetime import datetime, timedelta
+from functools import wraps
 from uuid import uuid4
 
 from ..backend import Backend
@@ -10,305 +13,680 @@ from ..events import *
 from ..decision import *
 from ..task import *
 from ..process import *
+from ..history import ColumnarHistory
 from ..signal import *
 from ..defaults import Defaults
 
+def synchronized(fn):
+    ''' runs the decorated backend method while holding the backend lock '''
+    @wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return fn(self, *args, **kwargs)
+    return wrapper
+
 class MemoryBackend(Backend):
     '''
-    Non-thread-safe in-memory workflow backend. Primarily for testing purposes.
+    Thread-safe in-memory workflow backend. Primarily for testing purposes.
+
+    All state is guarded by a single re-entrant lock. Polls can be made blocking
+    by passing a timeout, in which case they wait on a condition that is notified
+    as soon as work is queued.
+
+    Time-outs are tracked in deadline-ordered heaps, so expiring work only touches
+    the entries that actually expired. By default this happens inline on each
+    request; given a sweep_interval (in seconds), a housekeeping thread runs the
+    sweep instead. Call close() to stop it.
 
-    TODO: some basic locking on process queues for thread safety would be nice.
+    With columnar_history, process histories are kept in columns rather than as
+    lists of event objects, which takes less memory for long histories.
+
+    Every change of state is made by one of the operation methods below, which
+    receive the current time and any newly generated ids as arguments. Applying
+    the same operations in the same order hence always yields the same state.
     '''
 
-    def __init__(self):
+    def __init__(self, sweep_interval=None, columnar_history=False):
+        self.columnar_history = columnar_history
+
+        self._lock = threading.RLock()
+        self._work_available = threading.Condition(self._lock)
+
         self.workflows = {}
         self.activities = {}
 
-        self.running_processes = {}
+        # running processes in order of starting, and their ids by workflow and by tag
+        self.running_processes = OrderedDict()
+        self.processes_by_workflow = {}
+        self.processes_by_tag = {}
+        # parent process id -> ids of its running child processes
+        self.child_processes = {}
         self.running_activities = {}
         self.running_decisions = {}
 
-        self.scheduled_decisions = {Defaults.DECISION_CATEGORY: deque([])}
+        # per category, a heap of [available, seq, process, start, expiration, timer] entries,
+        # ordered by start (timers) or time of scheduling. canceled entries are marked by
+        # clearing their process and dropped when they reach the top.
+        self.scheduled_decisions = {Defaults.DECISION_CATEGORY: []}
+        # scheduled decision entries by process id, then by seq
+        self.pending_decisions = {}
+        self._sequence = count()
+        # per category, a queue of [execution, process, expiration] entries.
+        # entries that are no longer scheduled have their process cleared.
         self.scheduled_activities = {Defaults.ACTIVITY_CATEGORY: deque([])}
-        
+
+        # (process id, activity id) -> scheduled entry or run id of a running activity
+        self.activity_index = {}
+
+        # heaps of (deadline, seq, kind, key), checked against current state when popped
+        self._activity_deadlines = []
+        self._decision_deadlines = []
+
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._stop_sweeper = threading.Event()
+        if sweep_interval:
+            self._start_sweeper()
+
+    def _start_sweeper(self):
+        self._sweeper = threading.Thread(target=self._sweep)
+        self._sweeper.daemon = True
+        self._sweeper.start()
+
+    def _sweep(self):
+        while not self._stop_sweeper.wait(self.sweep_interval):
+            with self._lock:
+                now = datetime.now()
+                self._time_out_activities(now)
+                self._time_out_decisions(now)
+
+    def close(self):
+        ''' stops the housekeeping thread, if any '''
+        if self._sweeper:
+            self._stop_sweeper.set()
+            self._sweeper.join()
+            self._sweeper = None
+
+    def _time_out(self, now, activities=False, decisions=False):
+        # with a housekeeping thread running, expiration happens off the request path
+        if self._sweeper:
+            return
+        if activities:
+            self._time_out_activities(now)
+        if decisions:
+            self._time_out_decisions(now)
+
+    def _add_deadline(self, deadlines, deadline, kind, key):
+        heappush(deadlines, (deadline, next(self._sequence), kind, key))
+
+        # completed work leaves its deadlines behind, drop them once they dominate the heap
+        if len(deadlines) > 1024 and len(deadlines) > 2 * self._live_deadlines(deadlines):
+            deadlines[:] = [d for d in deadlines if self._is_live(deadlines, *d)]
+            heapify(deadlines)
+
+    def _live_deadlines(self, deadlines):
+        if deadlines is self._activity_deadlines:
+            return 2 * len(self.running_activities) + sum(len(q) for q in self.scheduled_activities.itervalues())
+        return len(self.running_decisions) + sum(len(q) for q in self.scheduled_decisions.itervalues())
+
+    def _is_live(self, deadlines, deadline, seq, kind, key):
+        ''' whether a deadline entry still refers to scheduled or running work '''
+        if deadlines is self._activity_deadlines:
+            if kind == 'scheduled':
+                return key[1] is not None
+            running = self.running_activities.get(key)
+            return running is not None and deadline in running[2:]
+
+        if kind == 'scheduled':
+            return key[2] is not None
+        return key in self.running_decisions
+
+    def _next_deadline(self):
+        tops = [deadlines[0][0] for deadlines in (self._activity_deadlines, self._decision_deadlines) if deadlines]
+        return min(tops) if tops else None
+
+    def _new_history(self, events):
+        return ColumnarHistory(events) if self.columnar_history else events
+
     def _managed_process(self, pid):
         return self.running_processes[pid]
 
-    def _schedule_activity(self, process, activity, id, input, queue=None):
-        expiration = datetime.now() + timedelta(seconds=self.activities[activity]['scheduled_timeout'])
+    def _add_process(self, process):
+        self.running_processes[process.id] = process
+        self.processes_by_workflow.setdefault(process.workflow, OrderedDict())[process.id] = None
+        for tag in process.tags:
+            self.processes_by_tag.setdefault(tag, OrderedDict())[process.id] = None
+
+        if process.parent:
+            self.child_processes.setdefault(process.parent, set()).add(process.id)
+
+    def _remove_process(self, process):
+        # remove scheduled decision
+        self._cancel_decision(process)
+
+        del self.running_processes[process.id]
+        self._unindex(self.processes_by_workflow, process.workflow, process.id)
+        for tag in process.tags:
+            self._unindex(self.processes_by_tag, tag, process.id)
+
+        if process.parent in self.child_processes:
+            siblings = self.child_processes[process.parent]
+            siblings.discard(process.id)
+            if not siblings:
+                del self.child_processes[process.parent]
+
+    def _work_queued(self, kind, category):
+        ''' called when an activity or decision task is queued in a category '''
+        self._work_available.notify_all()
+
+    def _schedule_activity(self, process, activity, id, input, now, queue=None):
+        expiration = now + timedelta(seconds=self.activities[activity]['scheduled_timeout'])
         execution = ActivityExecution(activity, id, input=input)
         queue = queue or self.activities[activity]['category']
-        self.scheduled_activities[queue].append((execution, process, expiration))
-
-    def _activity_by_id(self, id):
-        activity = filter(lambda (key, a): a[0].id == id, self.running_activities.items())
-        if not activity:
-            for q, queue in self.scheduled_activities.items():
-                activity = filter(lambda a: a[0].id == id, queue)
-                if activity:
-                    break
-        return (activity or [None])[0]        
-
-    def _cancel_activity(self, id):
-        for q, queue in self.scheduled_activities.items():
-            to_cancel = filter(lambda a: a[0].id == id, queue)    
-            for a in to_cancel:
-                queue.remove(a)
-
-        to_cancel = filter(lambda (key, a): a[0].id == id, self.running_activities.items())
-        for (key, a) in to_cancel:
-            del self.running_activities[key]
-            
-
-    def _schedule_decision(self, process, start=None, timer=None):
+        entry = [execution, process, expiration]
+        self.scheduled_activities[queue].append(entry)
+        self.activity_index[(process.id, id)] = entry
+        self._add_deadline(self._activity_deadlines, expiration, 'scheduled', entry)
+        self._work_queued('activity', queue)
+
+    def _unschedule_activity(self, entry):
+        # leaves a tombstone in the queue, which is skipped when polled
+        key = (entry[1].id, entry[0].id)
+        if self.activity_index.get(key) is entry:
+            del self.activity_index[key]
+        entry[1] = None
+
+    def _end_activity(self, run_id):
+        activity = self.running_activities.pop(run_id)
+        key = (activity[1].id, activity[0].id)
+        if self.activity_index.get(key) == run_id:
+            del self.activity_index[key]
+        return activity
+
+    def _activity_by_id(self, process, id):
+        location = self.activity_index.get((process.id, id))
+        if location is None:
+            return None
+        elif isinstance(location, list):
+            return location[0]
+        return self.running_activities[location][0]
+
+    def _cancel_activity(self, process, id):
+        ''' cancels a scheduled or running activity, returns its execution if there was one '''
+        location = self.activity_index.get((process.id, id))
+        if location is None:
+            return None
+        elif isinstance(location, list):
+            self._unschedule_activity(location)
+            return location[0]
+        return self._end_activity(location)[0]
+
+    def _schedule_decision(self, process, now, start=None, timer=None):
+        # work that times out may belong to a process that has since been canceled
+        if not process.id in self.running_processes:
+            return
+
         queue = self.workflows[process.workflow]['category']
 
-        existing = filter(lambda a: a[0] == process, self.scheduled_decisions[queue])
-        matching = filter(lambda a: not a[1] or a[1] <= (start or datetime.now()), existing)
-        if timer or not len(matching):
-            if timer:
-                expiration = None
-            else:
-                expiration = datetime.now() + timedelta(seconds=self.workflows[process.workflow]['decision_timeout'])
+        # a decision that is (or will be) available before now already covers this one
+        pending = self.pending_decisions.get(process.id, {})
+        if not timer and any(not d[3] or d[3] <= now for d in pending.itervalues()):
+            return
 
-            self.scheduled_decisions[queue].append((process, start, expiration, timer))
-            self.scheduled_decisions[queue] = sorted(self.scheduled_decisions[queue], key=lambda d: d[1] or datetime.now())
+        if timer:
+            expiration = None
+        else:
+            expiration = now + timedelta(seconds=self.workflows[process.workflow]['decision_timeout'])
+
+        entry = [start or now, next(self._sequence), process, start, expiration, timer]
+        self.pending_decisions.setdefault(process.id, {})[entry[1]] = entry
+        heappush(self.scheduled_decisions[queue], entry)
+        if expiration:
+            self._add_deadline(self._decision_deadlines, expiration, 'scheduled', entry)
+        self._work_queued('decision', queue)
+
+    def _unschedule_decision(self, entry):
+        pending = self.pending_decisions[entry[2].id]
+        del pending[entry[1]]
+        if not pending:
+            del self.pending_decisions[entry[2].id]
+        entry[2] = None
 
     def _cancel_decision(self, process):
-        for cat, queue in self.scheduled_decisions.items():
-            to_cancel = filter(lambda a: a[0] == process, queue)
-            for a in to_cancel:
-                queue.remove(a)
+        for entry in self.pending_decisions.get(process.id, {}).values():
+            self._unschedule_decision(entry)
 
-    def register_workflow(self, name, category=Defaults.DECISION_CATEGORY,
-        timeout=Defaults.WORKFLOW_TIMEOUT, 
-        decision_timeout=Defaults.DECISION_TIMEOUT):
-
-        self.workflows[name] = {
-            'category': category,
-            'timeout': timeout,
-            'decision_timeout': decision_timeout
-        }
+    def _cancel_process_internal(self, managed_process, now):
+        # remove process
+        self._remove_process(managed_process)
 
-        self.scheduled_decisions.setdefault(category, deque([]))
+        # cancel child processes, and theirs
+        descendants = list(self.child_processes.pop(managed_process.id, ()))
+        while descendants:
+            child = self.running_processes[descendants.pop()]
+            child.history.append(DecisionEvent(CancelProcess(), datetime=now))
+            self._remove_process(child)
+            descendants.extend(self.child_processes.pop(child.id, ()))
 
-    def register_activity(self, name, category=Defaults.ACTIVITY_CATEGORY, 
-        scheduled_timeout=Defaults.ACTIVITY_SCHEDULED_TIMEOUT, 
-        execution_timeout=Defaults.ACTIVITY_EXECUTION_TIMEOUT, 
-        heartbeat_timeout=Defaults.ACTIVITY_HEARTBEAT_TIMEOUT):
+    # operations
 
-        self.activities[name] = {
-            'category': category,
-            'scheduled_timeout': scheduled_timeout,
-            'execution_timeout': execution_timeout,
-            'heartbeat_timeout': heartbeat_timeout
-        }
+    def _set_workflow(self, name, config):
+        self.workflows[name] = config
+        self.scheduled_decisions.setdefault(config['category'], [])
 
-        self.scheduled_activities.setdefault(category, deque([]))
+    def _set_activity(self, name, config):
+        self.activities[name] = config
+        self.scheduled_activities.setdefault(config['category'], deque([]))
 
-    def start_process(self, process):
+    def _start_process(self, process, now):
         # register the process
-        pid = str(uuid4())
-        process = process.copy_with_id(pid, history=[ProcessStartedEvent()])
-        self.running_processes[process.id] = process
+        self._add_process(process)
         # schedule a decision
-        self._schedule_decision(process)
-        return pid
-        
-    def signal_process(self, process_id, signal, data=None):
-        # find the process as we know it
+        self._schedule_decision(process, now)
+
+    def _signal_process(self, process_id, signal, now):
         managed_process = self._managed_process(process_id)
 
         # append the signal event
-        managed_process.history.append(SignalEvent(Signal(signal, data)))
+        managed_process.history.append(SignalEvent(signal, datetime=now))
 
         # schedule a decision (if needed)
-        self._schedule_decision(managed_process)
-
-    def _cancel_process_internal(self, managed_process):
-
-        # remove scheduled decision
-        self._cancel_decision(managed_process)
+        self._schedule_decision(managed_process, now)
 
-        # remove process
-        del self.running_processes[managed_process.id]
-
-        # cancel child processes
-        children = [p for p in self.running_processes.values() if p.parent == managed_process.id]
-        for c in children:
-            self.cancel_process(c.id)
-
-    def cancel_process(self, process_id, details=None):
-        # find the process as we know it
+    def _cancel_process(self, process_id, details, now):
         managed_process = self._managed_process(process_id)
 
         # append the cancelation event
-        managed_process.history.append(DecisionEvent(CancelProcess(details=details)))
-
-        self._cancel_process_internal(managed_process)
+        managed_process.history.append(DecisionEvent(CancelProcess(details=details), datetime=now))
 
+        self._cancel_process_internal(managed_process, now)
 
-    def heartbeat_activity_task(self, task):
-        self._time_out_activities()
+    def _heartbeat(self, run_id, now):
+        activity = self.running_activities[run_id]
 
-        # find the process as we know it
-        activity = self.running_activities.get(task.context['run_id'])
-        
         # replace with new heartbeat timeout
-        new_timeout = datetime.now() + timedelta(seconds=self.activities[activity[0].activity]['heartbeat_timeout'])
-        self.running_activities[task.context['run_id']] = (activity[0],activity[1],activity[2],new_timeout)
-            
+        new_timeout = now + timedelta(seconds=self.activities[activity[0].activity]['heartbeat_timeout'])
+        self.running_activities[run_id] = (activity[0],activity[1],activity[2],new_timeout)
+        self._add_deadline(self._activity_deadlines, new_timeout, 'running', run_id)
 
-    def complete_decision_task(self, task, decisions):
-        self._time_out_decisions()
-        
-        if not type(decisions) is list:
-            decisions = [decisions]
-
-        # find the process as we know it
-        decision = self.running_decisions.get(task.context['run_id'])
-        if not decision:
-            raise UnknownDecisionException()
-            
-        del self.running_decisions[task.context['run_id']]
-        (managed_process, expiration) = decision
+    def _complete_decision(self, run_id, decisions, now, child_ids):
+        (managed_process, expiration) = self.running_decisions.pop(run_id)
+        child_ids = iter(child_ids)
 
         # append the decision events
         for decision in decisions:
-            managed_process.history.append(DecisionEvent(decision))
-            
+            managed_process.history.append(DecisionEvent(decision, datetime=now))
+
             # schedule activity if needed
             if hasattr(decision, 'activity'):
-                self._schedule_activity(managed_process, decision.activity, decision.id, decision.input, queue=decision.category)
+                self._schedule_activity(managed_process, decision.activity, decision.id, decision.input, now, queue=decision.category)
 
             # cancel activity
             if isinstance(decision, CancelActivity):
-                activity = self._activity_by_id(decision.id)
-                self._cancel_activity(decision.id)
-                managed_process.history.append(ActivityEvent(activity[0], ActivityCanceled()))
+                execution = self._cancel_activity(managed_process, decision.id)
+                if execution:
+                    managed_process.history.append(ActivityEvent(execution, ActivityCanceled(), datetime=now))
 
             # complete process
             if isinstance(decision, CompleteProcess) or isinstance(decision, CancelProcess):
                 if managed_process.id in self.running_processes:
-                    #del self.running_processes[managed_process.id]
-                    #self._cancel_decision(managed_process)
-                    self._cancel_process_internal(managed_process)
+                    self._cancel_process_internal(managed_process, now)
                     if managed_process.parent:
                         parent = self._managed_process(managed_process.parent)
                         if decision.type == 'complete_process':
-                            parent.history.append(ChildProcessEvent(process_id=managed_process.id, result=ProcessCompleted(result=decision.result), workflow=managed_process.workflow, tags=managed_process.tags))
+                            parent.history.append(ChildProcessEvent(process_id=managed_process.id, result=ProcessCompleted(result=decision.result), workflow=managed_process.workflow, tags=managed_process.tags, datetime=now))
                         elif decision.type == 'cancel_process':
-                            parent.history.append(ChildProcessEvent(process_id=managed_process.id, result=ProcessCanceled(details=decision.details), workflow=managed_process.workflow, tags=managed_process.tags))
-                        self._schedule_decision(parent)
+                            parent.history.append(ChildProcessEvent(process_id=managed_process.id, result=ProcessCanceled(details=decision.details), workflow=managed_process.workflow, tags=managed_process.tags, datetime=now))
+                        self._schedule_decision(parent, now)
 
             # start child process
             if isinstance(decision, StartChildProcess):
-                process = Process(workflow=decision.process.workflow, id=decision.process.id or str(uuid4()), input=decision.process.input, tags=decision.process.tags, parent=task.process.id)
-                self.running_processes[process.id] = process
-                self._schedule_decision(process)
+                process = Process(workflow=decision.process.workflow, id=next(child_ids), input=decision.process.input, tags=decision.process.tags, parent=managed_process.id, history=self._new_history([ProcessStartedEvent(datetime=now)]))
+                self._add_process(process)
+                self._schedule_decision(process, now)
 
             # schedule timer
             if isinstance(decision, Timer):
-                self._schedule_decision(managed_process, start=datetime.now() + timedelta(seconds=decision.delay), timer=decision)
+                self._schedule_decision(managed_process, now, start=now + timedelta(seconds=decision.delay), timer=decision)
 
+    def _complete_activity(self, run_id, result, now):
+        (execution, managed_process, expiration, heartbeat_expiration) = self._end_activity(run_id)
 
-    def complete_activity_task(self, task, result=None):
-        self._time_out_activities()
+        # append the activity event
+        managed_process.history.append(ActivityEvent(execution, result, datetime=now))
+
+        # schedule a decision (if needed)
+        self._schedule_decision(managed_process, now)
+
+    def _start_activity(self, category, now, run_id):
+        ''' hands out the first queued activity that hasn't timed out, if any '''
+        queue = self.scheduled_activities.get(category, [])
+        while queue:
+            entry = queue.popleft()
+            if not entry[1]:
+                continue # canceled or timed out
+            if entry[2] >= now:
+                break
+            self._time_out_scheduled_activity(entry, now)
+        else:
+            return None
+
+        (activity_execution, process, expiration) = entry
+        self._unschedule_activity(entry)
+
+        expiration = now + timedelta(seconds=self.activities[activity_execution.activity]['execution_timeout'])
+        heartbeat_expiration = now + timedelta(seconds=self.activities[activity_execution.activity]['heartbeat_timeout'])
+        self.running_activities[run_id] = (activity_execution, process, expiration, heartbeat_expiration)
+        self.activity_index[(process.id, activity_execution.id)] = run_id
+        self._add_deadline(self._activity_deadlines, expiration, 'running', run_id)
+        self._add_deadline(self._activity_deadlines, heartbeat_expiration, 'running', run_id)
 
+        process.history.append(ActivityStartedEvent(activity_execution, datetime=now))
+
+        return ActivityTask(activity_execution, process_id=process.id, context={'run_id': run_id})
+
+    def _start_decision(self, category, now, run_id):
+        ''' hands out the first queued decision that is available, if any '''
+        queue = self.scheduled_decisions[category]
+        while queue and not queue[0][2]:
+            heappop(queue) # canceled
+
+        if not queue or (queue[0][3] and queue[0][3] > now):
+            return None
+
+        entry = heappop(queue)
+        (available, seq, process, start, expiration, timer) = entry
+        self._unschedule_decision(entry)
+
+        if start:
+            process.history.append(TimerEvent(timer, datetime=now))
+
+        expiration = now + timedelta(seconds=self.workflows[process.workflow]['timeout'])
+        self.running_decisions[run_id] = (process, expiration)
+        self._add_deadline(self._decision_deadlines, expiration, 'running', run_id)
+
+        process.history.append(DecisionStartedEvent(datetime=now))
+
+        return DecisionTask(process, context={'run_id': run_id})
+
+    # public api
+
+    @synchronized
+    def register_workflow(self, name, category=Defaults.DECISION_CATEGORY,
+        timeout=Defaults.WORKFLOW_TIMEOUT,
+        decision_timeout=Defaults.DECISION_TIMEOUT):
+
+        self._set_workflow(name, {
+            'category': category,
+            'timeout': timeout,
+            'decision_timeout': decision_timeout
+        })
+
+    @synchronized
+    def register_activity(self, name, category=Defaults.ACTIVITY_CATEGORY,
+        scheduled_timeout=Defaults.ACTIVITY_SCHEDULED_TIMEOUT,
+        execution_timeout=Defaults.ACTIVITY_EXECUTION_TIMEOUT,
+        heartbeat_timeout=Defaults.ACTIVITY_HEARTBEAT_TIMEOUT):
+
+        self._set_activity(name, {
+            'category': category,
+            'scheduled_timeout': scheduled_timeout,
+            'execution_timeout': execution_timeout,
+            'heartbeat_timeout': heartbeat_timeout
+        })
+
+    @synchronized
+    def start_process(self, process):
+        pid = str(uuid4())
+        now = datetime.now()
+        self._start_process(process.copy_with_id(pid, history=self._new_history([ProcessStartedEvent(datetime=now)])), now)
+        return pid
+
+    @synchronized
+    def signal_process(self, process_id, signal, data=None):
         # find the process as we know it
-        activity = self.running_activities.get(task.context['run_id'])
-        if not activity:
+        self._managed_process(process_id)
+
+        self._signal_process(process_id, Signal(signal, data), datetime.now())
+
+    @synchronized
+    def cancel_process(self, process_id, details=None):
+        # find the process as we know it
+        self._managed_process(process_id)
+
+        self._cancel_process(process_id, details, datetime.now())
+
+    @synchronized
+    def heartbeat_activity_task(self, task):
+        now = datetime.now()
+        self._time_out(now, activities=True)
+
+        # find the activity as we know it
+        if not task.context['run_id'] in self.running_activities:
             raise UnknownActivityException()
 
-        del self.running_activities[task.context['run_id']]
-        
-        (execution, managed_process, expiration, heartbeat_expiration) = activity
+        self._heartbeat(task.context['run_id'], now)
 
-        # append the activity event
-        managed_process.history.append(ActivityEvent(execution, result))
+    def _complete_decision_task(self, task, decisions, now):
+        if not type(decisions) is list:
+            decisions = [decisions]
 
-        # schedule a decision (if needed)
-        self._schedule_decision(managed_process)
+        # find the decision as we know it
+        if not task.context['run_id'] in self.running_decisions:
+            raise UnknownDecisionException()
+
+        child_ids = [d.process.id or str(uuid4()) for d in decisions if isinstance(d, StartChildProcess)]
+        self._complete_decision(task.context['run_id'], decisions, now, child_ids)
+
+    def _complete_activity_task(self, task, result, now):
+        # find the activity as we know it
+        if not task.context['run_id'] in self.running_activities:
+            raise UnknownActivityException()
+
+        self._complete_activity(task.context['run_id'], result, now)
 
+    def _complete_tasks(self, complete, completions, now):
+        results = []
+        for (task, result) in completions:
+            try:
+                results.append(complete(task, result, now))
+            except Exception, e:
+                results.append(e)
+        return results
+
+    @synchronized
+    def complete_decision_task(self, task, decisions):
+        now = datetime.now()
+        self._time_out(now, decisions=True)
+        self._complete_decision_task(task, decisions, now)
+
+    @synchronized
+    def complete_activity_task(self, task, result=None):
+        now = datetime.now()
+        self._time_out(now, activities=True)
+        self._complete_activity_task(task, result, now)
+
+    @synchronized
+    def complete_decision_tasks(self, completions):
+        now = datetime.now()
+        self._time_out(now, decisions=True)
+        return self._complete_tasks(self._complete_decision_task, completions, now)
+
+    @synchronized
+    def complete_activity_tasks(self, completions):
+        now = datetime.now()
+        self._time_out(now, activities=True)
+        return self._complete_tasks(self._complete_activity_task, completions, now)
+
+    @synchronized
     def process_by_id(self, pid):
         return self._managed_process(pid)
 
+    def _unindex(self, index, value, pid):
+        pids = index.get(value)
+        if pids is not None:
+            pids.pop(pid, None)
+            if not pids:
+                del index[value]
+
+    def _process_ids(self, workflow=None, tag=None):
+        ''' ids of the matching processes in order of starting, iterating the smallest index '''
+        indexes = []
+        if workflow:
+            indexes.append(self.processes_by_workflow.get(workflow, {}))
+        if tag:
+            indexes.append(self.processes_by_tag.get(tag, {}))
+        if not indexes:
+            return self.running_processes.iterkeys()
+
+        indexes.sort(key=len)
+        smallest, others = indexes[0], indexes[1:]
+        return (pid for pid in smallest if all(pid in index for index in others))
+
+    @synchronized
     def processes(self, workflow=None, tag=None):
-        return ifilter(lambda p: (p.workflow == workflow or not workflow) and (tag in p.tags or not tag), self.running_processes.values())
-
-    def _time_out_activities(self):
-        # activities that are past expired scheduling date. they're in scheduled_activities
-        for q, queue in self.scheduled_activities.items():
-            for expired in filter(lambda a: a[2] < datetime.now(), queue):
-                queue.remove(expired)
-                self._schedule_decision(expired[1])
-
-                expired[1].history.append(ActivityEvent(expired[0], ActivityTimedOut()))
-
-        # activities that are past expired execution date. they're in running_activities
-        for (i, expired) in filter(lambda (i,a): a[2] < datetime.now() or a[3] < datetime.now(), self.running_activities.items()):
-            del self.running_activities[i]
-            self._schedule_decision(expired[1])
-
-            expired[1].history.append(ActivityEvent(expired[0], ActivityTimedOut()))
-        
-    def _time_out_decisions(self):
-        # decisions that are past expired execution date. they're in running_decisions
-        for (i,expired) in filter(lambda (i,a): a[1] < datetime.now(), self.running_decisions.items()):
-            del self.running_decisions[i]
-            self._schedule_decision(expired[0])
-
-        # sometimes scheduled decisions have been there for too long as well
-        for cat, queue in self.scheduled_decisions.items():
-            for (expired) in filter(lambda d: d[2] and d[2] < datetime.now(), queue):
-                queue.remove(expired)
-                self._schedule_decision(expired[0])
-
-    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None):
-        # find queued activity tasks (that haven't timed out)
-        try:
-            while True:
-                (activity_execution, process, expiration) = self.scheduled_activities[category].popleft()
-                if expiration >= datetime.now():
-                    break
-        except:
-            return None
-        
-        run_id = str(uuid4())
-        expiration = datetime.now() + timedelta(seconds=self.activities[activity_execution.activity]['execution_timeout'])
-        heartbeat_expiration = datetime.now() + timedelta(seconds=self.activities[activity_execution.activity]['heartbeat_timeout'])
-        self.running_activities[run_id] = (activity_execution, process, expiration, heartbeat_expiration)
-            
-        process.history.append(ActivityStartedEvent(activity_execution))
+        return [self.running_processes[pid] for pid in self._process_ids(workflow, tag)]
+
+    @synchronized
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        stop = offset + limit if limit is not None else None
+        processes = (self.running_processes[pid] for pid in islice(self._process_ids(workflow, tag), offset, stop))
+        return [ProcessSummary.for_process(p) for p in processes] if summary else list(processes)
+
+    @synchronized
+    def count_processes(self, workflow=None, tag=None):
+        if workflow and tag:
+            return sum(1 for _ in self._process_ids(workflow, tag))
+        elif workflow:
+            return len(self.processes_by_workflow.get(workflow, ()))
+        elif tag:
+            return len(self.processes_by_tag.get(tag, ()))
+        return len(self.running_processes)
+
+    def _expired(self, deadlines, now):
+        ''' pops the deadline entries that have passed '''
+        while deadlines and deadlines[0][0] < now:
+            (deadline, seq, kind, key) = heappop(deadlines)
+            yield (kind, key)
+
+    def _time_out_scheduled_activity(self, entry, now):
+        (execution, process, expiration) = entry
+        self._unschedule_activity(entry)
+        self._schedule_decision(process, now)
+
+        process.history.append(ActivityEvent(execution, ActivityTimedOut(), datetime=now))
+
+    def _time_out_activities(self, now):
+        ''' times out expired activities, returns how many there were '''
+        timed_out = 0
+        for (kind, key) in self._expired(self._activity_deadlines, now):
+            if kind == 'scheduled':
+                # activities that are past expired scheduling date. they're in scheduled_activities
+                if key[1]:
+                    self._time_out_scheduled_activity(key, now)
+                    timed_out += 1
+            else:
+                # activities that are past expired execution date. they're in running_activities
+                expired = self.running_activities.get(key)
+                if expired and (expired[2] < now or expired[3] < now):
+                    self._end_activity(key)
+                    self._schedule_decision(expired[1], now)
+
+                    expired[1].history.append(ActivityEvent(expired[0], ActivityTimedOut(), datetime=now))
+                    timed_out += 1
+        return timed_out
+
+    def _time_out_decisions(self, now):
+        ''' times out expired decisions, returns how many there were '''
+        timed_out = 0
+        for (kind, key) in self._expired(self._decision_deadlines, now):
+            if kind == 'scheduled':
+                # sometimes scheduled decisions have been there for too long as well
+                if key[2]:
+                    process = key[2]
+                    self._unschedule_decision(key)
+                    self._schedule_decision(process, now)
+                    timed_out += 1
+            else:
+                # decisions that are past expired execution date. they're in running_decisions
+                expired = self.running_decisions.get(key)
+                if expired and expired[1] < now:
+                    del self.running_decisions[key]
+                    self._schedule_decision(expired[0], now)
+                    timed_out += 1
+        return timed_out
+
+    def _poll_activity_tasks(self, category, max_tasks):
+        now = datetime.now()
+        self._time_out(now, activities=True)
+        return self._start_tasks(self._start_activity, category, max_tasks, now)
+
+    def _poll_decision_tasks(self, category, max_tasks):
+        now = datetime.now()
+        self._time_out(now, activities=True, decisions=True)
+        return self._start_tasks(self._start_decision, category, max_tasks, now)
+
+    def _start_tasks(self, start, category, max_tasks, now):
+        tasks = []
+        while len(tasks) < max_tasks:
+            task = start(category, now, str(uuid4()))
+            if not task:
+                break
+            tasks.append(task)
+        return tasks
+
+    def _next_decision_start(self, category):
+        ''' earliest moment at which a delayed (timer) decision in the queue becomes available '''
+        queue = self.scheduled_decisions.get(category, [])
+        while queue and not queue[0][2]:
+            heappop(queue) # canceled
+
+        if queue and queue[0][3] and queue[0][3] > datetime.now():
+            return queue[0][3]
+
+    def _wait_for_task(self, poll, timeout=None, next_start=None):
+        '''
+        Repeatedly calls poll until it returns a task (or a list of them) or the timeout (in seconds) expires.
+        Waits on the work condition in between, so that we wake as soon as work is queued,
+        or when a time-out may have produced new work.
+        '''
+        task = poll()
+        if task or not timeout:
+            return task
+
+        deadline = datetime.now() + timedelta(seconds=timeout)
+        while not task:
+            wakeup = deadline
+            for start in (next_start() if next_start else None, None if self._sweeper else self._next_deadline()):
+                if start and start < wakeup:
+                    wakeup = start
+
+            remaining = (wakeup - datetime.now()).total_seconds()
+            if remaining > 0:
+                self._work_available.wait(remaining)
+
+            task = poll()
+            if datetime.now() >= deadline:
+                break
 
-        return ActivityTask(activity_execution, process_id=process.id, context={'run_id': run_id})
+        return task
 
-    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None):
-        # time-out expired activities
-        self._time_out_activities()
-        self._time_out_decisions()
+    @synchronized
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        tasks = self._wait_for_task(lambda: self._poll_activity_tasks(category, 1), timeout)
+        return tasks[0] if tasks else None
 
-        # find queued decision tasks (that haven't timed out)
-        queue = self.scheduled_decisions[category]
-        for d in queue:
-            (process, start, expiration, timer) = d
-            if start and start > datetime.now():
-                continue
-                #self.scheduled_decisions.append((process, start, expiration, timer))
-            elif not expiration or expiration >= datetime.now():
-                if start:
-                    process.history.append(TimerEvent(timer))
-
-                queue.remove(d)
-                break
-        else:
-            return None
+    @synchronized
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        tasks = self._wait_for_task(lambda: self._poll_decision_tasks(category, 1), timeout,
+            next_start=lambda: self._next_decision_start(category))
+        return tasks[0] if tasks else None
 
-        run_id = str(uuid4())
-        expiration = datetime.now() + timedelta(seconds=self.workflows[process.workflow]['timeout'])
-        self.running_decisions[run_id] = (process, expiration)
-        
-        process.history.append(DecisionStartedEvent())
+    @synchronized
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return self._wait_for_task(lambda: self._poll_activity_tasks(category, max_tasks), timeout)
 
-        return DecisionTask(process, context={'run_id': run_id})
-        
\ No newline at end of file
+    @synchronized
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return self._wait_for_task(lambda: self._poll_decision_tasks(category, max_tasks), timeout,
+            next_start=lambda: self._next_decision_start(category))
\ No newline at end of file
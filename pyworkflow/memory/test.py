@@ -1,6 +1,18 @@
 import unittest
+import threading
+import tempfile
+import shutil
+import mock
 
-from ..test import WorkflowBackendTestCase
+from time import sleep
+from datetime import datetime
+from ..test import WorkflowBackendTestCase, FooWorkflow
+from ..process import Process
+from ..decision import ScheduleActivity, StartChildProcess
+from ..activity import ActivityTimedOut, ActivityCompleted, ActivityFailed
+from ..managed import Manager
+from ..managed.worker import ActivityWorker, DecisionWorker, WorkerPool, WorkerThread
+from ..blob import BlobStore, BlobBackend
 from backend import MemoryBackend
 
 class MemoryBackendTestCase(WorkflowBackendTestCase):
@@ -19,6 +31,15 @@ class MemoryBackendTestCase(WorkflowBackendTestCase):
         
     def test_managed(self):
         self.subtest_managed()
+
+    def test_activity_ids(self):
+        self.subtest_activity_ids()
+
+    def test_cancel_while_deciding(self):
+        self.subtest_cancel_while_deciding()
+
+    def test_batch(self):
+        self.subtest_batch()
     
     def test_timeouts(self):
         self.subtest_timeouts()
@@ -31,4 +52,202 @@ class MemoryBackendTestCase(WorkflowBackendTestCase):
     
     def test_timer(self):
         self.subtest_timer()
-    
\ No newline at end of file
+
+    def test_query(self):
+        self.subtest_query()
+
+    def test_history_page(self):
+        self.subtest_history_page()
+
+    def test_long_poll(self):
+        self.backend.register_workflow('test')
+
+        # a blocking poll should return as soon as a decision gets scheduled
+        tasks = []
+        poller = threading.Thread(target=lambda: tasks.append(self.backend.poll_decision_task(timeout=5)))
+        poller.start()
+        sleep(.1)
+
+        started = datetime.now()
+        self.backend.start_process(Process(workflow='test'))
+        poller.join(5)
+
+        assert len(tasks) == 1 and tasks[0] is not None
+        assert (datetime.now() - started).total_seconds() < 1
+
+        # and give up when the timeout expires without work
+        assert self.backend.poll_decision_task(timeout=.1) is None
+
+    def test_sweeper(self):
+        backend = MemoryBackend(sweep_interval=.05)
+        try:
+            backend.register_workflow('test')
+            backend.register_activity('double', scheduled_timeout=.1)
+
+            backend.start_process(Process(workflow='test'))
+            task = backend.poll_decision_task()
+            backend.complete_decision_task(task, ScheduleActivity('double', id='1'))
+
+            # the housekeeping thread times out the activity without further requests
+            sleep(.3)
+            process = backend.process_by_id(task.process.id)
+            assert isinstance(process.history[-1].result, ActivityTimedOut)
+            assert backend.poll_decision_task() is not None
+        finally:
+            backend.close()
+
+    def test_cancel_process_tree(self):
+        backend = self.backend
+        backend.register_workflow('test')
+        root = backend.start_process(Process(workflow='test'))
+
+        # every process starts two children, three levels deep
+        for _ in range(0, 7):
+            task = backend.poll_decision_task()
+            backend.complete_decision_task(task, [StartChildProcess(Process(workflow='test')) for _ in range(0, 2)])
+
+        assert len(list(backend.processes())) == 15
+        backend.cancel_process(root)
+        assert list(backend.processes()) == []
+        assert backend.child_processes == {}
+
+    def test_process_pool(self):
+        directory = tempfile.mkdtemp()
+        store = BlobStore(directory, threshold=0)
+        manager = Manager(BlobBackend(self.backend, store), workflows=[FooWorkflow])
+        manager.heartbeat = mock.Mock()
+        worker = ActivityWorker(manager, category='computation', processes=2, blob_store=store)
+        try:
+            for input in ([2, 3], 'invalid'):
+                manager.start_process(Process(workflow=FooWorkflow, input=input))
+                DecisionWorker(manager).step()
+
+            # activities execute in the pool, and are completed from here
+            assert worker.step() and worker.step()
+            results = [p.history.of_type('activity')[0].result for p in manager.processes()]
+            assert isinstance(results[0], ActivityCompleted) and results[0].result.load() == 6
+            assert isinstance(results[1], ActivityFailed) and 'invalid input' in results[1].reason
+
+            # heartbeats from the pool reach the manager
+            for i in range(20):
+                if manager.heartbeat.call_count == 2:
+                    break
+                sleep(.1)
+            assert manager.heartbeat.call_count == 2
+
+            # a batch is submitted to the pool as a whole before its results are waited for
+            calls = []
+            pending = mock.Mock()
+            pending.get.side_effect = lambda: calls.append('get') or ActivityCompleted(6)
+            pool = mock.Mock()
+            pool.apply_async.side_effect = lambda fn, args: calls.append('apply') or pending
+            with mock.patch.object(worker, '_start_pool', return_value=pool):
+                with mock.patch.object(manager, 'activity_class_for_task'):
+                    results = worker.results_for_tasks([mock.Mock(), mock.Mock()])
+            assert calls == ['apply', 'apply', 'get', 'get'] and [r.result for r in results] == [6, 6]
+        finally:
+            worker.close()
+            shutil.rmtree(directory)
+
+    def test_worker_pool(self):
+        manager = Manager(self.backend, workflows=[FooWorkflow])
+        for i in range(5):
+            manager.start_process(Process(workflow=FooWorkflow, input=[i, 2]))
+            DecisionWorker(manager).step()
+
+        polled = []
+        next_activities = manager.next_activities
+        def poll(max_tasks, **kwargs):
+            tasks = next_activities(max_tasks, **kwargs)
+            polled.extend(tasks)
+            return tasks
+        manager.next_activities = poll
+
+        executing = []
+        release = threading.Event()
+        def execute_activity(activity):
+            executing.append(activity)
+            release.wait(5)
+            return ActivityCompleted(activity.input)
+
+        worker = ActivityWorker(manager, category='computation')
+        worker.execute_activity = execute_activity
+        pool = WorkerPool(worker, size=3, poll_timeout=.1)
+        pool.start()
+        try:
+            for i in range(20):
+                if len(executing) == 3:
+                    break
+                sleep(.05)
+
+            # tasks are only polled for once a thread is free to execute them
+            sleep(.3)
+            assert len(executing) == 3 and len(polled) == 3
+            assert pool.in_flight == 3 and pool.idle == 0
+
+            release.set()
+            for i in range(20):
+                if len(executing) == 5 and pool.idle == 3:
+                    break
+                sleep(.05)
+            results = [p.history.of_type('activity')[0].result for p in manager.processes()]
+            assert sorted(r.result for r in results) == [[i, 2] for i in range(5)]
+        finally:
+            release.set()
+            pool.join(5)
+        assert not pool.is_alive()
+
+    def test_decision_errors(self):
+        manager = Manager(self.backend, workflows=[FooWorkflow])
+        manager.start_process(Process(workflow=FooWorkflow, input=[2, 3]))
+
+        # a decider that fails is logged with its error, as there are no decisions to log
+        logger = mock.Mock()
+        with mock.patch.object(FooWorkflow, 'decide', side_effect=ValueError('broken')):
+            assert DecisionWorker(manager).step(logger=logger)
+        message = logger.exception.call_args[0][0]
+        assert message.startswith('Error in Foo decision') and 'Exception: broken' in message and not 'Decisions' in message
+
+    def test_worker_thread_idle(self):
+        # polls that come back empty before their timeout are followed by a delay rather than another poll
+        worker = mock.Mock()
+        worker.step.return_value = False
+        thread = WorkerThread(worker, delay_on_idle=.2, poll_timeout=5)
+        thread.start()
+        sleep(.5)
+        thread.join(5)
+        assert 2 <= worker.step.call_count <= 4
+        worker.step.assert_called_with(logger=thread.logger, timeout=5)
+
+    def test_worker_pool_polls(self):
+        manager = Manager(self.backend, workflows=[FooWorkflow])
+        polls = []
+        release = threading.Event()
+        def poll(max_tasks, **kwargs):
+            polls.append(max_tasks)
+            release.wait(5)
+            raise IOError('backend unavailable')
+        manager.next_activities = poll
+
+        pool = WorkerPool(ActivityWorker(manager, category='computation'), size=3, poll_timeout=.1, delay_on_idle=.5)
+        pool.start()
+        try:
+            # threads held for a poll aren't executing tasks
+            sleep(.1)
+            assert polls == [3] and pool.polling == 3 and pool.in_flight == 0 and pool.idle == 0
+
+            # a failing poll is retried after a delay, not right away
+            release.set()
+            sleep(.3)
+            assert len(polls) == 1 and pool.polling == 0 and pool.idle == 3
+        finally:
+            pool.join(5)
+        assert not pool.is_alive()
+
+        # a stopped pool claims no threads, even when they're idle
+        assert pool._claim_slots() == 0 and len(polls) == 1
+
+class ColumnarMemoryBackendTestCase(MemoryBackendTestCase):
+    def setUp(self):
+        super(ColumnarMemoryBackendTestCase, self).setUp()
+        self.backend = MemoryBackend(columnar_history=True)
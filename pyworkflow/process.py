@@ -2,7 +2,8 @@ from uuid import uuid4
 from events import DecisionEvent, ActivityEvent, ProcessStartedEvent
 from activity import ActivityExecution
 from decision import ScheduleActivity
-from itertools import ifilter
+from history import History, IndexedHistory
+from util import fingerprint
 
 class Process(object):
     def __init__(self, workflow=None, id=None, input=None, tags=None, history=None, parent=None):
@@ -14,7 +15,11 @@ class Process(object):
         self._id = id
         self._parent = parent
         self._input = input
-        self._history = history or [ProcessStartedEvent()]
+        if not isinstance(history, IndexedHistory):
+            history = History(history or [ProcessStartedEvent()])
+        elif not len(history):
+            history.append(ProcessStartedEvent())
+        self._history = history
         self._tags = tags or []
         
     @property
@@ -51,40 +56,23 @@ class Process(object):
         return self.has_event(DecisionEvent(decision))
 
     def unseen_events(self):
-        r_history = list(reversed(self.history))[1:] # last event is the start of this decision, ignore
-        first_decision = next(ifilter(lambda ev: ev.type == 'decision_started', r_history), None)
-        last_seen_idx = r_history.index(first_decision) if first_decision else len(r_history)
-        return list(reversed(r_history[:last_seen_idx]))
+        return self.history.unseen()
 
     def unfinished_activities(self):
-        execution_for_decision = lambda decision: ActivityExecution(decision.activity, decision.id, decision.input)
-        is_completed_activity = lambda ev: ev.type == 'activity' and hasattr(ev, 'result')
-        is_scheduled_activity = lambda ev: ev.type == 'decision' and hasattr(ev.decision, 'activity')
-
-        r_history = list(reversed(self.history)) # consume iterator once, store in list
-        finished = [ev.activity_execution for ev in r_history if is_completed_activity(ev)]
-        scheduled = [execution_for_decision(ev.decision) for ev in r_history if is_scheduled_activity(ev)]
-        return filter(lambda ae: ae not in finished, scheduled)
+        return self.history.unfinished_activities()
 
     def untriggered_timers(self, disregard_unseen=False):
-        history = self.history
-        
-        is_timer_decision = lambda ev: ev.type == 'decision' and ev.decision.type == 'timer'
-        timers = [ev.decision for ev in history if is_timer_decision(ev)]
-
-        if disregard_unseen:
-            unseen = self.unseen_events()
-            try:
-                history = history[:history.index(unseen[0])]
-            except ValueError:
-                pass
+        return self.history.untriggered_timers(disregard_unseen)
 
-        finished_timers = [ev.timer for ev in history if ev.type == 'timer']
-        return list(set(timers) - set(finished_timers))
+    def __fingerprint__(self):
+        return self.__dict__
 
     def __eq__(self, other):
         return self.__dict__ == other.__dict__
 
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
     def __str__(self):
         return repr(self)
 
@@ -92,13 +80,40 @@ class Process(object):
         return 'Process(%s, %s, %s, %s, %s)' % (self.workflow, self.id, self.input, self.tags, self.parent)
 
 
+class ProcessSummary(object):
+    ''' Lightweight projection of a process, without its input or history '''
+    def __init__(self, id, workflow, tags=None):
+        self.id = id
+        self.workflow = workflow
+        self.tags = tags or []
+
+    @classmethod
+    def for_process(cls, process):
+        return cls(process.id, process.workflow, process.tags)
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+    def __repr__(self):
+        return 'ProcessSummary(%s, %s, %s)' % (self.id, self.workflow, self.tags)
+
+
 
 class ProcessResult(object):
     def __init__(self, result_type):
         self.type = result_type
-        
+
+    def __fingerprint__(self):
+        return self.__dict__
+
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return type(self) is type(other) and self.__dict__ == other.__dict__
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(fingerprint(self))
 
 class InterruptedProcessResult(ProcessResult, Exception):
     def __init__(self, result_type):
@@ -0,0 +1,2 @@
+from backend import RemoteBackend
+from server import BackendServer
\ No newline at end of file
@@ -0,0 +1,215 @@
+import socket
+import threading
+from contextlib import contextmanager
+
+from ..backend import Backend
+from ..defaults import Defaults
+from ..history import PagedHistory
+from protocol import METHODS, read_frame, write_frame
+
+class Connection(object):
+    ''' a connection to a BackendServer '''
+
+    def __init__(self, path):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+        self._rfile = self._socket.makefile('rb')
+        self._wfile = self._socket.makefile('wb')
+
+    def send(self, requests):
+        ''' sends requests without waiting for their responses, returns the responses in order '''
+        for request in requests:
+            write_frame(self._wfile, request)
+        self._wfile.flush()
+
+        responses = []
+        for request in requests:
+            response = read_frame(self._rfile)
+            if response is None:
+                raise socket.error('connection closed by server')
+            responses.append(response)
+        return responses
+
+    def close(self):
+        for f in (self._rfile, self._wfile, self._socket):
+            f.close()
+
+class ConnectionPool(object):
+    ''' hands out idle connections, and opens new ones when there are none '''
+
+    def __init__(self, path, size=8):
+        self.path = path
+        self.size = size
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        connection = connection or Connection(self.path)
+
+        try:
+            yield connection
+        except:
+            # the connection is in an unknown state
+            connection.close()
+            raise
+
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(connection)
+                connection = None
+        if connection:
+            connection.close()
+
+    def close(self):
+        with self._lock:
+            (idle, self._idle) = (self._idle, [])
+        for connection in idle:
+            connection.close()
+
+def unwrap(response):
+    (ok, value) = response
+    if not ok:
+        raise value
+    return value
+
+def unwrap_all(responses):
+    ''' the results of a number of requests, raises the first error only once all have been collected '''
+    values = []
+    for (ok, value) in responses:
+        if not ok:
+            raise value
+        values.append(value)
+    return values
+
+class Pipeline(object):
+    '''
+    Collects backend calls to send them over one connection at once. The server
+    handles them one by one and in order, but without waiting for a round trip each.
+
+    pipeline = backend.pipeline()
+    pipeline.start_process(Process(workflow='foo'))
+    pipeline.start_process(Process(workflow='bar'))
+    (foo_id, bar_id) = pipeline.execute()
+    '''
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._calls = []
+
+    def __getattr__(self, method):
+        if not method in METHODS:
+            raise AttributeError(method)
+        return lambda *args, **kwargs: self._calls.append((method, args, kwargs))
+
+    def execute(self):
+        ''' sends the collected calls, and returns their results '''
+        (calls, self._calls) = (self._calls, [])
+        with self._backend._pool.connection() as connection:
+            responses = connection.send(calls)
+        return unwrap_all(responses)
+
+class RemoteBackend(Backend):
+    '''
+    Client of a backend served by a BackendServer on a unix domain socket. Keeps a
+    pool of connections, so it can be shared by threads, and blocking polls don't
+    hold up other calls.
+
+    With history_page_size set, decision tasks come with only the last page of
+    the history, and the rest is fetched from the server as the decider gets to it.
+    '''
+
+    def __init__(self, path, pool_size=8, history_page_size=None):
+        self.path = path
+        self.history_page_size = history_page_size
+        self._pool = ConnectionPool(path, size=pool_size)
+
+    def _call(self, method, *args, **kwargs):
+        with self._pool.connection() as connection:
+            (response,) = connection.send([(method, args, kwargs)])
+        return unwrap(response)
+
+    def pipeline(self):
+        return Pipeline(self)
+
+    def batch(self, calls):
+        '''
+        Makes a number of (method, args, kwargs) calls in a single request, which the
+        server handles in one go. Returns their results.
+        '''
+        return unwrap_all(self._call('batch', [(method, tuple(args), dict(kwargs)) for (method, args, kwargs) in calls]))
+
+    def close(self):
+        self._pool.close()
+
+    def register_workflow(self, name, **kwargs):
+        self._call('register_workflow', name, **kwargs)
+
+    def register_activity(self, name, **kwargs):
+        self._call('register_activity', name, **kwargs)
+
+    def process_by_id(self, pid):
+        return self._call('process_by_id', pid)
+
+    def processes(self, workflow=None, tag=None):
+        return self._call('processes', workflow=workflow, tag=tag)
+
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        return self._call('query_processes', workflow=workflow, tag=tag, offset=offset, limit=limit, summary=summary)
+
+    def count_processes(self, workflow=None, tag=None):
+        return self._call('count_processes', workflow=workflow, tag=tag)
+
+    def history_page(self, process_id, page_token=None, page_size=100, reverse=False):
+        return self._call('history_page', process_id, page_token=page_token, page_size=page_size, reverse=reverse)
+
+    def start_process(self, process):
+        return self._call('start_process', process)
+
+    def signal_process(self, process_id, signal, data=None):
+        self._call('signal_process', process_id, signal, data=data)
+
+    def cancel_process(self, process_id, details=None):
+        self._call('cancel_process', process_id, details=details)
+
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        return self._call('poll_activity_task', category=category, identity=identity, timeout=timeout)
+
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        kwargs = {'history_page_size': self.history_page_size} if self.history_page_size else {}
+        task = self._call('poll_decision_task', category=category, identity=identity, timeout=timeout, **kwargs)
+        if task:
+            self._attach_history(task)
+        return task
+
+    def poll_activity_tasks(self, category=Defaults.ACTIVITY_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        return self._call('poll_activity_tasks', category=category, max_tasks=max_tasks, identity=identity, timeout=timeout)
+
+    def poll_decision_tasks(self, category=Defaults.DECISION_CATEGORY, max_tasks=1, identity=None, timeout=None):
+        kwargs = {'history_page_size': self.history_page_size} if self.history_page_size else {}
+        tasks = self._call('poll_decision_tasks', category=category, max_tasks=max_tasks, identity=identity, timeout=timeout, **kwargs)
+        for task in tasks:
+            self._attach_history(task)
+        return tasks
+
+    def _attach_history(self, task):
+        ''' lets a paged history fetch the rest of its pages through this backend '''
+        if isinstance(task.process.history, PagedHistory):
+            task.process.history.backend = self
+
+    def heartbeat_activity_task(self, task):
+        self._call('heartbeat_activity_task', task)
+
+    def complete_decision_task(self, task, decisions):
+        self._call('complete_decision_task', task, decisions)
+
+    def complete_activity_task(self, task, result=None):
+        self._call('complete_activity_task', task, result=result)
+
+    def complete_decision_tasks(self, completions):
+        return self._call('complete_decision_tasks', completions)
+
+    def complete_activity_tasks(self, completions):
+        return self._call('complete_activity_tasks', completions)
@@ -0,0 +1,27 @@
+import struct
+import cPickle as pickle
+
+# a frame is a pickled message, preceded by its length
+LENGTH = struct.Struct('>I')
+
+# backend methods that can be called remotely
+METHODS = ('register_workflow', 'register_activity', 'process_by_id', 'processes', 'query_processes',
+    'count_processes', 'history_page', 'start_process', 'signal_process', 'cancel_process', 'poll_activity_task',
+    'poll_decision_task', 'poll_activity_tasks', 'poll_decision_tasks', 'heartbeat_activity_task',
+    'complete_decision_task', 'complete_activity_task', 'complete_decision_tasks', 'complete_activity_tasks')
+
+def write_frame(f, message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    f.write(LENGTH.pack(len(data)) + data)
+
+def read_frame(f):
+    ''' reads the next message, or returns None once the other side has hung up '''
+    header = f.read(LENGTH.size)
+    if len(header) < LENGTH.size:
+        return None
+
+    (length,) = LENGTH.unpack(header)
+    data = f.read(length)
+    if len(data) < length:
+        return None
+    return pickle.loads(data)
@@ -0,0 +1,98 @@
+import os
+import threading
+from SocketServer import StreamRequestHandler, ThreadingMixIn, UnixStreamServer
+from types import GeneratorType
+
+from ..history import PagedHistory
+from protocol import METHODS, read_frame, write_frame
+
+class BackendRequestHandler(StreamRequestHandler):
+    ''' answers the requests on one connection, in order '''
+
+    def handle(self):
+        while True:
+            request = read_frame(self.rfile)
+            if request is None:
+                return
+
+            (method, args, kwargs) = request
+            if method == 'batch':
+                response = (True, [self.server.call(*call) for call in args[0]])
+            else:
+                response = self.server.call(method, args, kwargs)
+
+            write_frame(self.wfile, response)
+            self.wfile.flush()
+
+class BackendServer(ThreadingMixIn, UnixStreamServer):
+    '''
+    Serves a backend to RemoteBackend clients on a unix domain socket, so that
+    workers in other processes on this host can share it. Each connection is
+    handled by a thread of its own.
+
+    server = BackendServer(MemoryBackend(), '/tmp/pyworkflow.sock')
+    server.start()
+    '''
+
+    daemon_threads = True
+
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self._thread = None
+
+        if os.path.exists(path):
+            os.unlink(path) # left behind by an earlier server
+        UnixStreamServer.__init__(self, path, BackendRequestHandler)
+
+    def call(self, method, args, kwargs):
+        ''' calls a backend method, returns whether it succeeded along with the result or exception '''
+        if not method in METHODS:
+            return (False, AttributeError(method))
+
+        try:
+            if method in ('poll_decision_task', 'poll_decision_tasks'):
+                result = getattr(self, method)(*args, **kwargs)
+            else:
+                result = getattr(self.backend, method)(*args, **kwargs)
+        except Exception, e:
+            return (False, e)
+
+        if isinstance(result, GeneratorType):
+            result = list(result)
+        return (True, result)
+
+    def poll_decision_task(self, *args, **kwargs):
+        ''' polls the backend, leaving all but the last page of the history for the client to fetch if asked to '''
+        history_page_size = kwargs.pop('history_page_size', None)
+        task = self.backend.poll_decision_task(*args, **kwargs)
+        if task and history_page_size:
+            self._page_history(task, history_page_size)
+        return task
+
+    def poll_decision_tasks(self, *args, **kwargs):
+        history_page_size = kwargs.pop('history_page_size', None)
+        tasks = self.backend.poll_decision_tasks(*args, **kwargs)
+        if history_page_size:
+            for task in tasks:
+                self._page_history(task, history_page_size)
+        return tasks
+
+    def _page_history(self, task, history_page_size):
+        process = task.process
+        task.process = process.copy_with_id(process.id, history=PagedHistory.tail(process.history, process.id, history_page_size))
+
+    def start(self):
+        ''' serves requests in a background thread '''
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        if self._thread:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import unittest
+from multiprocessing import Process as OSProcess
+
+from ..test import WorkflowBackendTestCase
+from ..process import Process
+from ..decision import ScheduleActivity
+from ..activity import ActivityCompleted
+from ..memory import MemoryBackend
+from backend import RemoteBackend
+from server import BackendServer
+
+def complete_activity(path):
+    backend = RemoteBackend(path)
+    task = backend.poll_activity_task()
+    backend.complete_activity_task(task, ActivityCompleted(task.activity_execution.input * 2))
+    backend.close()
+
+class RemoteBackendTestCase(WorkflowBackendTestCase):
+    history_page_size = None
+
+    def setUp(self):
+        super(RemoteBackendTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'backend.sock')
+        self.server = BackendServer(MemoryBackend(), self.path)
+        self.server.start()
+        self.backends = []
+
+    def tearDown(self):
+        super(RemoteBackendTestCase, self).tearDown()
+        for backend in self.backends:
+            backend.close()
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def construct_backend(self):
+        backend = RemoteBackend(self.path, history_page_size=self.history_page_size)
+        self.backends.append(backend)
+        return backend
+
+    def test_basic(self):
+        self.subtest_basic()
+
+    def test_managed(self):
+        self.subtest_managed()
+
+    def test_activity_ids(self):
+        self.subtest_activity_ids()
+
+    def test_cancel_while_deciding(self):
+        self.subtest_cancel_while_deciding()
+
+    def test_batch(self):
+        self.subtest_batch()
+
+    def test_timeouts(self):
+        self.subtest_timeouts()
+
+    def test_order(self):
+        self.subtest_order()
+
+    def test_threads(self):
+        self.subtest_threads()
+
+    def test_timer(self):
+        self.subtest_timer()
+
+    def test_query(self):
+        self.subtest_query()
+
+    def test_history_page(self):
+        self.subtest_history_page()
+
+    def test_paged_tasks(self):
+        # decision tasks come with their last page, and fetch the rest as needed
+        self.history_page_size = 2
+        self.subtest_order()
+        self.subtest_history_page()
+
+    def test_pipeline(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+
+        pipeline = backend.pipeline()
+        for i in range(3):
+            pipeline.start_process(Process(workflow='test', input=i))
+        pids = pipeline.execute()
+        assert [p.id for p in backend.processes()] == pids
+
+        (count, process) = backend.batch([('count_processes', (), {}), ('process_by_id', (pids[1],), {})])
+        assert count == 3 and process.input == 1
+
+        # errors are raised once all responses are in, so the connection can be reused
+        pipeline.complete_activity_task(None)
+        pipeline.count_processes()
+        try:
+            pipeline.execute()
+            assert False, "should have failed"
+        except Exception, e:
+            pass
+        assert backend.count_processes() == 3
+
+        # positional arguments reach the backend as they are
+        backend.register_workflow('other', category='decisions')
+        backend.start_process(Process(workflow='other'))
+        backend.start_process(Process(workflow='other'))
+        (task,) = backend.batch([('poll_decision_task', ('decisions',), {})])
+        assert task and task.process.workflow == 'other'
+        pipeline.poll_decision_tasks('decisions', 5)
+        (tasks,) = pipeline.execute()
+        assert len(tasks) == 1 and tasks[0].process.workflow == 'other'
+
+    def test_processes(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+        backend.register_activity('double')
+        backend.start_process(Process(workflow='test'))
+        task = backend.poll_decision_task()
+        backend.complete_decision_task(task, ScheduleActivity('double', id='1', input=2))
+
+        # the activity is done by a worker in another process
+        worker = OSProcess(target=complete_activity, args=(self.path,))
+        worker.start()
+        worker.join(5)
+
+        assert worker.exitcode == 0
+        assert backend.process_by_id(task.process.id).history[-1].result == ActivityCompleted(4)
@@ -0,0 +1 @@
+from backend import SQLiteBackend
\ No newline at end of file
@@ -0,0 +1,555 @@
+import sqlite3
+import threading
+import cPickle as pickle
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from time import sleep
+from itertools import izip
+from uuid import uuid4
+
+from ..backend import Backend
+from ..activity import *
+from ..exceptions import UnknownProcessException, UnknownActivityException, UnknownDecisionException
+from ..events import *
+from ..decision import *
+from ..task import *
+from ..process import *
+from ..history import PagedHistory
+from ..signal import *
+from ..defaults import Defaults
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS workflows (
+    name TEXT PRIMARY KEY,
+    category TEXT,
+    timeout REAL,
+    decision_timeout REAL
+);
+
+CREATE TABLE IF NOT EXISTS activities (
+    name TEXT PRIMARY KEY,
+    category TEXT,
+    scheduled_timeout REAL,
+    execution_timeout REAL,
+    heartbeat_timeout REAL
+);
+
+CREATE TABLE IF NOT EXISTS processes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    workflow TEXT,
+    parent TEXT,
+    input BLOB,
+    tags BLOB
+);
+CREATE INDEX IF NOT EXISTS processes_workflow ON processes (workflow, seq);
+CREATE INDEX IF NOT EXISTS processes_parent ON processes (parent);
+
+CREATE TABLE IF NOT EXISTS process_tags (
+    tag TEXT,
+    process_seq INTEGER,
+    PRIMARY KEY (tag, process_seq)
+);
+CREATE INDEX IF NOT EXISTS process_tags_process ON process_tags (process_seq);
+
+CREATE TABLE IF NOT EXISTS events (
+    process_id TEXT,
+    seq INTEGER,
+    event BLOB,
+    PRIMARY KEY (process_id, seq)
+);
+
+CREATE TABLE IF NOT EXISTS scheduled_activities (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT,
+    process_id TEXT,
+    activity_id,
+    execution BLOB,
+    expiration REAL
+);
+CREATE INDEX IF NOT EXISTS scheduled_activities_category ON scheduled_activities (category, seq);
+CREATE INDEX IF NOT EXISTS scheduled_activities_expiration ON scheduled_activities (expiration);
+CREATE INDEX IF NOT EXISTS scheduled_activities_id ON scheduled_activities (process_id, activity_id);
+
+CREATE TABLE IF NOT EXISTS running_activities (
+    run_id TEXT PRIMARY KEY,
+    process_id TEXT,
+    activity_id,
+    execution BLOB,
+    expiration REAL,
+    heartbeat_expiration REAL
+);
+CREATE INDEX IF NOT EXISTS running_activities_expiration ON running_activities (expiration);
+CREATE INDEX IF NOT EXISTS running_activities_heartbeat ON running_activities (heartbeat_expiration);
+CREATE INDEX IF NOT EXISTS running_activities_id ON running_activities (process_id, activity_id);
+
+CREATE TABLE IF NOT EXISTS scheduled_decisions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    category TEXT,
+    process_id TEXT,
+    available REAL,
+    start REAL,
+    expiration REAL,
+    timer BLOB
+);
+CREATE INDEX IF NOT EXISTS scheduled_decisions_category ON scheduled_decisions (category, available);
+CREATE INDEX IF NOT EXISTS scheduled_decisions_process ON scheduled_decisions (process_id);
+CREATE INDEX IF NOT EXISTS scheduled_decisions_expiration ON scheduled_decisions (expiration);
+
+CREATE TABLE IF NOT EXISTS running_decisions (
+    run_id TEXT PRIMARY KEY,
+    process_id TEXT,
+    expiration REAL
+);
+CREATE INDEX IF NOT EXISTS running_decisions_expiration ON running_decisions (expiration);
+'''
+
+EPOCH = datetime(1970, 1, 1)
+
+def timestamp(dt=None):
+    ''' seconds since the epoch of a (naive) datetime, defaults to now '''
+    return ((dt or datetime.now()) - EPOCH).total_seconds()
+
+def dumps(value):
+    return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+def loads(blob):
+    return pickle.loads(str(blob)) if blob is not None else None
+
+class SQLiteBackend(Backend):
+    '''
+    Durable workflow backend on top of a SQLite database file.
+
+    Several backend instances, in as many threads or OS processes on one host,
+    can share a database. The database runs in WAL mode, and every operation is
+    a single IMMEDIATE transaction, so tasks are claimed atomically and the
+    events appended by one decision are committed together.
+
+    SQLite has no way of notifying other connections, so polls with a timeout
+    re-check the queue every poll_interval seconds.
+
+    With history_page_size set, decision tasks come with only the last page of
+    the history loaded, and the rest is read as the decider gets to it.
+
+    Unlike MemoryBackend, decisions that follow a CompleteProcess or CancelProcess
+    in the same list are ignored: the process and its rows are gone by then, and
+    activities or children they schedule would be left without one.
+    '''
+
+    def __init__(self, path, busy_timeout=30, poll_interval=.1, history_page_size=None):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.history_page_size = history_page_size
+
+        self.workflows = {}
+        self.activities = {}
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        with self._lock:
+            self._db.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self._db
+            except:
+                self._db.execute('ROLLBACK')
+                raise
+            else:
+                self._db.execute('COMMIT')
+
+    def _workflow(self, db, name):
+        if not name in self.workflows:
+            row = db.execute('SELECT * FROM workflows WHERE name = ?', (name,)).fetchone()
+            self.workflows[name] = dict(row)
+        return self.workflows[name]
+
+    def _activity(self, db, name):
+        if not name in self.activities:
+            row = db.execute('SELECT * FROM activities WHERE name = ?', (name,)).fetchone()
+            self.activities[name] = dict(row)
+        return self.activities[name]
+
+    def _append_event(self, db, pid, event):
+        db.execute('INSERT INTO events (process_id, seq, event) VALUES (?, (SELECT COALESCE(MAX(seq), -1) + 1 FROM events WHERE process_id = ?), ?)',
+            (pid, pid, dumps(event)))
+
+    def _process_row(self, db, pid):
+        row = db.execute('SELECT * FROM processes WHERE id = ?', (pid,)).fetchone()
+        if not row:
+            raise UnknownProcessException()
+        return row
+
+    def _load_process(self, db, row, history=True):
+        events = None
+        if history:
+            events = [loads(e['event']) for e in db.execute('SELECT event FROM events WHERE process_id = ? ORDER BY seq', (row['id'],))]
+        return Process(workflow=row['workflow'], id=row['id'], input=loads(row['input']), tags=loads(row['tags']), parent=row['parent'], history=events)
+
+    def _history_page(self, db, pid, page_token, page_size, reverse):
+        if reverse:
+            end = page_token if page_token is not None else db.execute('SELECT COUNT(*) FROM events WHERE process_id = ?', (pid,)).fetchone()[0]
+            rows = db.execute('SELECT event FROM events WHERE process_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?', (pid, end, page_size)).fetchall()
+            start = end - len(rows)
+            return ([loads(row['event']) for row in rows], start if start > 0 else None)
+
+        start = page_token or 0
+        rows = db.execute('SELECT event FROM events WHERE process_id = ? AND seq >= ? ORDER BY seq LIMIT ?', (pid, start, page_size + 1)).fetchall()
+        return ([loads(row['event']) for row in rows[:page_size]], start + page_size if len(rows) > page_size else None)
+
+    def _paged_history(self, db, pid):
+        (length,) = db.execute('SELECT COUNT(*) FROM events WHERE process_id = ?', (pid,)).fetchone()
+        (events, token) = self._history_page(db, pid, length, self.history_page_size, reverse=True)
+        return PagedHistory(self, pid, length, self.history_page_size, izip(xrange(length - 1, -1, -1), events))
+
+    def _add_process(self, db, process):
+        cursor = db.execute('INSERT INTO processes (id, workflow, parent, input, tags) VALUES (?, ?, ?, ?, ?)',
+            (process.id, process.workflow, process.parent, dumps(process.input), dumps(process.tags)))
+        db.executemany('INSERT OR IGNORE INTO process_tags (tag, process_seq) VALUES (?, ?)',
+            [(tag, cursor.lastrowid) for tag in process.tags])
+        self._append_event(db, process.id, ProcessStartedEvent())
+
+    def _remove_process(self, db, pid):
+        row = db.execute('SELECT seq FROM processes WHERE id = ?', (pid,)).fetchone()
+        db.execute('DELETE FROM process_tags WHERE process_seq = ?', (row['seq'],))
+        for table in ('events', 'scheduled_decisions', 'running_decisions', 'scheduled_activities', 'running_activities'):
+            db.execute('DELETE FROM %s WHERE process_id = ?' % table, (pid,))
+        db.execute('DELETE FROM processes WHERE id = ?', (pid,))
+
+    def _schedule_activity(self, db, pid, activity, id, input, category=None):
+        config = self._activity(db, activity)
+        execution = ActivityExecution(activity, id, input=input)
+        db.execute('INSERT INTO scheduled_activities (category, process_id, activity_id, execution, expiration) VALUES (?, ?, ?, ?, ?)',
+            (category or config['category'], pid, id, dumps(execution), timestamp() + config['scheduled_timeout']))
+
+    def _cancel_activity(self, db, pid, id):
+        ''' cancels a scheduled or running activity, returns its execution if there was one '''
+        for (table, key) in (('scheduled_activities', 'seq'), ('running_activities', 'run_id')):
+            row = db.execute('SELECT %s, execution FROM %s WHERE process_id = ? AND activity_id = ?' % (key, table), (pid, id)).fetchone()
+            if row:
+                db.execute('DELETE FROM %s WHERE %s = ?' % (table, key), (row[key],))
+                return loads(row['execution'])
+
+    def _schedule_decision(self, db, pid, start=None, timer=None):
+        workflow = self._workflow(db, self._process_row(db, pid)['workflow'])
+        now = timestamp()
+
+        # a decision that is (or will be) available before now already covers this one
+        if not timer and db.execute('SELECT 1 FROM scheduled_decisions WHERE process_id = ? AND (start IS NULL OR start <= ?) LIMIT 1', (pid, now)).fetchone():
+            return
+
+        expiration = None if timer else now + workflow['decision_timeout']
+        db.execute('INSERT INTO scheduled_decisions (category, process_id, available, start, expiration, timer) VALUES (?, ?, ?, ?, ?, ?)',
+            (workflow['category'], pid, start or now, start, expiration, dumps(timer) if timer else None))
+
+    def _cancel_process_internal(self, db, pid):
+        # remove the process, its child processes, and theirs
+        canceled = [pid]
+        while canceled:
+            pid = canceled.pop()
+            canceled.extend(row['id'] for row in db.execute('SELECT id FROM processes WHERE parent = ?', (pid,)))
+            self._remove_process(db, pid)
+
+    def register_workflow(self, name, category=Defaults.DECISION_CATEGORY,
+        timeout=Defaults.WORKFLOW_TIMEOUT,
+        decision_timeout=Defaults.DECISION_TIMEOUT):
+
+        self.workflows[name] = {
+            'name': name,
+            'category': category,
+            'timeout': timeout,
+            'decision_timeout': decision_timeout
+        }
+
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO workflows (name, category, timeout, decision_timeout) VALUES (?, ?, ?, ?)',
+                (name, category, timeout, decision_timeout))
+
+    def register_activity(self, name, category=Defaults.ACTIVITY_CATEGORY,
+        scheduled_timeout=Defaults.ACTIVITY_SCHEDULED_TIMEOUT,
+        execution_timeout=Defaults.ACTIVITY_EXECUTION_TIMEOUT,
+        heartbeat_timeout=Defaults.ACTIVITY_HEARTBEAT_TIMEOUT):
+
+        self.activities[name] = {
+            'name': name,
+            'category': category,
+            'scheduled_timeout': scheduled_timeout,
+            'execution_timeout': execution_timeout,
+            'heartbeat_timeout': heartbeat_timeout
+        }
+
+        with self._transaction() as db:
+            db.execute('INSERT OR REPLACE INTO activities (name, category, scheduled_timeout, execution_timeout, heartbeat_timeout) VALUES (?, ?, ?, ?, ?)',
+                (name, category, scheduled_timeout, execution_timeout, heartbeat_timeout))
+
+    def start_process(self, process):
+        pid = str(uuid4())
+        with self._transaction() as db:
+            # register the process
+            self._add_process(db, process.copy_with_id(pid))
+            # schedule a decision
+            self._schedule_decision(db, pid)
+        return pid
+
+    def signal_process(self, process_id, signal, data=None):
+        with self._transaction() as db:
+            self._process_row(db, process_id)
+
+            # append the signal event
+            self._append_event(db, process_id, SignalEvent(Signal(signal, data)))
+
+            # schedule a decision (if needed)
+            self._schedule_decision(db, process_id)
+
+    def cancel_process(self, process_id, details=None):
+        with self._transaction() as db:
+            self._process_row(db, process_id)
+            self._cancel_process_internal(db, process_id)
+
+    def heartbeat_activity_task(self, task):
+        with self._transaction() as db:
+            self._time_out_activities(db)
+
+            row = db.execute('SELECT execution FROM running_activities WHERE run_id = ?', (task.context['run_id'],)).fetchone()
+            if row:
+                # replace with new heartbeat timeout
+                config = self._activity(db, loads(row['execution']).activity)
+                db.execute('UPDATE running_activities SET heartbeat_expiration = ? WHERE run_id = ?',
+                    (timestamp() + config['heartbeat_timeout'], task.context['run_id']))
+
+        # raised after committing, so that the time-outs stick
+        if not row:
+            raise UnknownActivityException()
+
+    def complete_decision_task(self, task, decisions):
+        if not type(decisions) is list:
+            decisions = [decisions]
+
+        with self._transaction() as db:
+            self._time_out_decisions(db)
+
+            # find the process as we know it
+            row = db.execute('SELECT process_id FROM running_decisions WHERE run_id = ?', (task.context['run_id'],)).fetchone()
+            if row:
+                self._complete_decision_task(db, task, row['process_id'], decisions)
+
+        # raised after committing, so that the time-outs stick
+        if not row:
+            raise UnknownDecisionException()
+
+    def _complete_decision_task(self, db, task, pid, decisions):
+        db.execute('DELETE FROM running_decisions WHERE run_id = ?', (task.context['run_id'],))
+
+        # append the decision events
+        for decision in decisions:
+            self._append_event(db, pid, DecisionEvent(decision))
+
+            # schedule activity if needed
+            if hasattr(decision, 'activity'):
+                self._schedule_activity(db, pid, decision.activity, decision.id, decision.input, category=decision.category)
+
+            # cancel activity
+            if isinstance(decision, CancelActivity):
+                execution = self._cancel_activity(db, pid, decision.id)
+                if execution:
+                    self._append_event(db, pid, ActivityEvent(execution, ActivityCanceled()))
+
+            # complete process
+            if isinstance(decision, CompleteProcess) or isinstance(decision, CancelProcess):
+                process = self._load_process(db, self._process_row(db, pid), history=False)
+                self._cancel_process_internal(db, pid)
+
+                parent = db.execute('SELECT id FROM processes WHERE id = ?', (process.parent,)).fetchone() if process.parent else None
+                if parent:
+                    if decision.type == 'complete_process':
+                        result = ProcessCompleted(result=decision.result)
+                    else:
+                        result = ProcessCanceled(details=decision.details)
+                    self._append_event(db, process.parent, ChildProcessEvent(process_id=pid, result=result, workflow=process.workflow, tags=process.tags))
+                    self._schedule_decision(db, process.parent)
+                break # the decisions after it have no process to act on
+
+            # start child process
+            if isinstance(decision, StartChildProcess):
+                child = Process(workflow=decision.process.workflow, id=decision.process.id or str(uuid4()), input=decision.process.input, tags=decision.process.tags, parent=pid)
+                self._add_process(db, child)
+                self._schedule_decision(db, child.id)
+
+            # schedule timer
+            if isinstance(decision, Timer):
+                self._schedule_decision(db, pid, start=timestamp() + decision.delay, timer=decision)
+
+    def complete_activity_task(self, task, result=None):
+        with self._transaction() as db:
+            self._time_out_activities(db)
+
+            # find the activity as we know it
+            row = db.execute('SELECT process_id, execution FROM running_activities WHERE run_id = ?', (task.context['run_id'],)).fetchone()
+            if row:
+                db.execute('DELETE FROM running_activities WHERE run_id = ?', (task.context['run_id'],))
+
+                # append the activity event
+                self._append_event(db, row['process_id'], ActivityEvent(loads(row['execution']), result))
+
+                # schedule a decision (if needed)
+                self._schedule_decision(db, row['process_id'])
+
+        # raised after committing, so that the time-outs stick
+        if not row:
+            raise UnknownActivityException()
+
+    def process_by_id(self, pid):
+        with self._lock:
+            return self._load_process(self._db, self._process_row(self._db, pid))
+
+    def history_page(self, process_id, page_token=None, page_size=100, reverse=False):
+        with self._lock:
+            self._process_row(self._db, process_id)
+            return self._history_page(self._db, process_id, page_token, page_size, reverse)
+
+    def _select_processes(self, workflow=None, tag=None, columns='p.*', offset=0, limit=None):
+        query = 'SELECT %s FROM processes p' % columns
+        args = []
+        if tag:
+            query += ' JOIN process_tags t ON t.process_seq = p.seq AND t.tag = ?'
+            args.append(tag)
+        if workflow:
+            query += ' WHERE p.workflow = ?'
+            args.append(workflow)
+        if offset or limit is not None:
+            query += ' ORDER BY p.seq LIMIT ? OFFSET ?'
+            args.extend([limit if limit is not None else -1, offset])
+        elif columns == 'p.*':
+            query += ' ORDER BY p.seq'
+        return self._db.execute(query, args)
+
+    def processes(self, workflow=None, tag=None):
+        with self._lock:
+            return [self._load_process(self._db, row) for row in self._select_processes(workflow, tag).fetchall()]
+
+    def query_processes(self, workflow=None, tag=None, offset=0, limit=None, summary=False):
+        with self._lock:
+            rows = self._select_processes(workflow, tag, offset=offset, limit=limit).fetchall()
+            if summary:
+                return [ProcessSummary(row['id'], row['workflow'], loads(row['tags'])) for row in rows]
+            return [self._load_process(self._db, row) for row in rows]
+
+    def count_processes(self, workflow=None, tag=None):
+        with self._lock:
+            return self._select_processes(workflow, tag, columns='COUNT(*)').fetchone()[0]
+
+    def _time_out_activities(self, db):
+        now = timestamp()
+
+        # activities that are past expired scheduling date. they're in scheduled_activities
+        for row in db.execute('SELECT seq, process_id, execution FROM scheduled_activities WHERE expiration < ?', (now,)).fetchall():
+            db.execute('DELETE FROM scheduled_activities WHERE seq = ?', (row['seq'],))
+            self._append_event(db, row['process_id'], ActivityEvent(loads(row['execution']), ActivityTimedOut()))
+            self._schedule_decision(db, row['process_id'])
+
+        # activities that are past expired execution date. they're in running_activities
+        for row in db.execute('SELECT run_id, process_id, execution FROM running_activities WHERE expiration < ? OR heartbeat_expiration < ?', (now, now)).fetchall():
+            db.execute('DELETE FROM running_activities WHERE run_id = ?', (row['run_id'],))
+            self._append_event(db, row['process_id'], ActivityEvent(loads(row['execution']), ActivityTimedOut()))
+            self._schedule_decision(db, row['process_id'])
+
+    def _time_out_decisions(self, db):
+        now = timestamp()
+
+        # decisions that are past expired execution date. they're in running_decisions
+        for row in db.execute('SELECT run_id, process_id FROM running_decisions WHERE expiration < ?', (now,)).fetchall():
+            db.execute('DELETE FROM running_decisions WHERE run_id = ?', (row['run_id'],))
+            self._reschedule_decision(db, row['process_id'])
+
+        # sometimes scheduled decisions have been there for too long as well
+        for row in db.execute('SELECT seq, process_id FROM scheduled_decisions WHERE expiration < ?', (now,)).fetchall():
+            db.execute('DELETE FROM scheduled_decisions WHERE seq = ?', (row['seq'],))
+            self._reschedule_decision(db, row['process_id'])
+
+    def _reschedule_decision(self, db, pid):
+        # databases written before processes took their decisions along when removed may still refer to them
+        if db.execute('SELECT 1 FROM processes WHERE id = ?', (pid,)).fetchone():
+            self._schedule_decision(db, pid)
+
+    def _poll_activity_task(self, category):
+        with self._transaction() as db:
+            self._time_out_activities(db)
+
+            # find the oldest queued activity task
+            row = db.execute('SELECT * FROM scheduled_activities WHERE category = ? ORDER BY seq LIMIT 1', (category,)).fetchone()
+            if not row:
+                return None
+
+            db.execute('DELETE FROM scheduled_activities WHERE seq = ?', (row['seq'],))
+            execution = loads(row['execution'])
+            config = self._activity(db, execution.activity)
+
+            run_id = str(uuid4())
+            now = timestamp()
+            db.execute('INSERT INTO running_activities (run_id, process_id, activity_id, execution, expiration, heartbeat_expiration) VALUES (?, ?, ?, ?, ?, ?)',
+                (run_id, row['process_id'], row['activity_id'], row['execution'], now + config['execution_timeout'], now + config['heartbeat_timeout']))
+
+            self._append_event(db, row['process_id'], ActivityStartedEvent(execution))
+
+            return ActivityTask(execution, process_id=row['process_id'], context={'run_id': run_id})
+
+    def _poll_decision_task(self, category):
+        with self._transaction() as db:
+            # time-out expired activities
+            self._time_out_activities(db)
+            self._time_out_decisions(db)
+
+            # find the first queued decision task that is available
+            row = db.execute('SELECT * FROM scheduled_decisions WHERE category = ? AND (start IS NULL OR start <= ?) ORDER BY available, seq LIMIT 1',
+                (category, timestamp())).fetchone()
+            if not row:
+                return None
+
+            db.execute('DELETE FROM scheduled_decisions WHERE seq = ?', (row['seq'],))
+            pid = row['process_id']
+
+            if row['start']:
+                self._append_event(db, pid, TimerEvent(loads(row['timer'])))
+
+            process = self._process_row(db, pid)
+            run_id = str(uuid4())
+            db.execute('INSERT INTO running_decisions (run_id, process_id, expiration) VALUES (?, ?, ?)',
+                (run_id, pid, timestamp() + self._workflow(db, process['workflow'])['timeout']))
+
+            self._append_event(db, pid, DecisionStartedEvent())
+
+            if self.history_page_size:
+                process = self._load_process(db, process, history=False).copy_with_id(pid, history=self._paged_history(db, pid))
+            else:
+                process = self._load_process(db, process)
+            return DecisionTask(process, context={'run_id': run_id})
+
+    def _wait_for_task(self, poll, timeout=None):
+        ''' repeatedly calls poll until it returns a task or the timeout (in seconds) expires '''
+        task = poll()
+        if task or not timeout:
+            return task
+
+        deadline = datetime.now() + timedelta(seconds=timeout)
+        while not task and datetime.now() < deadline:
+            # the deadline may have passed since it was checked
+            sleep(max(0, min(self.poll_interval, (deadline - datetime.now()).total_seconds())))
+            task = poll()
+
+        return task
+
+    def poll_activity_task(self, category=Defaults.ACTIVITY_CATEGORY, identity=None, timeout=None):
+        return self._wait_for_task(lambda: self._poll_activity_task(category), timeout)
+
+    def poll_decision_task(self, category=Defaults.DECISION_CATEGORY, identity=None, timeout=None):
+        return self._wait_for_task(lambda: self._poll_decision_task(category), timeout)
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from ..test import WorkflowBackendTestCase
+from ..process import Process
+from ..decision import CompleteProcess, ScheduleActivity, StartChildProcess
+from backend import SQLiteBackend
+
+class SQLiteBackendTestCase(WorkflowBackendTestCase):
+    history_page_size = None
+
+    def setUp(self):
+        super(SQLiteBackendTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.backends = []
+
+    def tearDown(self):
+        super(SQLiteBackendTestCase, self).tearDown()
+        for backend in self.backends:
+            backend.close()
+        shutil.rmtree(self.directory)
+
+    def construct_backend(self):
+        # backends constructed by one test share the database
+        backend = SQLiteBackend(os.path.join(self.directory, 'workflow.db'), history_page_size=self.history_page_size)
+        self.backends.append(backend)
+        return backend
+
+    def test_basic(self):
+        self.subtest_basic()
+        
+    def test_managed(self):
+        self.subtest_managed()
+
+    def test_activity_ids(self):
+        self.subtest_activity_ids()
+
+    def test_cancel_while_deciding(self):
+        self.subtest_cancel_while_deciding()
+
+    def test_batch(self):
+        self.subtest_batch()
+    
+    def test_timeouts(self):
+        self.subtest_timeouts()
+    
+    def test_order(self):
+        self.subtest_order()
+    
+    def test_threads(self):
+        self.subtest_threads()
+    
+    def test_timer(self):
+        self.subtest_timer()
+
+    def test_query(self):
+        self.subtest_query()
+
+    def test_history_page(self):
+        self.subtest_history_page()
+
+    def test_paged_tasks(self):
+        # decision tasks come with their last page, and fetch the rest as needed
+        self.history_page_size = 2
+        self.subtest_order()
+        self.subtest_history_page()
+
+    def test_durability(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+        pid = backend.start_process(Process(workflow='test', input=2, tags=['foo']))
+
+        # a new backend on the same file picks up where the first left off
+        backend.close()
+        self.backends.remove(backend)
+        backend = self.construct_backend()
+
+        assert backend.process_by_id(pid) == Process(id=pid, workflow='test', input=2, tags=['foo'])
+        task = backend.poll_decision_task()
+        assert task.process.id == pid
+
+    def test_decisions_after_completion(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+        backend.register_activity('double')
+        pid = backend.start_process(Process(workflow='test'))
+
+        # decisions that follow the completion of their process are ignored
+        task = backend.poll_decision_task()
+        backend.complete_decision_task(task, [CompleteProcess(), ScheduleActivity('double', id='1'), StartChildProcess(Process(workflow='test'))])
+        assert list(backend.processes()) == []
+        assert backend.poll_activity_task() is None and backend.poll_decision_task() is None
+
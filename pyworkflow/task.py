@@ -1,7 +1,11 @@
-class Task(object):
-	pass
+from util import Compact
+
+class Task(Compact):
+	__slots__ = ()
 
 class ActivityTask(Task):
+	__slots__ = ('activity_execution', 'process_id', 'context')
+
 	def __init__(self, activity_execution, process_id=None, context=None):
 		super(ActivityTask, self).__init__()
 
@@ -13,6 +17,8 @@ class ActivityTask(Task):
 		return 'ActivityTask(%s, %s)' % (self.activity_execution, self.process_id)
 
 class DecisionTask(Task):
+	__slots__ = ('process', 'context')
+
 	def __init__(self, process, context=None):
 		super(DecisionTask, self).__init__()
 
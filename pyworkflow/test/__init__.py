@@ -1,23 +1,33 @@
 import logging
 import unittest
+from array import array
+from decimal import Decimal
 import mock
 
 from freezegun import freeze_time
 from copy import deepcopy
+from cStringIO import StringIO
 from time import sleep
 
-from datetime import datetime, timedelta
-from ..exceptions import UnknownActivityException
-from ..process import Process, ProcessCompleted
+from calendar import timegm
+from datetime import datetime, timedelta, tzinfo
+from ..exceptions import UnknownActivityException, UnknownDecisionException
+from ..process import Process, ProcessSummary, ProcessCompleted
+from ..history import ColumnarHistory, PagedHistory
+from ..backend import Backend
+from .. import codec
+from ..exceptions import CodecException
 from ..activity import ActivityExecution, ActivityCompleted, ActivityFailed, ActivityCanceled
-from ..decision import ScheduleActivity, CompleteProcess, CancelProcess, CancelActivity, StartChildProcess, Timer
-from ..events import ProcessStartedEvent, DecisionStartedEvent, DecisionEvent, ActivityEvent, ActivityStartedEvent, SignalEvent, ChildProcessEvent, TimerEvent
+from ..decision import Decision, ScheduleActivity, CompleteProcess, CancelProcess, CancelActivity, StartChildProcess, Timer
+from ..events import Event, ProcessStartedEvent, DecisionStartedEvent, DecisionEvent, ActivityEvent, ActivityStartedEvent, SignalEvent, ChildProcessEvent, TimerEvent
 from ..signal import Signal
 from ..task import ActivityTask
 
 from ..managed import Activity, ActivityMonitor, Workflow, RuleSetWorkflow, Manager
 from ..managed.worker import ActivityWorker, DecisionWorker, WorkerThread
 from ..managed.workflow import rules
+from ..managed.workflow.utils import unique
+from ..util import fingerprint
 
 logging.getLogger('workflow').setLevel('DEBUG')
 
@@ -235,6 +245,290 @@ class WorkflowBasicTestCase(unittest.TestCase):
         unfinished = process.unfinished_activities()
         assert unfinished == [ActivityExecution('act1', '1', 2)]
 
+    def test_unseen_events(self):
+        process = Process(id='p1', workflow='test')
+        for i in range(100):
+            process.history.append(DecisionStartedEvent())
+            process.history.append(SignalEvent(signal=Signal('signal', i)))
+        process.history.append(DecisionStartedEvent())
+        assert process.unseen_events() == [SignalEvent(signal=Signal('signal', 99))]
+
+        # the position of the previous decision survives copies, and other changes to the history
+        assert deepcopy(process).unseen_events() == [SignalEvent(signal=Signal('signal', 99))]
+        del process.history[-2:]
+        assert process.unseen_events() == [SignalEvent(signal=Signal('signal', 98))]
+
+    def test_unfinished_activities(self):
+        process = Process(id='p1', workflow='test')
+        for i in range(5000):
+            process.history.append(DecisionEvent(ScheduleActivity('Shipment', id=str(i), input=i)))
+        for i in range(4998):
+            process.history.append(ActivityEvent(ActivityExecution('Shipment', str(i), i), ActivityCompleted()))
+        assert process.unfinished_activities() == [ActivityExecution('Shipment', '4999', 4999), ActivityExecution('Shipment', '4998', 4998)]
+
+        # events are looked up by fingerprint, regardless of when they happened
+        assert process.has_decision(ScheduleActivity('Shipment', id='10', input=10))
+        assert not process.has_decision(ScheduleActivity('Shipment', id='10', input=11))
+        event = ActivityEvent(ActivityExecution('Shipment', '1', 1), ActivityCompleted())
+        assert process.has_event(event)
+        assert event in set(process.history) and event != ActivityEvent(ActivityExecution('Shipment', '1', 1), ActivityFailed())
+
+        # an activity that is scheduled again is unfinished again
+        process.history.append(DecisionEvent(ScheduleActivity('Shipment', id='0', input=0)))
+        assert process.unfinished_activities()[0] == ActivityExecution('Shipment', '0', 0)
+
+    def test_untriggered_timers(self):
+        process = Process(id='p1', workflow='test', history=[
+            ProcessStartedEvent(),
+            DecisionStartedEvent(),
+            DecisionEvent(Timer(5)),
+            DecisionEvent(Timer(5)),
+            DecisionEvent(Timer(5, id='reminder')),
+        ])
+        assert process.untriggered_timers() == [Timer(5), Timer(5), Timer(5, id='reminder')]
+
+        # copies of the timers, as a backend would send them, count as the same
+        process.history.append(TimerEvent(deepcopy(Timer(5))))
+        process.history.append(TimerEvent(deepcopy(Timer(5, id='reminder'))))
+        process.history.append(DecisionStartedEvent())
+        assert process.untriggered_timers() == [Timer(5)]
+        assert process.untriggered_timers(disregard_unseen=True) == [Timer(5), Timer(5), Timer(5, id='reminder')]
+
+
+    def test_event_compatibility(self):
+        class Offset(tzinfo):
+            def __init__(self, hours):
+                self.offset = timedelta(hours=hours)
+            def utcoffset(self, dt):
+                return self.offset
+            def dst(self, dt):
+                return timedelta(0)
+
+        # aware datetimes are taken as the local time they stand for
+        moment = datetime(2020, 1, 1, 12, 30, 0, 500, tzinfo=Offset(2))
+        event = SignalEvent(Signal('signal'), datetime=moment)
+        assert event.datetime == datetime.fromtimestamp(timegm(moment.utctimetuple())).replace(microsecond=500)
+        assert SignalEvent(Signal('signal'), datetime=moment.astimezone(Offset(-5))).datetime == event.datetime
+        assert abs(SignalEvent(None, datetime=datetime.now(Offset(0))).datetime - datetime.now()) < timedelta(seconds=5)
+
+        # subclasses may still pass their type to the constructor
+        class LegacyEvent(Event):
+            def __init__(self, **kwargs):
+                super(LegacyEvent, self).__init__('legacy', **kwargs)
+
+        class LegacyDecision(Decision):
+            def __init__(self):
+                super(LegacyDecision, self).__init__('legacy')
+
+        class SlottedEvent(Event):
+            __slots__ = ('data',)
+            def __init__(self, data, **kwargs):
+                super(SlottedEvent, self).__init__('slotted', **kwargs)
+                self.data = data
+
+        class SlottedDecision(Decision):
+            __slots__ = ('data',)
+            def __init__(self, data):
+                super(SlottedDecision, self).__init__('slotted')
+                self.data = data
+
+        assert LegacyEvent().type == 'legacy' and LegacyEvent() == LegacyEvent()
+        assert LegacyDecision().type == 'legacy' and LegacyDecision() == LegacyDecision()
+        assert SlottedEvent(1).type == 'slotted' and SlottedEvent(1) == SlottedEvent(1) and SlottedEvent(1) != SlottedEvent(2)
+        assert SlottedDecision(1).type == 'slotted' and SlottedDecision(1) == SlottedDecision(1)
+        assert Event('x').type == 'x' and Event().type is None and Event('x') != Event('y')
+        assert Decision('x').type == 'x' and Decision().type is None and Decision('x') != Decision('y')
+        assert DecisionStartedEvent().type == 'decision_started' and DecisionStartedEvent.type == 'decision_started'
+
+    def test_unhashable_payloads(self):
+        # payloads that can't be hashed are compared by equality
+        decision = ScheduleActivity('act1', id='1', input=bytearray('abc'))
+        assert decision == ScheduleActivity('act1', id='1', input=bytearray('abc'))
+        assert hash(fingerprint(decision)) == hash(ScheduleActivity('act1', id='1', input=bytearray('abc')))
+        assert decision != ScheduleActivity('act1', id='1', input=bytearray('abd'))
+        assert decision != ScheduleActivity('act1', id='1', input='abc')
+        assert ScheduleActivity('act1', id='1', input={'pages': array('i', [1, 2])}) == ScheduleActivity('act1', id='1', input={'pages': array('i', [1, 2])})
+
+        process = Process(id='p1', workflow='test', history=[
+            ProcessStartedEvent(),
+            DecisionStartedEvent(),
+            DecisionEvent(decision),
+            DecisionEvent(Timer(5, data={'payload': bytearray('abc')})),
+            ActivityEvent(ActivityExecution('act1', '1', bytearray('abc')), ActivityCompleted(bytearray('def'))),
+        ])
+        assert process.has_decision(ScheduleActivity('act1', id='1', input=bytearray('abc')))
+        assert not process.has_decision(ScheduleActivity('act1', id='1', input=bytearray('abd')))
+        assert process.has_event(ActivityEvent(ActivityExecution('act1', '1', bytearray('abc')), ActivityCompleted(bytearray('def'))))
+
+        assert process.untriggered_timers() == [Timer(5, data={'payload': bytearray('abc')})]
+        process.history.append(TimerEvent(Timer(5, data={'payload': bytearray('abc')})))
+        assert process.untriggered_timers() == []
+
+    def test_value_comparison(self):
+        # events and decisions are their own fingerprints, compared in place
+        event = ActivityEvent(ActivityExecution('act1', '1', 2), ActivityCompleted(4))
+        assert fingerprint(event) is event
+        assert event == ActivityEvent(ActivityExecution('act1', '1', 2), ActivityCompleted(4))
+        assert hash(event) == hash(ActivityEvent(ActivityExecution('act1', '1', 2), ActivityCompleted(4)))
+        assert event != ActivityEvent(ActivityExecution('act1', '1', 2), ActivityCompleted(5))
+        assert event != ActivityStartedEvent(ActivityExecution('act1', '1', 2))
+
+        # objects of other libraries are compared by their own equality, even with slots
+        assert fingerprint(Decimal('1.0')) == fingerprint(Decimal('1.00'))
+        assert ScheduleActivity('act1', id='1', input=Decimal('1.0')) == ScheduleActivity('act1', id='1', input=Decimal('1.00'))
+        assert unique([Signal('s', {'n': Decimal('1.0')}), Signal('s', {'n': Decimal('1.00')})]) == [Signal('s', {'n': Decimal('1')})]
+
+    def test_columnar_history(self):
+        events = [
+            ProcessStartedEvent(),
+            DecisionStartedEvent(),
+            DecisionEvent(ScheduleActivity('act1', id='1', input=2)),
+            ActivityStartedEvent(ActivityExecution('act1', '1', 2)),
+            SignalEvent(signal=Signal('signal1', {'test': 123})),
+            ActivityEvent(ActivityExecution('act1', '1', 2), ActivityCompleted(4)),
+            DecisionStartedEvent()
+        ]
+        process = Process(id='p1', workflow='test', history=ColumnarHistory(events))
+
+        # events are recreated as they were
+        assert process.history == events and len(process.history) == 7
+        assert process.history[-1].datetime == events[-1].datetime
+        assert process.history[2:4] == events[2:4]
+        assert deepcopy(process.history) == events
+
+        # the columns answer the same questions as a list would
+        assert process.unseen_events() == events[2:6]
+        assert process.unfinished_activities() == []
+        assert process.history.of_type('signal', 'activity') == events[4:6]
+        assert process.history.activity_events('1') == [events[2], events[3], events[5]]
+
+        assert Process(id='p2', workflow='test', history=ColumnarHistory()).history == [ProcessStartedEvent()]
+
+    def test_unique(self):
+        decisions = [ScheduleActivity('act%d' % (i % 5000), id=str(i % 5000), input={'n': i % 5000}) for i in range(10000)]
+        assert unique(decisions) == decisions[:5000]
+        assert unique([Timer(5), CompleteProcess(), Timer(5), Timer(5, id='t'), CompleteProcess()]) == [Timer(5), CompleteProcess(), Timer(5, id='t')]
+        assert unique([bytearray('a'), 1, bytearray('a')]) == [bytearray('a'), 1]
+
+        # decisions carrying unhashable payloads are told apart by them
+        decisions = [ScheduleActivity('act1', id='1', input=bytearray('a')), ScheduleActivity('act1', id='1', input={'data': bytearray('b')})]
+        assert unique(decisions + [ScheduleActivity('act1', id='1', input=bytearray('a')), Timer(5, data={'data': bytearray('b')})]) == decisions + [Timer(5, data={'data': bytearray('b')})]
+
+    def test_paged_history(self):
+        events = [
+            ProcessStartedEvent(),
+            DecisionStartedEvent(),
+            DecisionEvent(ScheduleActivity('act1', id='1', input=2)),
+            ActivityStartedEvent(ActivityExecution('act1', '1', 2)),
+            DecisionStartedEvent()
+        ] + [SignalEvent(signal=Signal('signal%d' % i)) for i in range(6)] + [
+            ActivityEvent(ActivityExecution('act1', '1', 2), ActivityCompleted(4)),
+            DecisionStartedEvent()
+        ]
+        backend = Backend()
+        backend.process_by_id = mock.Mock(return_value=Process(id='p1', workflow='test', history=events))
+        backend.history_page = mock.Mock(wraps=backend.history_page)
+        process = Process(id='p1', workflow='test', history=PagedHistory.tail(events, 'p1', page_size=4, backend=backend))
+
+        # only the pages back to the previous decision are fetched, newest first
+        assert process.unseen_events() == events[5:12]
+        assert [call[1]['page_token'] for call in backend.history_page.call_args_list] == [9, 5]
+        assert process.history[-1] == events[-1] and len(process.history) == 13
+
+        # the rest is fetched when the whole history is needed
+        assert process.unfinished_activities() == []
+        assert process.has_decision(ScheduleActivity('act1', id='1', input=2))
+        assert process.history == events
+
+class CodecTestCase(unittest.TestCase):
+
+    def history(self):
+        return [
+            ProcessStartedEvent(),
+            DecisionStartedEvent(),
+            DecisionEvent(ScheduleActivity('act1', id='1', input={'amount': 2, 'items': [1.5, u'caf\xe9', None, True]})),
+            DecisionEvent(StartChildProcess(Process(workflow='child', id='c1', input=(1, 2**70), tags=['a']))),
+            DecisionEvent(Timer(5, {'at': datetime(2014, 1, 1, 12, 30, 0, 5)}, id='t')),
+            DecisionEvent(CancelActivity('1')),
+            ActivityStartedEvent(ActivityExecution('act1', '1', 2)),
+            ActivityEvent(ActivityExecution('act1', '1', 2), ActivityFailed('because', 'x' * 300)),
+            ActivityEvent(ActivityExecution('act1', '1', 2), ActivityCanceled()),
+            SignalEvent(signal=Signal('signal1', {'test': 123})),
+            TimerEvent(Timer(5)),
+            ChildProcessEvent('c1', ProcessCompleted(set([1, 2])), workflow='child', tags=['a']),
+            DecisionEvent(CompleteProcess(ProcessCompleted(frozenset(['done'])))),
+            DecisionStartedEvent()
+        ]
+
+    def test_round_trip(self):
+        events = self.history()
+        for compress in (False, True):
+            decoded = codec.decode(codec.encode(events, compress=compress))
+            assert decoded == events
+            assert [e.datetime for e in decoded] == [e.datetime for e in events]
+
+        process = Process(workflow='test', id='p1', input=[1, 2], tags=['x'], parent='p0', history=events)
+        decoded = codec.decode(codec.encode(process))
+        assert decoded == process and decoded.unseen_events() == events[2:13]
+
+        # classes without a schema are pickled
+        assert codec.decode(codec.encode(ProcessSummary('p1', 'test'))) == ProcessSummary('p1', 'test')
+        assert codec.decode(codec.encode([UnknownActivityException]))[0] is UnknownActivityException
+
+    def test_schemas(self):
+        def subclasses(cls):
+            return [c for sub in cls.__subclasses__() for c in [sub] + subclasses(sub)]
+
+        from ..events import Event
+        from ..decision import Decision
+        from ..activity import ActivityResult, InterruptedActivityResult
+        from ..process import ProcessResult, InterruptedProcessResult
+
+        classes = sum([subclasses(cls) for cls in (Event, Decision, ActivityResult, ProcessResult)], [])
+        abstract = (InterruptedActivityResult, InterruptedProcessResult)
+        assert all(cls in codec._schemas_by_class for cls in classes if cls.__module__.startswith('pyworkflow') and not cls in abstract)
+
+        # records of an older or newer version of a schema still decode
+        (schema, fields) = (codec._schemas_by_class[Timer], codec._schemas_by_class[Timer].fields)
+        data = codec.encode(Timer(5, id='t'))
+        try:
+            schema.fields = fields[:2]
+            assert codec.decode(data).delay == 5
+            data = codec.encode(Timer(5, id='t'))
+            schema.fields = fields
+            assert codec.decode(data) == Timer(5)
+        finally:
+            schema.fields = fields
+
+    def test_errors(self):
+        data = codec.encode(self.history())
+        for bad in (data[:-1], data + 'x', 'XYZ' + data[3:], data[:3] + chr(codec.VERSION + 1) + data[4:], data[:2]):
+            try:
+                codec.decode(bad)
+                assert False, "should have failed"
+            except CodecException, e:
+                pass
+
+    def test_stream(self):
+        events = self.history()
+        for compress in (False, True):
+            f = StringIO()
+            codec.dump_history(iter(events), f, compress=compress)
+            f.seek(0)
+            assert list(codec.load_history(f, chunk_size=16)) == events
+
+        f = StringIO()
+        codec.dump_history(events, f)
+        try:
+            list(codec.load_history(StringIO(f.getvalue()[:-1])))
+            assert False, "should have failed"
+        except CodecException, e:
+            pass
+
+    def test_benchmark(self):
+        results = codec.benchmark(sum([self.history() for i in range(10)], []), number=3)
+        assert results['codec'][0] < results['pickle'][0]
+        assert results['codec+zlib'][0] < results['codec'][0]
 
 class WorkflowBackendTestCase(unittest.TestCase):
 
@@ -574,6 +868,139 @@ class WorkflowBackendTestCase(unittest.TestCase):
         assert task.activity_execution.input == 2
         
 
+    def subtest_query(self):
+        backend = self.construct_backend()
+        manager = Manager(backend, workflows=[FooWorkflow, TimerTestWorkflow])
+
+        for i in range(0, 10):
+            manager.start_process(Process(workflow=FooWorkflow if i % 2 else TimerTestWorkflow, input=i, tags=['even' if i % 2 == 0 else 'odd', 'all']))
+
+        assert manager.count_processes() == 10
+        assert manager.count_processes(workflow=FooWorkflow) == 5
+        assert manager.count_processes(tag='even') == 5
+        assert manager.count_processes(workflow=FooWorkflow, tag='even') == 0
+        assert manager.count_processes(tag='none') == 0
+
+        # pages together cover all processes, exactly once
+        pages = [manager.processes(tag='all', offset=offset, limit=4) for offset in (0, 4, 8)]
+        assert map(len, pages) == [4, 4, 2]
+        inputs = sorted(p.input for page in pages for p in page)
+        assert inputs == range(0, 10)
+
+        # summaries carry no history
+        summaries = manager.processes(workflow=TimerTestWorkflow, summary=True)
+        assert len(summaries) == 5
+        assert all(isinstance(s, ProcessSummary) and not hasattr(s, 'history') for s in summaries)
+        assert summaries[0].workflow == 'TimerTest'
+        assert 'even' in summaries[0].tags
+
+    def subtest_history_page(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+        pid = backend.start_process(Process(workflow='test'))
+        for i in range(4):
+            backend.signal_process(pid, 'signal%d' % i)
+        history = list(backend.process_by_id(pid).history)
+
+        # pages together cover the history, in order
+        (events, token) = ([], None)
+        while True:
+            (page, token) = backend.history_page(pid, page_token=token, page_size=2)
+            assert len(page) <= 2
+            events += page
+            if token is None:
+                break
+        assert events == history
+
+        (page, token) = backend.history_page(pid, page_size=2, reverse=True)
+        assert page == history[:-3:-1] and token == len(history) - 2
+        assert backend.history_page(pid, page_token=token, page_size=10, reverse=True) == (history[-3::-1], None)
+
+        task = backend.poll_decision_task()
+        assert task.process.unseen_events() == history
+        assert task.process.history == history + [DecisionStartedEvent()]
+
+    def subtest_cancel_while_deciding(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test', timeout=.2)
+
+        # processes go away while their decision is running, by cancelation or along with their parent
+        pid = backend.start_process(Process(workflow='test'))
+        task = backend.poll_decision_task()
+        backend.complete_decision_task(task, StartChildProcess(Process(workflow='test')))
+        backend.signal_process(pid, 'complete')
+        tasks = dict((t.process.id == pid, t) for t in [backend.poll_decision_task(), backend.poll_decision_task()])
+        assert tasks[False].process.parent == pid
+
+        backend.complete_decision_task(tasks[True], CompleteProcess())
+        canceled = backend.start_process(Process(workflow='test'))
+        task = backend.poll_decision_task()
+        backend.cancel_process(canceled)
+        assert list(backend.processes()) == []
+
+        # their decisions time out without getting in the way of other processes
+        sleep(.3)
+        assert backend.poll_decision_task() is None
+        pid = backend.start_process(Process(workflow='test'))
+        assert backend.poll_decision_task().process.id == pid
+        self.assertRaises(UnknownDecisionException, backend.complete_decision_task, task, [])
+
+    def subtest_activity_ids(self):
+        backend = self.construct_backend()
+        backend.register_workflow('test')
+        backend.register_activity('double')
+
+        # two processes schedule an activity with the same id
+        pids = [backend.start_process(Process(workflow='test')) for i in range(2)]
+        for i in range(2):
+            task = backend.poll_decision_task()
+            backend.complete_decision_task(task, ScheduleActivity('double', id='1', input=task.process.id))
+
+        # canceling it in one process leaves the other's scheduled
+        backend.signal_process(pids[0], 'cancel')
+        task = backend.poll_decision_task()
+        backend.complete_decision_task(task, CancelActivity('1'))
+        assert isinstance(backend.process_by_id(pids[0]).history[-1].result, ActivityCanceled)
+
+        task = backend.poll_activity_task()
+        assert task.activity_execution.input == pids[1] and backend.poll_activity_task() is None
+
+        # as it does when the other's is running
+        backend.signal_process(pids[0], 'cancel')
+        decision = backend.poll_decision_task()
+        assert decision.process.id == pids[0]
+        backend.complete_decision_task(decision, CancelActivity('1'))
+        backend.complete_activity_task(task, ActivityCompleted(2))
+        assert backend.process_by_id(pids[1]).history[-1].result == ActivityCompleted(2)
+
+    def subtest_batch(self):
+        backend = self.construct_backend()
+        manager = Manager(backend, workflows=[FooWorkflow])
+        for i in range(5):
+            manager.start_process(Process(workflow=FooWorkflow, input=[i, 2]))
+
+        # up to max_tasks are handed out at once
+        tasks = manager.next_decisions(3)
+        assert len(tasks) == 3
+        tasks += manager.next_decisions(3)
+        assert len(tasks) == 5 and len(set(task.process.id for task in tasks)) == 5
+        assert manager.next_decisions(3) == [] and manager.next_decisions(3, timeout=.1) == []
+
+        # tasks that can't be completed don't hold up the others
+        completions = [(task, manager.workflow_for_task(task).decide(task.process)) for task in tasks]
+        errors = manager.complete_tasks(completions + completions[:1])
+        assert errors[:5] == [None] * 5 and isinstance(errors[5], UnknownDecisionException)
+
+        tasks = manager.next_activities(10, category='computation')
+        assert sorted(task.activity_execution.input for task in tasks) == [[i, 2] for i in range(5)]
+        completions = [(task, ActivityCompleted(manager.activity_for_task(task).execute())) for task in tasks]
+        errors = manager.complete_tasks(completions[:1] + completions)
+        assert errors[0] is None and isinstance(errors[1], UnknownActivityException) and errors[2:] == [None] * 4
+
+        # workers poll and complete in batches as well
+        assert DecisionWorker(manager, batch_size=10).step()
+        assert list(manager.processes()) == []
+
     def subtest_managed(self):
         backend = self.construct_backend()
         
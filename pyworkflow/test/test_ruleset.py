@@ -1,6 +1,10 @@
 import unittest
-from ..managed.workflow.ruleset import RuleSetMetaclass
+from ..managed.workflow.ruleset import RuleSetMetaclass, RuleSetWorkflow
 from ..managed.workflow import rules
+from ..activity import ActivityExecution, ActivityCompleted, ActivityFailed
+from ..events import ProcessStartedEvent, ActivityEvent, SignalEvent, TimerEvent
+from ..decision import Timer
+from ..signal import Signal
 
 
 class TestRuleDecorator(unittest.TestCase):
@@ -21,5 +25,66 @@ class TestRuleDecorator(unittest.TestCase):
     assert not test_obj.handle_everything.match(0)
     assert test_obj.handle_everything(None, 3, None) == 4
 
+  def test_rule_dispatch(self):
+    class BaseWorkflow(RuleSetWorkflow):
+      @rules.process_started
+      def started(self, event, process):
+        return 'started'
+
+      @rules.completed_activity(activity='Foo')
+      def foo_completed(self, event, process):
+        return 'foo completed'
+
+      @rules.signal(name='bar')
+      def bar(self, event, process):
+        return 'bar'
+
+    class DerivedWorkflow(BaseWorkflow):
+      @rules.completed_activity(activity=lambda name: name.startswith('F'))
+      def f_completed(self, event, process):
+        return 'f completed'
+
+      @rules.interrupted_activity(activity='Foo')
+      def foo_failed(self, event, process):
+        return 'foo failed'
+
+      @rules.rule(match=lambda event: True)
+      def any(self, event, process):
+        return 'any'
+
+      bar = None
+
+    # inherited rules apply too, in the order they were defined, unless redefined
+    assert [r._handler.__name__ for r in DerivedWorkflow.ruleset] == ['started', 'foo_completed', 'f_completed', 'foo_failed', 'any']
+
+    # events are only matched against the rules for their type and activity
+    completed = lambda name: ActivityEvent(ActivityExecution(name, '1'), ActivityCompleted())
+    dispatch = DerivedWorkflow.rule_dispatch
+    assert map(len, [dispatch.rules_for(completed('Foo')), dispatch.rules_for(completed('Fab')), dispatch.rules_for(SignalEvent(Signal('bar')))]) == [4, 2, 1]
+
+    workflow = DerivedWorkflow()
+    assert list(workflow.handle_event(ProcessStartedEvent(), None)) == ['started', 'any']
+    assert list(workflow.handle_event(completed('Foo'), None)) == ['foo completed', 'f completed', 'any']
+    assert list(workflow.handle_event(completed('Bar'), None)) == ['any']
+    assert list(workflow.handle_event(ActivityEvent(ActivityExecution('Foo', '1'), ActivityFailed()), None)) == ['foo failed', 'any']
+    assert list(workflow.handle_event(SignalEvent(Signal('bar')), None)) == ['any']
+    assert list(BaseWorkflow().handle_event(SignalEvent(Signal('bar')), None)) == ['bar']
+    assert list(BaseWorkflow().handle_event(TimerEvent(Timer(5)), None)) == []
+
+  def test_filter_errors(self):
+    class FilterWorkflow(RuleSetWorkflow):
+      @rules.signal(name=lambda name: name.startswith('b'))
+      def b(self, event, process):
+        return 'b'
+
+    # a filter that raises fails the decision rather than not matching
+    workflow = FilterWorkflow()
+    assert list(workflow.handle_event(SignalEvent(Signal('bar')), None)) == ['b']
+    try:
+      list(workflow.handle_event(SignalEvent(Signal(None)), None))
+      assert False, "should have failed"
+    except AttributeError:
+      pass
+
 if __name__ == '__main__':
   unittest.main()
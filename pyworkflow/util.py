@@ -1,3 +1,5 @@
+import sys
+
 class classproperty(object):
   '''Implements both @property and @classmethod behavior.'''
 
@@ -6,3 +8,143 @@ class classproperty(object):
 
   def __get__(self, instance, owner):
     return self.getter(instance) if instance else self.getter(owner)
+
+
+class Unhashable(object):
+  '''
+  Stands for an unhashable value, such as a bytearray, in a fingerprint. Compares
+  by the value's equality, and hashes by its type only.
+  '''
+  __slots__ = ('value',)
+
+  def __init__(self, value):
+    self.value = value
+
+  def __eq__(self, other):
+    return isinstance(other, Unhashable) and type(self.value) is type(other.value) and self.value == other.value
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+  def __hash__(self):
+    return hash(type(self.value))
+
+  def __repr__(self):
+    return 'Unhashable(%r)' % (self.value,)
+
+
+def fingerprint(value):
+  '''
+  Hashable structural identity of a value: values that are equal have equal
+  fingerprints. Values (see Value) are their own fingerprint, other objects
+  are identified by their class and what their __fingerprint__ method returns,
+  if they have one, or else by themselves. Unhashable values are compared by
+  equality.
+  '''
+  if isinstance(value, (type, Value)):
+    return value
+  elif isinstance(value, (list, tuple)):
+    return (type(value),) + tuple(fingerprint(v) for v in value)
+  elif isinstance(value, dict):
+    return (dict, frozenset((k, fingerprint(v)) for (k, v) in value.iteritems()))
+  elif isinstance(value, (set, frozenset)):
+    return (frozenset, frozenset(fingerprint(v) for v in value))
+  elif hasattr(value, '__fingerprint__'):
+    return (type(value), fingerprint(value.__fingerprint__()))
+
+  try:
+    hash(value)
+  except TypeError:
+    return Unhashable(value)
+  return value
+
+
+_slot_names = {}
+
+def slot_names(cls):
+  ''' names of the __slots__ of a class and its bases '''
+  if not cls in _slot_names:
+    names = []
+    for c in reversed(cls.__mro__):
+      slots = c.__dict__.get('__slots__', ())
+      names.extend([slots] if isinstance(slots, basestring) else slots)
+    _slot_names[cls] = tuple(n for n in names if not n in ('__dict__', '__weakref__'))
+  return _slot_names[cls]
+
+
+def attributes(value):
+  ''' the attributes of an object, whether it keeps them in __slots__ or in a __dict__ '''
+  attrs = dict((name, getattr(value, name)) for name in slot_names(type(value)) if hasattr(value, name))
+  attrs.update(getattr(value, '__dict__', {}))
+  return attrs
+
+
+class TypeAttribute(object):
+  '''
+  The type of an event or decision. Subclasses set it as a class constant; one
+  given to the constructor of a class that doesn't is kept in the _type slot.
+  '''
+
+  def __get__(self, obj, cls):
+    return getattr(obj, '_type', None)
+
+  def __set__(self, obj, value):
+    obj._type = value
+
+
+class Compact(object):
+  '''
+  Base for value classes that keep their attributes in __slots__, rather than in a
+  __dict__ per instance. Makes them picklable.
+  '''
+  __slots__ = ()
+
+  def __getstate__(self):
+    return attributes(self)
+
+  def __setstate__(self, state):
+    for (name, value) in state.iteritems():
+      try:
+        setattr(self, name, value)
+      except AttributeError:
+        pass # pickled when it wasn't a class constant yet
+
+
+_compared_names = {}
+_unset = object()
+
+class Value(Compact):
+  '''
+  A Compact object that equals another of its class whose attributes have equal
+  fingerprints, but for the slots named in _uncompared. It is its own fingerprint:
+  attributes are compared and hashed in place, so that comparing values that
+  hold values and scalars allocates nothing.
+  '''
+  __slots__ = ()
+  _uncompared = ()
+
+  @classmethod
+  def _compared(cls):
+    if not cls in _compared_names:
+      _compared_names[cls] = tuple(n for n in slot_names(cls) if not n in cls._uncompared)
+    return _compared_names[cls]
+
+  def __fingerprint__(self):
+    return dict((name, getattr(self, name)) for name in self._compared() if hasattr(self, name))
+
+  def __eq__(self, other):
+    if type(self) is not type(other):
+      return False
+    for name in self._compared():
+      if not fingerprint(getattr(self, name, _unset)) == fingerprint(getattr(other, name, _unset)):
+        return False
+    return True
+
+  def __ne__(self, other):
+    return not self.__eq__(other)
+
+  def __hash__(self):
+    h = hash(type(self))
+    for name in self._compared():
+      h = ((h * 1000003) ^ hash(fingerprint(getattr(self, name, None)))) & sys.maxint
+    return h
@@ -35,6 +35,9 @@ setup(
     'unified api',
   ],
   packages=packages,
+  extras_require={
+    'aio': ['trollius', 'futures'],
+  },
   test_suite='pyworkflow.test',
   license='MIT License',
   classifiers=[